@@ -0,0 +1,38 @@
+# Configuración de gunicorn; se carga sola desde el directorio de trabajo
+# (`gunicorn kaiken.wsgi`). Cada valor puede sobrescribirse por entorno.
+import os
+
+# Workers con hilos (`gthread`): el proceso sigue avisando al arbiter
+# mientras un hilo envía una respuesta larga (p.ej. /api/tenders/export.csv
+# con millones de filas), así que `timeout` no lo mata a mitad del stream.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# Límite por sentencia de PostgreSQL (kaiken/settings.py) igual al del
+# worker: una consulta desbocada no retiene una conexión del pool más de lo
+# que se espera de una petición. Sólo en los workers (migrate, el
+# importador y los comandos de mantenimiento no lo heredan); las vistas que
+# lo necesitan lo cambian con `dbtuning.statement_timeout`.
+os.environ.setdefault('DB_STATEMENT_TIMEOUT_MS', str(timeout * 1000))
+
+# Número de workers visible para la aplicación: sin `CACHE_URL` la caché de
+# respuestas (memoria local, por proceso) se desactiva con más de uno.
+os.environ.setdefault('WEB_CONCURRENCY', str(workers))
+
+# Perfil ASGI (vistas de lectura `async def`, ver kaiken/asgi.py), requiere
+# `pip install uvicorn`:
+#   GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn kaiken.asgi
+# o sin gunicorn: uvicorn kaiken.asgi:application --workers 2
+# `threads` no aplica a los workers de uvicorn.
+
+
+def child_exit(server, worker):
+    # Con METRICS_DIR, los contadores del worker que termina pasan a
+    # dead.json y su fichero se borra (licitaciones/metrics.py).
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kaiken.settings')
+    from licitaciones import metrics
+
+    if metrics.METRICS_DIR:
+        metrics.retire(worker.pid)
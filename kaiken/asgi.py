@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kaiken.settings')
+# Las vistas de lectura `async def` (licitaciones/async_views.py) se activan
+# con KAIKEN_ASYNC_VIEWS=1; por defecto también bajo ASGI se sirven las
+# síncronas, que con clientes rápidos dan más req/s.
 
 application = get_asgi_application()
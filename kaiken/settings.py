@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'licitaciones.metrics.metrics_middleware',
+    'licitaciones.instrumentation.PerfMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -82,6 +84,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'kaiken.wsgi.application'
+# Vistas de lectura `async def` (ORM asíncrono), sólo bajo ASGI y si se
+# pide: con clientes rápidos son más lentas que las síncronas.
+ASYNC_VIEWS = os.environ.get('KAIKEN_ASYNC_VIEWS', '0') == '1'
 
 
 # Database
@@ -133,22 +138,111 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 # Configure database from DATABASE_URL in production
+# Perfil de conexión a PostgreSQL:
+# - DB_POOL_MAX_SIZE > 0 (y psycopg 3 con psycopg_pool): pool nativo de
+#   Django por proceso, de DB_POOL_MIN_SIZE a DB_POOL_MAX_SIZE conexiones
+#   (al menos GUNICORN_THREADS); una petición espera hasta DB_POOL_TIMEOUT
+#   segundos por una libre. El pool es incompatible con CONN_MAX_AGE.
+# - DB_POOL_MAX_SIZE=0: conexiones persistentes por hilo (DB_CONN_MAX_AGE).
+# En ambos casos se comprueba la conexión antes de reutilizarla
+# (CONN_HEALTH_CHECKS; con pool, Django se lo pasa al pool como `check`).
+# DB_STATEMENT_TIMEOUT_MS limita cada sentencia (0 = sin límite; los workers
+# de gunicorn.conf.py lo fijan al `timeout` del worker) y algunas vistas lo
+# cambian (ver licitaciones/dbtuning.py). Detrás de pgbouncer en modo
+# transacción: DB_DISABLE_SERVER_SIDE_CURSORS=1.
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+DB_DISABLE_SERVER_SIDE_CURSORS = os.environ.get('DB_DISABLE_SERVER_SIDE_CURSORS', '0') == '1'
 try:
     import dj_database_url
     DATABASE_URL = os.environ.get('DATABASE_URL')
     if DATABASE_URL:
-        # Parse DATABASE_URL provided by Render (Postgres). Force SSL and keep
-        # persistent connections with conn_max_age for production.
+        # Parse DATABASE_URL provided by Render (Postgres). Force SSL.
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            ConnectionPool = None
+        use_pool = DB_POOL_MAX_SIZE > 0 and ConnectionPool is not None
         DATABASES = {
             'default': dj_database_url.parse(
                 DATABASE_URL,
-                conn_max_age=600,
+                conn_max_age=0 if use_pool else DB_CONN_MAX_AGE,
+                conn_health_checks=True,
                 ssl_require=True,
             )
         }
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = DB_DISABLE_SERVER_SIDE_CURSORS
+        options = DATABASES['default'].setdefault('OPTIONS', {})
+        if use_pool:
+            options['pool'] = {
+                'min_size': min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': DB_POOL_TIMEOUT,
+            }
+        if DB_STATEMENT_TIMEOUT_MS:
+            options['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'
 except Exception:
     pass
 
+# SQLite: PRAGMAs de cada conexión (WAL, synchronous=NORMAL, mmap y caché;
+# ver licitaciones/dbtuning.py). SQLITE_TUNING=0 vuelve a los de SQLite; el
+# modo WAL se guarda en el archivo, así que hay que deshacerlo explícitamente.
+if os.environ.get('SQLITE_TUNING', '1') == '0':
+    SQLITE_PRAGMAS = {'journal_mode': 'delete'}
+
+# Caché: memoria local (por proceso) por defecto. En producción, con varios
+# procesos/instancias, usar un backend compartido vía CACHE_URL
+# (redis://... requiere `redis`; memcached://host:port requiere `pymemcache`).
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache', 'LOCATION': CACHE_URL[len('memcached://'):]}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'kaiken', 'OPTIONS': {'MAX_ENTRIES': 5000}}}
+# Segundos que se conserva una respuesta cacheada (las escrituras la
+# invalidan antes; ver licitaciones/caching.py).
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300))
+# Las invalidaciones de la caché de respuestas viven en la propia caché: con
+# la memoria local y varios workers (WEB_CONCURRENCY, que gunicorn.conf.py
+# exporta) cada uno tendría la suya y seguiría sirviendo respuestas que otro
+# ya invalidó. En ese caso se desactiva salvo RESPONSE_CACHE=1.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE', '1' if CACHE_URL or WEB_CONCURRENCY <= 1 else '0') == '1'
+# Segundos máximos que un proceso usa su tabla de autocompletado de clientes
+# y productos sin releerla (con caché local no se entera de las escrituras
+# de otros procesos; ver licitaciones/lookups.py).
+LOOKUP_MAX_AGE = int(os.environ.get('LOOKUP_MAX_AGE', 60))
+
+# Ingesta masiva `POST /api/tenders/bulk/`: exige el token como
+# `Authorization: Bearer <token>`; vacío = ingesta desactivada (403).
+TENDER_BULK_TOKEN = os.environ.get('TENDER_BULK_TOKEN', '')
+
+# Instrumentación por petición (licitaciones/instrumentation.py): fracción
+# de peticiones medidas (0 = desactivada) y tamaño del buffer de /debug/perf/.
+PERF_SAMPLE_RATE = float(os.environ.get('PERF_SAMPLE_RATE', 0))
+PERF_BUFFER_SIZE = int(os.environ.get('PERF_BUFFER_SIZE', 500))
+
+# /metrics (licitaciones/metrics.py). Con varios workers, METRICS_DIR es un
+# directorio compartido donde cada proceso vuelca sus contadores; el
+# importador deja ahí su resumen (o en IMPORT_STATS_FILE).
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+IMPORT_STATS_FILE = os.environ.get('IMPORT_STATS_FILE', '')
+# Token del recolector de /metrics; vacío = sólo staff con sesión (403).
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {
+        'licitaciones.perf': {'handlers': ['console'], 'level': os.environ.get('PERF_LOG_LEVEL', 'INFO'), 'propagate': False},
+    },
+}
+
 # WhiteNoise static file serving
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
@@ -161,3 +255,5 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 SAMPLE_TENDER_URL = os.environ.get('SAMPLE_TENDER_URL', 'https://kaiken.up.railway.app/webhook/tender-sample')
 SAMPLE_PRODUCT_URL = os.environ.get('SAMPLE_PRODUCT_URL', 'https://kaiken.up.railway.app/webhook/product-sample')
 SAMPLE_ORDER_URL = os.environ.get('SAMPLE_ORDER_URL', 'https://kaiken.up.railway.app/webhook/order-sample')
+# Caché en disco (ETag/Last-Modified) de los feeds; vacío para desactivarla.
+SAMPLE_CACHE_DIR = os.environ.get('SAMPLE_CACHE_DIR', str(BASE_DIR / '.sample_cache')) or None
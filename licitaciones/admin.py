@@ -1,27 +1,167 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.utils.functional import cached_property
 
+from .forms import BaseOrderFormSet, LookupChoiceField
 from .models import Tender, Product, Order, Client
 
 
-class OrderInline(admin.TabularInline):
+# A partir de este tamaño el changelist sin filtros muestra el total
+# estimado por el planificador en vez de hacer `COUNT(*)`.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+# Órdenes por página en el inline de una licitación.
+ORDER_INLINE_PER_PAGE = getattr(settings, 'ORDER_INLINE_PER_PAGE', 50)
+
+
+def estimated_count(model, using='default'):
+    """Filas de la tabla de `model` según las estadísticas de la BD, o None.
+
+    PostgreSQL: `pg_class.reltuples` (lo mantienen VACUUM/ANALYZE). SQLite:
+    `sqlite_stat1`, sólo si se ha ejecutado `ANALYZE`.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table]
+    elif connection.vendor == 'sqlite':
+        sql, params = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    # reltuples es -1 en tablas nunca analizadas.
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator que no cuenta tablas grandes sin filtrar.
+
+    Con filtros (o por debajo de `ADMIN_ESTIMATED_COUNT_THRESHOLD`) el
+    total es exacto.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LookupFieldsMixin:
+    """Clientes y productos con autocompletado en vez de un `<select>` con la tabla entera."""
+
+    lookup_fields = {'client_obj': 'clients', 'product': 'products'}
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        kind = self.lookup_fields.get(db_field.name)
+        if kind is None:
+            return super().formfield_for_foreignkey(db_field, request, **kwargs)
+        return LookupChoiceField(kind, required=not db_field.blank, label=db_field.verbose_name.capitalize())
+
+
+class OrderInline(LookupFieldsMixin, admin.TabularInline):
+    """Órdenes de la licitación, de `per_page` en `per_page` (`?lineas=N`).
+
+    Una licitación con miles de líneas no se renderiza entera: la página
+    se elige por id y el resto de órdenes no se toca al guardar.
+    """
+
     model = Order
+    formset = BaseOrderFormSet
     extra = 0
     readonly_fields = ('unit_price', 'unit_cost')
+    template = 'admin/licitaciones/order_inline.html'
+    per_page = ORDER_INLINE_PER_PAGE
+    page_param = 'lineas'
+
+    def get_queryset(self, request):
+        # Cada fila muestra `Order.__str__` (licitación y SKU).
+        return super().get_queryset(request).select_related('tender', 'product')
+
+    def paginate(self, request, tender, queryset):
+        """`(queryset de la página, órdenes fuera de ella, datos del paginador)`."""
+        pages = max((tender.order_count + self.per_page - 1) // self.per_page, 1)
+        try:
+            page = min(max(int(request.GET.get(self.page_param, 1)), 1), pages)
+        except ValueError:
+            page = 1
+        ids = list(
+            Order.objects.filter(tender=tender).order_by('pk')
+            .values_list('pk', flat=True)[(page - 1) * self.per_page:page * self.per_page]
+        )
+        params = request.GET.copy()
+        links = []
+        for n in range(1, pages + 1):
+            params[self.page_param] = n
+            links.append((n, f'?{params.urlencode()}'))
+        pager = {'page': page, 'pages': pages, 'total': tender.order_count, 'links': links}
+        return queryset.filter(pk__in=ids), tender.order_count - len(ids), pager
 
 
 @admin.register(Tender)
-class TenderAdmin(admin.ModelAdmin):
-    list_display = ('identifier', 'get_client_name', 'awarded_date', 'total_margin_display')
+class TenderAdmin(LookupFieldsMixin, admin.ModelAdmin):
+    list_display = ('identifier', 'get_client_name', 'awarded_date', 'order_count', 'total_margin_display', 'margin_pct_display')
+    list_select_related = ('client_obj',)
+    list_per_page = 100
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = (OrderInline,)
-
-    def total_margin_display(self, obj):  # pragma: no cover - admin helper
-        return obj.total_margin()
-
-    total_margin_display.short_description = 'Total Margin'
-
+    readonly_fields = ('total_margin', 'total_revenue', 'order_count')
+
+    def get_queryset(self, request):
+        # Margen porcentual calculado en SQL para poder ordenar por él. En
+        # float: SQLite guarda 5.00 como entero y 500 / 15 daría 33.
+        return super().get_queryset(request).annotate(
+            margin_pct=Case(
+                When(total_revenue=0, then=Value(0.0)),
+                default=Cast('total_margin', FloatField()) * 100 / F('total_revenue'),
+                output_field=FloatField(),
+            ),
+        )
+
+    def get_formset_kwargs(self, request, obj, inline, prefix):
+        kwargs = super().get_formset_kwargs(request, obj, inline, prefix)
+        if isinstance(inline, OrderInline) and obj is not None and obj.order_count > inline.per_page:
+            kwargs['queryset'], kwargs['hidden_count'], kwargs['pager'] = inline.paginate(request, obj, kwargs['queryset'])
+        return kwargs
+
+    @admin.display(ordering='total_margin', description='Total Margin')
+    def total_margin_display(self, obj):
+        return obj.total_margin
+
+    @admin.display(ordering='margin_pct', description='Margen %')
+    def margin_pct_display(self, obj):
+        return f'{obj.margin_pct:.2f} %' if obj.margin_pct is not None else ''
+
+    def save_model(self, request, obj, form, change):
+        # Se guarda junto con sus órdenes en `save_related`.
+        pass
+
+    def save_related(self, request, form, formsets, change):
+        orders, deleted = [], []
+        for formset in formsets:
+            orders += formset.save(commit=False)
+            deleted += formset.deleted_objects
+        Tender.objects.save_with_orders(form.instance, orders, deleted)
+        form.save_m2m()
+
+    @admin.display(ordering='client_obj__name', description='Cliente')
     def get_client_name(self, obj):
         return obj.client_obj.name if obj.client_obj else ''
-    get_client_name.short_description = 'Cliente'
 
 
 @admin.register(Product)
@@ -36,9 +176,24 @@ class ClientAdmin(admin.ModelAdmin):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ('tender', 'product', 'quantity', 'unit_price', 'unit_cost')
-
-from django.contrib import admin
-
-# Register your models here.
+class OrderAdmin(LookupFieldsMixin, admin.ModelAdmin):
+    # Las licitaciones se eligen por id: un `<select>` tendría la tabla entera.
+    raw_id_fields = ('tender',)
+    list_display = ('tender', 'product', 'quantity', 'unit_price', 'unit_cost', 'margin_display')
+    # `Tender.__str__` incluye el nombre del cliente.
+    list_select_related = ('tender__client_obj', 'product')
+    list_per_page = 100
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            line_margin=ExpressionWrapper(
+                (F('unit_price') - F('unit_cost')) * F('quantity'),
+                output_field=DecimalField(max_digits=18, decimal_places=2),
+            ),
+        )
+
+    @admin.display(ordering='line_margin', description='Margen')
+    def margin_display(self, obj):
+        return obj.margin()
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class LicitacionesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'licitaciones'
+
+    def ready(self):
+        # En SQLite una migración que reconstruye `licitaciones_tender` borra
+        # los triggers de búsqueda; se reinstalan después de cada migrate.
+        from .search import ensure_search_schema
+        post_migrate.connect(ensure_search_schema, sender=self)
+        # Receptores de invalidación de la caché, los rollups, los totales por
+        # cliente, las opciones y los identificadores resueltos, y los PRAGMAs
+        # de cada conexión SQLite.
+        from . import caching, dbtuning, identifiers, lookups, rollups, summaries  # noqa: F401
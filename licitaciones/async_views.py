@@ -0,0 +1,146 @@
+"""Versiones asíncronas (`async def`) de las vistas de lectura.
+
+Se usan bajo ASGI con `KAIKEN_ASYNC_VIEWS=1` (`settings.ASYNC_VIEWS`): las
+consultas van por el ORM asíncrono (`aget`, `aiterator`, `async for`) y
+las exportaciones se envían con iteradores asíncronos, de modo que un
+cliente lento no ocupa un hilo. Las respuestas son las mismas que las de
+`views`, con la misma caché.
+
+La búsqueda de texto (`q`) consulta el esquema (FTS5) y ordena por
+relevancia con el ORM síncrono, así que ese camino pasa por
+`sync_to_async`.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render
+
+from . import identifiers
+from .caching import cache_response
+from .dbtuning import statement_timeout
+from .exports import aexport_rows, aiter_csv
+from .models import Client, Tender
+from .pagination import InvalidCursor, apaginate_keyset
+from .search import paginate_ranked
+from .views import (
+    CLIENT_TENDERS_PAGE_SIZE, EXPORT_STATEMENT_TIMEOUT_MS, STREAM_CHUNK_SIZE, TENDER_API_PAGE_SIZE, TENDER_BATCH_MAX, TENDER_HTML_PAGE_SIZE,
+    _batch_identifiers, _client_summary, _client_tenders, _detail_lines, _group_lines, _items_limit, _items_window, _next_items_cursor, _page_size, _ranked,
+    _tender_detail_row, _tender_page_response, _tender_scopes, _tender_row, _tender_values, _wants_json, filter_tenders,
+)
+
+
+async def _astream_json_array(rows):
+    yield '['
+    first = True
+    async for r in rows:
+        yield ('' if first else ',') + json.dumps(_tender_row(r))
+        first = False
+    yield ']'
+
+
+async def _filtered(params):
+    if params.get('q', '').strip():
+        return await sync_to_async(filter_tenders)(params)
+    return filter_tenders(params)
+
+
+async def _tender_page(request, tenders, q, cursor, page_size):
+    """Como `views._tender_page`."""
+    if _ranked(request, q):
+        return await sync_to_async(paginate_ranked)(tenders, q, cursor, page_size)
+    return await apaginate_keyset(tenders, cursor, page_size)
+
+
+@cache_response('tender_list', lambda request: ['tenders'])
+async def tender_list(request):
+    """Como `views.tender_list`."""
+    tenders = await _filtered(request.GET)
+    q = request.GET.get('q', '').strip()
+
+    if _wants_json(request):
+        rows = _tender_values(tenders)
+        if request.GET.get('stream') in ('1', 'true'):
+            rows = rows.order_by('-awarded_date', '-id').aiterator(chunk_size=STREAM_CHUNK_SIZE)
+            return StreamingHttpResponse(_astream_json_array(rows), content_type='application/json')
+
+        page_size = _page_size(request, TENDER_API_PAGE_SIZE)
+        try:
+            page = await _tender_page(request, rows, q, request.GET.get('cursor'), page_size)
+        except InvalidCursor:
+            return HttpResponseBadRequest('Cursor inválido.')
+        return _tender_page_response(request, page)
+
+    page_size = _page_size(request, TENDER_HTML_PAGE_SIZE)
+    try:
+        tenders_page = await _tender_page(request, tenders, q, request.GET.get('cursor'), page_size)
+    except InvalidCursor:
+        tenders_page = await _tender_page(request, tenders, q, None, page_size)
+    return render(request, 'licitaciones/tender_list.html', {'tenders': tenders_page, 'q': q})
+
+
+@cache_response('tender_detail', lambda request, identifier: _tender_scopes([identifier]))
+async def tender_detail(request, identifier):
+    """Como `views.tender_detail`."""
+    tender = await identifiers.aget_tender(identifier, Tender.objects.select_related('client_obj'))
+    if tender is None:
+        raise Http404('No existe la licitación.')
+    try:
+        start, limit = _items_window(request.GET)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Cursor inválido.')
+    orders = [o async for o in _detail_lines([tender.pk], start, limit)]
+
+    if _wants_json(request):
+        return JsonResponse(_tender_detail_row(tender, orders, limit))
+    return render(request, 'licitaciones/tender_detail.html', {
+        'tender': tender,
+        'orders': orders,
+        'items_limit': limit,
+        'next_cursor': _next_items_cursor(tender, orders) if limit else None,
+    })
+
+
+@cache_response('tender_batch', lambda request: _tender_scopes(_batch_identifiers(request.GET)))
+async def tender_batch(request):
+    """Como `views.tender_batch`."""
+    ids = _batch_identifiers(request.GET)
+    if not ids:
+        return HttpResponseBadRequest('Falta ids.')
+    if len(ids) > TENDER_BATCH_MAX:
+        return HttpResponseBadRequest(f'Como mucho {TENDER_BATCH_MAX} licitaciones por petición.')
+    limit = _items_limit(request.GET)
+    tenders = await identifiers.aget_tenders(ids, Tender.objects.select_related('client_obj'))
+    lines = _group_lines([o async for o in _detail_lines([t.pk for t in tenders.values()], limit=limit)])
+    return JsonResponse({
+        'tenders': [_tender_detail_row(tenders[i], lines.get(tenders[i].pk, []), limit) for i in ids if i in tenders],
+        'missing': [i for i in ids if i not in tenders],
+    })
+
+
+@cache_response('client_detail', lambda request, pk: [f'client:{pk}'])
+async def client_detail(request, pk):
+    """Como `views.client_detail`."""
+    try:
+        client = await Client.objects.select_related('summary').aget(pk=pk)
+    except Client.DoesNotExist:
+        raise Http404('No existe el cliente.')
+    tenders = _client_tenders(client)
+    try:
+        page = await apaginate_keyset(tenders, request.GET.get('cursor'), CLIENT_TENDERS_PAGE_SIZE)
+    except InvalidCursor:
+        page = await apaginate_keyset(tenders, None, CLIENT_TENDERS_PAGE_SIZE)
+    return render(request, 'licitaciones/client_detail.html', {
+        'client': client,
+        'summary': _client_summary(client),
+        'tenders': page,
+    })
+
+
+@statement_timeout(EXPORT_STATEMENT_TIMEOUT_MS)
+async def tender_export_csv(request):
+    """Como `views.tender_export_csv`, enviado con un iterador asíncrono."""
+    rows = aexport_rows(await _filtered(request.GET))
+    response = StreamingHttpResponse(aiter_csv(rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="licitaciones.csv"'
+    return response
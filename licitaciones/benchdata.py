@@ -0,0 +1,160 @@
+"""Generador determinista de datos para benchmarks.
+
+Inserta clientes, productos, licitaciones y órdenes directamente con
+`bulk_create`. Con la misma semilla produce siempre los mismos datos, de
+modo que las mediciones son comparables entre ejecuciones. Todos los
+registros llevan el prefijo `BENCH-` para poder identificarlos.
+"""
+import json
+import random
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.db import transaction
+
+from . import summaries
+from .importer import chunked
+from .models import Tender, Product, Order, Client, normalize_identifier
+
+
+PREFIX = 'BENCH-'
+START_DATE = date(2020, 1, 1)
+DATE_SPAN_DAYS = 5 * 365
+
+# Grupos de filtros de `tender_list`; los benchmarks miden cada combinación.
+FILTER_GROUPS = {
+    'fechas': {'start_date': '2022-01-01', 'end_date': '2022-12-31'},
+    'cliente': {'client': f'{PREFIX}Cliente 000001'},
+    'margen': {'min_margin': '1000', 'max_margin': '5000'},
+}
+
+
+def _money(rng, low, high):
+    return Decimal(rng.randint(low * 100, high * 100)) / 100
+
+
+def seed_data(orders, tenders=None, clients=None, products=None, seed=42, batch_size=5000, log=None):
+    """Genera `orders` órdenes repartidas en licitaciones, clientes y productos.
+
+    Por defecto: una licitación cada 10 órdenes, un cliente cada 50
+    licitaciones y hasta 1000 productos. Devuelve un dict con los conteos.
+    """
+    log = log or (lambda msg: None)
+    rng = random.Random(seed)
+    tenders = tenders or max(orders // 10, 1)
+    clients = clients or max(tenders // 50, 1)
+    products = products or min(max(orders // 100, 1), 1000)
+
+    log(f'Productos: {products}')
+    product_objs = []
+    for n in range(products):
+        cost = _money(rng, 1, 500)
+        product_objs.append(Product(sku=f'{PREFIX}P{n:06d}', name=f'Producto {n}', cost=cost, price=cost + _money(rng, 1, 100)))
+    Product.objects.bulk_create(product_objs, batch_size=batch_size, ignore_conflicts=True)
+    product_objs = list(Product.objects.filter(sku__startswith=PREFIX).order_by('sku'))
+
+    log(f'Clientes: {clients}')
+    Client.objects.bulk_create(
+        [Client(name=f'{PREFIX}Cliente {n:06d}') for n in range(clients)],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    client_ids = list(Client.objects.filter(name__startswith=PREFIX).order_by('name').values_list('pk', flat=True))
+
+    log(f'Licitaciones: {tenders}')
+    for chunk in chunked(range(tenders), batch_size):
+        objs = []
+        for n in chunk:
+            identifier = f'{PREFIX}{n:08d}-LE'
+            objs.append(Tender(
+                identifier=identifier,
+                normalized_identifier=normalize_identifier(identifier),
+                client_obj_id=rng.choice(client_ids),
+                awarded_date=START_DATE + timedelta(days=rng.randrange(DATE_SPAN_DAYS)),
+            ))
+        Tender.objects.bulk_create(objs, ignore_conflicts=True)
+    tender_ids = list(Tender.objects.filter(identifier__startswith=PREFIX).order_by('identifier').values_list('pk', flat=True))
+
+    # Las órdenes se generan licitación a licitación para que cada lote
+    # toque pocas licitaciones al refrescar sus totales.
+    log(f'Órdenes: {orders}')
+    per_tender, extra = divmod(orders, len(tender_ids))
+
+    def order_rows():
+        for i, tender_id in enumerate(tender_ids):
+            for _ in range(per_tender + (1 if i < extra else 0)):
+                product = rng.choice(product_objs)
+                yield Order(
+                    tender_id=tender_id,
+                    product=product,
+                    quantity=rng.randint(1, 50),
+                    unit_price=product.price,
+                    unit_cost=product.cost,
+                )
+
+    written = 0
+    for chunk in chunked(order_rows(), batch_size):
+        with transaction.atomic():
+            Order.objects.bulk_create(chunk)
+        written += len(chunk)
+        if written % (batch_size * 20) == 0:
+            log(f'  {written}/{orders} órdenes')
+    # Las licitaciones se insertaron sin `tenders_changed`.
+    summaries.rebuild()
+    return {'products': products, 'clients': clients, 'tenders': len(tender_ids), 'orders': written}
+
+
+def sample_feeds(orders, prefix=f'{PREFIX}IMP-', seed=7):
+    """Feeds de `import_sample_data` (productos, licitaciones, órdenes).
+
+    Mismo formato que los endpoints de muestra; `orders` órdenes
+    repartidas a 10 por licitación y 50 productos.
+    """
+    rng = random.Random(seed)
+    products = [
+        {'sku': f'{prefix}P{n:04d}', 'title': f'Producto {n}', 'cost': str(_money(rng, 1, 100)), 'price': str(_money(rng, 101, 200))}
+        for n in range(50)
+    ]
+    tenders = [
+        {'id': f'{prefix}{n:06d}-LE', 'client': f'{prefix}Cliente {n % 20}', 'creation_date': (START_DATE + timedelta(days=n % DATE_SPAN_DAYS)).isoformat()}
+        for n in range(max(orders // 10, 1))
+    ]
+    order_records = [
+        {'id': n, 'tender_id': tenders[n % len(tenders)]['id'].replace('-', ''), 'product_id': rng.choice(products)['sku'], 'quantity': rng.randint(1, 20), 'price': 0}
+        for n in range(orders)
+    ]
+    return {'/products': products, '/tenders': tenders, '/orders': order_records}
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.bodies.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def serve_feeds(routes):
+    """Servidor HTTP local que sirve `routes` (ruta → JSON); devuelve su URL base."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FeedHandler)
+    server.bodies = {path: json.dumps(data).encode() for path, data in routes.items()}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
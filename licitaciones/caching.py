@@ -0,0 +1,258 @@
+"""Caché de respuestas de las vistas de lectura con invalidación dirigida.
+
+Cada respuesta se guarda bajo una clave que incluye la vista, la ruta, los
+parámetros normalizados y las *generaciones* de los ámbitos de los que
+depende:
+
+- ``tenders``: cualquier licitación (listados).
+- ``tender:<clave>``: una licitación concreta (detalle), por su
+  identificador normalizado, que es el mismo con o sin guiones.
+- ``client:<pk>``: un cliente y sus licitaciones (detalle de cliente).
+
+Una generación es la marca de tiempo del último cambio del ámbito; al
+escribir se renueva y las respuestas antiguas dejan de encontrarse (expiran
+solas por `RESPONSE_CACHE_TIMEOUT`). Así no hace falta enumerar claves, lo
+que no permiten todos los backends. La misma marca sirve de
+`Last-Modified`; el `ETag` es un hash del cuerpo.
+
+Las generaciones viven en la caché `RESPONSE_CACHE_ALIAS`: para que las
+escrituras de un proceso (otro worker, `import_sample_data`) invaliden las
+respuestas de los demás, la caché debe ser compartida (`CACHE_URL`). Con la
+memoria local y varios workers `RESPONSE_CACHE_ENABLED` es falso por
+defecto y las vistas responden sin caché.
+
+Las órdenes no tienen receptor propio: `Order.save()`/`delete()` y sus
+operaciones masivas refrescan los totales de la licitación, que emite
+`tenders_changed`.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .models import Client, Tender, normalize_identifier
+from .signals import tenders_changed
+
+
+RESPONSE_CACHE_ALIAS = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+# Cabeceras de la respuesta original que se conservan en la caché.
+KEPT_HEADERS = ('Content-Type', 'Link')
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[RESPONSE_CACHE_ALIAS]
+
+
+def _enabled(request):
+    # Se lee en cada petición (ajustes de entorno y `override_settings`).
+    return request.method in ('GET', 'HEAD') and getattr(settings, 'RESPONSE_CACHE_ENABLED', True)
+
+
+def _count(view_name, outcome):
+    with _stats_lock:
+        _stats[(view_name, outcome)] += 1
+
+
+def cache_stats():
+    """Aciertos/fallos por vista en este proceso: ``{vista: {'hits', 'misses'}}``."""
+    with _stats_lock:
+        items = list(_stats.items())
+    stats = {}
+    for (view_name, outcome), n in items:
+        stats.setdefault(view_name, {'hits': 0, 'misses': 0})[outcome] = n
+    return stats
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _gen_key(scope):
+    return f'gen:{scope}'
+
+
+def generations(scopes):
+    """Generación actual de cada ámbito (se inicializa si no existe)."""
+    cache = _cache()
+    keys = [_gen_key(s) for s in scopes]
+    found = cache.get_many(keys)
+    return [found.get(k) or cache.get_or_set(k, time.time(), None) for k in keys]
+
+
+async def agenerations(scopes):
+    """Versión asíncrona de `generations` (API `a*` del backend de caché)."""
+    cache = _cache()
+    keys = [_gen_key(s) for s in scopes]
+    found = await cache.aget_many(keys)
+    return [found.get(k) or await cache.aget_or_set(k, time.time(), None) for k in keys]
+
+
+def bump(scopes):
+    """Invalida las respuestas que dependen de `scopes`."""
+    scopes = set(scopes)
+    if scopes:
+        now = time.time()
+        _cache().set_many({_gen_key(s): now for s in scopes}, None)
+
+
+def invalidate(scopes):
+    # Ahora (para esta misma transacción/proceso) y al confirmar, para que
+    # un lector concurrente no deje en caché el estado previo al commit.
+    scopes = set(scopes)
+    bump(scopes)
+    transaction.on_commit(lambda: bump(scopes))
+
+
+def _wants_json(request):
+    return request.path.startswith('/api/') or 'application/json' in request.headers.get('Accept', '')
+
+
+def _response_key(view_name, request, gens):
+    params = sorted((k, v) for k, values in request.GET.lists() for v in values if v.strip())
+    raw = repr((request.path, params, _wants_json(request), gens))
+    return f'resp:{view_name}:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _finish(request, entry, response):
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_vary_headers(response, ('Accept',))
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=int(entry['last_modified']), response=response,
+    )
+
+
+def _hit(view_name, request, entry):
+    _count(view_name, 'hits')
+    response = HttpResponse(entry['content'], status=200)
+    for header, value in entry['headers'].items():
+        response[header] = value
+    response['X-Cache'] = 'HIT'
+    return _finish(request, entry, response)
+
+
+def _entry(response, gens):
+    """Entrada de caché para `response`, o None si no debe cachearse."""
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return None
+    return {
+        'content': response.content,
+        'headers': {h: response[h] for h in KEPT_HEADERS if response.has_header(h)},
+        'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+        'last_modified': max(gens),
+    }
+
+
+def _miss(request, entry, response):
+    response['X-Cache'] = 'MISS'
+    return _finish(request, entry, response)
+
+
+def cache_response(view_name, scopes):
+    """Decorador: cachea las respuestas 200 de GET/HEAD de la vista.
+
+    Sin efecto si `RESPONSE_CACHE_ENABLED` es falso.
+
+    `scopes(request, **kwargs)` devuelve los ámbitos de los que depende la
+    respuesta. Añade `ETag`/`Last-Modified` y responde 304 si el cliente
+    ya tiene la versión actual. Acepta también vistas `async def`.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not _enabled(request):
+                    return await view(request, *args, **kwargs)
+                gens = await agenerations(scopes(request, **kwargs))
+                key = _response_key(view_name, request, gens)
+                entry = await _cache().aget(key)
+                if entry is not None:
+                    return _hit(view_name, request, entry)
+                _count(view_name, 'misses')
+                response = await view(request, *args, **kwargs)
+                entry = _entry(response, gens)
+                if entry is None:
+                    return response
+                await _cache().aset(key, entry, RESPONSE_CACHE_TIMEOUT)
+                return _miss(request, entry, response)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _enabled(request):
+                return view(request, *args, **kwargs)
+            gens = generations(scopes(request, **kwargs))
+            key = _response_key(view_name, request, gens)
+            entry = _cache().get(key)
+            if entry is not None:
+                return _hit(view_name, request, entry)
+            _count(view_name, 'misses')
+            response = view(request, *args, **kwargs)
+            entry = _entry(response, gens)
+            if entry is None:
+                return response
+            _cache().set(key, entry, RESPONSE_CACHE_TIMEOUT)
+            return _miss(request, entry, response)
+        return wrapper
+    return decorator
+
+
+# -- invalidación ----------------------------------------------------------
+
+def _tender_scopes(rows):
+    scopes = {'tenders'}
+    for identifier, client_id in rows:
+        if identifier:
+            scopes.add(f'tender:{normalize_identifier(identifier)}')
+        if client_id:
+            scopes.add(f'client:{client_id}')
+    return scopes
+
+
+@receiver(post_save, sender=Tender)
+@receiver(post_delete, sender=Tender)
+def _tender_written(sender, instance, **kwargs):
+    rows = [(instance.identifier, instance.client_obj_id)]
+    loaded = getattr(instance, '_loaded_values', {})
+    rows.append((loaded.get('identifier'), loaded.get('client_obj_id')))
+    invalidate(_tender_scopes(rows))
+
+
+@receiver(tenders_changed, sender=Tender)
+def _tenders_bulk_written(sender, queryset, previous=(), totals_only=False, **kwargs):
+    rows = [(t.identifier, t.client_obj_id) for t in previous]
+    # Al refrescar totales (`refresh_totals`) no cambian identificador ni
+    # cliente: `previous` ya tiene todas las licitaciones.
+    if not totals_only:
+        rows += list(queryset.values_list('identifier', 'client_obj_id'))
+    invalidate(_tender_scopes(rows))
+
+
+@receiver(post_save, sender=Client)
+@receiver(pre_delete, sender=Client)
+def _client_written(sender, instance, created=False, **kwargs):
+    # El nombre del cliente aparece en los listados y en el detalle de sus
+    # licitaciones (en pre_delete, antes de que SET_NULL las desvincule).
+    scopes = {'tenders', f'client:{instance.pk}'}
+    if not created:
+        scopes.update(
+            f'tender:{key}'
+            for key in Tender.objects.filter(client_obj=instance).values_list('normalized_identifier', flat=True)
+        )
+    invalidate(scopes)
@@ -0,0 +1,131 @@
+"""Ajustes de la conexión a la base de datos.
+
+- SQLite (desarrollo, pruebas, benchmarks): al abrir cada conexión se
+  aplican `SQLITE_PRAGMAS`. WAL deja leer mientras el importador escribe,
+  `synchronous=NORMAL` sólo sincroniza el disco en los checkpoints del WAL
+  (seguro ante caídas del proceso; ante un corte de luz puede perderse la
+  última transacción), y `mmap_size`/`cache_size` mantienen en memoria las
+  páginas calientes; `SQLITE_TUNING=0` (settings) vuelve a los de SQLite.
+- PostgreSQL: el pool, las comprobaciones de salud y el límite general por
+  sentencia (`DB_STATEMENT_TIMEOUT_MS`) se configuran en `kaiken/settings.py`.
+  `statement_timeout(ms)` lo cambia para una vista concreta (p.ej. las
+  exportaciones, que leen millones de filas) y lo restaura al terminar la
+  respuesta, también cuando es un stream, para que la conexión no vuelva al
+  pool con otro límite. En otros motores no hace nada.
+"""
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+SQLITE_PRAGMAS = getattr(settings, 'SQLITE_PRAGMAS', {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    # Negativo: KiB (64 MiB) en vez de páginas.
+    'cache_size': -64000,
+    'temp_store': 'memory',
+})
+DB_STATEMENT_TIMEOUT_MS = getattr(settings, 'DB_STATEMENT_TIMEOUT_MS', 0)
+
+
+@receiver(connection_created)
+def _configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # Sobre la conexión de sqlite3 directamente: no cuentan como consultas
+    # de la petición que abrió la conexión.
+    for name, value in SQLITE_PRAGMAS.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def _applies(ms):
+    return connection.vendor == 'postgresql' and ms != DB_STATEMENT_TIMEOUT_MS
+
+
+def _set_timeout(ms):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('statement_timeout', %s, false)", [str(ms)])
+
+
+def _reset_timeout():
+    try:
+        # Vuelve al valor de la sesión (`options` de la conexión).
+        with connection.cursor() as cursor:
+            cursor.execute('RESET statement_timeout')
+    except DatabaseError:
+        # Si no se pudo restaurar, la conexión no se reutiliza.
+        connection.close()
+
+
+def _reset_after(response):
+    """Restaura el límite ya, o al terminar de enviar si es un stream."""
+    if not response.streaming:
+        _reset_timeout()
+        return response
+    content = response.streaming_content
+
+    def restoring():
+        try:
+            yield from content
+        finally:
+            _reset_timeout()
+
+    response.streaming_content = restoring()
+    return response
+
+
+async def _areset_after(response):
+    if not (response.streaming and response.is_async):
+        return await sync_to_async(_reset_after)(response)
+    content = response.streaming_content
+
+    async def restoring():
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            await sync_to_async(_reset_timeout)()
+
+    response.streaming_content = restoring()
+    return response
+
+
+def statement_timeout(ms):
+    """Decorador: límite de `ms` milisegundos por sentencia (0 = sin límite).
+
+    Sólo en PostgreSQL y si difiere del general: cuesta dos consultas
+    (fijarlo y restaurarlo). Acepta también vistas `async def`.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not _applies(ms):
+                    return await view(request, *args, **kwargs)
+                await sync_to_async(_set_timeout)(ms)
+                try:
+                    response = await view(request, *args, **kwargs)
+                except BaseException:
+                    await sync_to_async(_reset_timeout)()
+                    raise
+                return await _areset_after(response)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _applies(ms):
+                return view(request, *args, **kwargs)
+            _set_timeout(ms)
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                _reset_timeout()
+                raise
+            return _reset_after(response)
+        return wrapper
+    return decorator
@@ -0,0 +1,184 @@
+"""Exportación de licitaciones con sus líneas (órdenes) en streaming.
+
+Una fila por orden: licitación, cliente, producto, cantidad, precio, coste
+y margen de la línea (las licitaciones sin órdenes salen con las columnas
+de la orden vacías). Las filas se leen con `iterator()` (cursor del
+servidor en PostgreSQL) y se escriben por lotes, de modo que la memoria
+no depende del número de filas. Los importes se leen en centavos enteros
+(`reporting.cents`) para no construir un `Decimal` por columna.
+
+Formatos: CSV (vista `/api/tenders/export.csv` y comando `export_tenders`)
+y Parquet/Arrow en el comando, si `pyarrow` está instalado.
+"""
+import csv
+
+from django.conf import settings
+
+from .reporting import cents, from_cents
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - depende del entorno
+    pyarrow = None
+
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 5000)
+
+COLUMNS = (
+    'identifier', 'awarded_date', 'client', 'total_margin', 'order_id',
+    'product_sku', 'product_name', 'quantity', 'unit_price', 'unit_cost', 'margin',
+)
+
+EXPORT_FIELDS = (
+    'identifier', 'awarded_date', 'client_obj__name', 'orders__id', 'orders__product__sku',
+    'orders__product__name', 'orders__quantity', 'total_cents', 'price_cents', 'cost_cents',
+)
+
+
+def _export_queryset(tenders):
+    return (
+        tenders.annotate(
+            total_cents=cents('total_margin'),
+            price_cents=cents('orders__unit_price'),
+            cost_cents=cents('orders__unit_cost'),
+        )
+        # `values()` y no `values_list()`: el iterable de este último ejecuta
+        # la consulta al crearse, lo que `aiterator()` no admite.
+        .values(*EXPORT_FIELDS)
+        .order_by('-awarded_date', '-id', 'orders__id')
+    )
+
+
+def _export_row(row):
+    identifier, awarded, client, order_id, sku, name, quantity, total, price, cost = (row[f] for f in EXPORT_FIELDS)
+    if order_id is None:
+        return (identifier, awarded, client or '', from_cents(total or 0), None, None, None, None, None, None, None)
+    return (
+        identifier, awarded, client or '', from_cents(total or 0), order_id, sku, name, quantity,
+        from_cents(price), from_cents(cost), from_cents((price - cost) * quantity),
+    )
+
+
+def export_rows(tenders, chunk_size=EXPORT_CHUNK_SIZE):
+    """Genera tuplas en el orden de `COLUMNS` para las licitaciones dadas.
+
+    `tenders` es un queryset de `Tender` ya filtrado (p.ej. con
+    `views.filter_tenders`); se recorre en orden `(-awarded_date, -id)`.
+    """
+    for row in _export_queryset(tenders).iterator(chunk_size=chunk_size):
+        yield _export_row(row)
+
+
+async def aexport_rows(tenders, chunk_size=EXPORT_CHUNK_SIZE):
+    """Versión asíncrona de `export_rows` (`aiterator`)."""
+    async for row in _export_queryset(tenders).aiterator(chunk_size=chunk_size):
+        yield _export_row(row)
+
+
+class _Echo:
+    """Pseudo-archivo para `csv.writer`: devuelve lo escrito en vez de guardarlo."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, batch_size=500):
+    """Genera el CSV (con cabecera) en bloques de `batch_size` filas."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow(row))
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+async def aiter_csv(rows, batch_size=500):
+    """Como `iter_csv`, para un iterable asíncrono de filas.
+
+    Bajo ASGI un `StreamingHttpResponse` con un iterador síncrono se
+    consume entero en memoria antes de enviarse; éste se envía por bloques.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    batch = []
+    async for row in rows:
+        batch.append(writer.writerow(row))
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def write_csv(rows, out):
+    """Escribe el CSV en el archivo de texto `out`; devuelve las filas escritas."""
+    writer = csv.writer(out)
+    writer.writerow(COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def arrow_schema():
+    money = pyarrow.decimal128(18, 2)
+    return pyarrow.schema([
+        ('identifier', pyarrow.string()),
+        ('awarded_date', pyarrow.date32()),
+        ('client', pyarrow.string()),
+        ('total_margin', money),
+        ('order_id', pyarrow.int64()),
+        ('product_sku', pyarrow.string()),
+        ('product_name', pyarrow.string()),
+        ('quantity', pyarrow.int64()),
+        ('unit_price', money),
+        ('unit_cost', money),
+        ('margin', money),
+    ])
+
+
+def _record_batches(rows, schema, batch_size):
+    def batch(columns):
+        arrays = [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)]
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+    columns = [[] for _ in COLUMNS]
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+        if len(columns[0]) >= batch_size:
+            yield batch(columns)
+            columns = [[] for _ in COLUMNS]
+    if columns[0]:
+        yield batch(columns)
+
+
+def write_arrow(rows, path, fmt='parquet', batch_size=EXPORT_CHUNK_SIZE):
+    """Escribe Parquet (`fmt='parquet'`) o Arrow IPC (`'arrow'`) por lotes.
+
+    Cada lote de `batch_size` filas se convierte en un `RecordBatch` y se
+    escribe (un row group en Parquet), así que la memoria queda acotada.
+    Devuelve las filas escritas. Requiere `pyarrow`.
+    """
+    if pyarrow is None:
+        raise RuntimeError('pyarrow no está instalado.')
+    schema = arrow_schema()
+    if fmt == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+    else:
+        writer = pyarrow.ipc.new_file(path, schema)
+    count = 0
+    try:
+        for batch in _record_batches(rows, schema, batch_size):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    finally:
+        writer.close()
+    return count
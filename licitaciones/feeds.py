@@ -0,0 +1,267 @@
+"""Lectura incremental de feeds JSON (arrays o NDJSON).
+
+Los feeds de muestra pueden pesar varios GB, así que nunca se cargan
+completos en memoria: se descargan una sola vez a un archivo temporal
+local (o se leen de un archivo/stdin) y se recorren como generadores de
+registros tantas veces como haga falta.
+
+Las descargas se hacen en paralelo, con timeout y reintentos con backoff
+exponencial, y opcionalmente se cachean en disco usando ETag /
+Last-Modified para que un feed sin cambios responda 304.
+"""
+import codecs
+import hashlib
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+_SEPARATORS = ' \t\r\n,'
+
+
+def iter_json_records(fp, chunk_size=CHUNK_SIZE):
+    """Genera los registros de un array JSON o de un stream NDJSON.
+
+    `fp` puede ser binario (UTF-8) o de texto. La memoria usada queda
+    acotada al tamaño de un registro más `chunk_size`, sin importar el
+    tamaño total del documento.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+    buf = ''
+    pos = 0
+    eof = False
+    in_array = None
+
+    def read_more():
+        nonlocal buf, pos, eof
+        chunk = fp.read(chunk_size)
+        if isinstance(chunk, bytes):
+            text = utf8.decode(chunk, final=not chunk)
+        else:
+            text = chunk
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + text
+        pos = 0
+
+    while True:
+        while pos < len(buf) and buf[pos] in _SEPARATORS:
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                break
+            read_more()
+            continue
+
+        if in_array is None:
+            in_array = buf[pos] == '['
+            if in_array:
+                pos += 1
+                continue
+        if in_array and buf[pos] == ']':
+            return
+
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            read_more()
+            continue
+        if end == len(buf) and not eof and not isinstance(obj, (dict, list)):
+            # Un escalar al final del buffer puede estar cortado (p.ej. "12|34").
+            read_more()
+            continue
+        pos = end
+        yield obj
+
+    if in_array:
+        raise ValueError('Feed JSON truncado: falta el cierre "]" del array.')
+
+
+def spool(fp, chunk_size=CHUNK_SIZE):
+    """Copia un stream a un archivo temporal local y lo deja al inicio."""
+    tmp = tempfile.TemporaryFile()
+    shutil.copyfileobj(fp, tmp, chunk_size)
+    tmp.seek(0)
+    return tmp
+
+
+class Feed:
+    """Fuente de registros re-recorrible respaldada por un archivo local.
+
+    Cada iteración vuelve al inicio del archivo, de modo que un mismo feed
+    puede recorrerse en varias pasadas sin volver a descargarlo. Las
+    pasadas deben ser secuenciales: todas comparten el mismo descriptor.
+
+    `changed` es False cuando el servidor respondió 304 y el contenido se
+    sirve desde la caché local; `seconds`, lo que tardó la descarga
+    (reintentos incluidos; 0 si no se descargó).
+    """
+
+    def __init__(self, fp, name='', changed=True, cache=None, validators=None, seconds=0.0):
+        self.fp = fp
+        self.seconds = seconds
+        self.name = name
+        self.changed = changed
+        self.cache = cache
+        self.validators = validators or {}
+
+    def __iter__(self):
+        self.fp.seek(0)
+        yield from iter_json_records(self.fp)
+
+    def commit(self):
+        """Registra en caché los validadores tras una importación exitosa.
+
+        Hasta entonces la siguiente ejecución no envía cabeceras
+        condicionales, así una importación fallida nunca se da por hecha.
+        """
+        if self.cache is not None and self.changed and self.validators:
+            self.cache.save_validators(self.validators)
+
+    def close(self):
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FeedCache:
+    """Entrada de caché en disco para una URL: cuerpo + validadores HTTP."""
+
+    def __init__(self, cache_dir, url):
+        key = hashlib.sha1(url.encode()).hexdigest()
+        self.body_path = os.path.join(cache_dir, f'{key}.json')
+        self.meta_path = os.path.join(cache_dir, f'{key}.meta')
+        self.dir = cache_dir
+
+    def load_validators(self):
+        if not os.path.exists(self.body_path):
+            return {}
+        try:
+            with open(self.meta_path) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def save_validators(self, validators):
+        tmp = f'{self.meta_path}.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(validators, fh)
+        os.replace(tmp, self.meta_path)
+
+    def store(self, resp):
+        """Vuelca la respuesta al archivo de caché de forma atómica."""
+        os.makedirs(self.dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.dir, suffix='.part')
+        with os.fdopen(fd, 'wb') as fh:
+            shutil.copyfileobj(resp, fh, CHUNK_SIZE)
+        # El cuerpo cambia: invalidar validadores previos antes de reemplazarlo.
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        os.replace(tmp, self.body_path)
+        return open(self.body_path, 'rb')
+
+
+def _retryable(exc):
+    if isinstance(exc, HTTPError):
+        return exc.code >= 500 or exc.code == 429
+    return isinstance(exc, (URLError, socket.timeout, TimeoutError, ConnectionError))
+
+
+def download(url, cache_dir=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """Descarga `url` a un archivo local y devuelve un `Feed`.
+
+    Reintenta errores de red, 5xx y 429 hasta `retries` veces esperando
+    `backoff * 2**intento` segundos. Con `cache_dir` se envían
+    If-None-Match / If-Modified-Since y un 304 reutiliza el cuerpo en caché.
+    """
+    cache = FeedCache(cache_dir, url) if cache_dir else None
+    cached = cache.load_validators() if cache else {}
+    headers = {}
+    if cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    attempt = 0
+    start = time.perf_counter()
+    while True:
+        try:
+            with urlopen(Request(url, headers=headers), timeout=timeout) as resp:
+                validators = {
+                    'etag': resp.headers.get('ETag'),
+                    'last_modified': resp.headers.get('Last-Modified'),
+                }
+                validators = {k: v for k, v in validators.items() if v}
+                fp = cache.store(resp) if cache else spool(resp)
+                return Feed(fp, name=url, cache=cache, validators=validators, seconds=time.perf_counter() - start)
+        except HTTPError as exc:
+            if exc.code == 304 and cache:
+                return Feed(
+                    open(cache.body_path, 'rb'), name=url, changed=False, cache=cache, validators=cached,
+                    seconds=time.perf_counter() - start,
+                )
+            if not _retryable(exc) or attempt >= retries:
+                raise
+        except Exception as exc:
+            if not _retryable(exc) or attempt >= retries:
+                raise
+        time.sleep(backoff * 2 ** attempt)
+        attempt += 1
+
+
+def fetch_all(urls, **kwargs):
+    """Descarga varias URLs en paralelo; devuelve los `Feed` en el mismo orden.
+
+    Si alguna descarga falla se cierran las ya completadas y se propaga
+    el error.
+    """
+    with ThreadPoolExecutor(max_workers=max(len(urls), 1)) as pool:
+        futures = [pool.submit(download, url, **kwargs) for url in urls]
+    feeds, error = [], None
+    for future in futures:
+        try:
+            feeds.append(future.result())
+        except Exception as exc:
+            error = error or exc
+    if error is not None:
+        for feed in feeds:
+            feed.close()
+        raise error
+    return feeds
+
+
+def is_url(source) -> bool:
+    return str(source).startswith(('http://', 'https://'))
+
+
+def open_feed(source, **kwargs):
+    """Abre un feed desde una URL http(s), una ruta local o `-` (stdin).
+
+    Las URLs y stdin se vuelcan a un archivo local para poder recorrerlos
+    más de una vez; las rutas locales se leen directamente. `kwargs` se
+    pasan a `download` para las URLs.
+    """
+    source = str(source)
+    if source == '-':
+        return Feed(spool(sys.stdin.buffer), name='<stdin>')
+    if is_url(source):
+        return download(source, **kwargs)
+    return Feed(open(source, 'rb'), name=source)
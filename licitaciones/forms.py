@@ -1,8 +1,48 @@
 from django import forms
-from django.forms.models import inlineformset_factory
+from django.forms.models import BaseInlineFormSet, inlineformset_factory
+from django.urls import reverse
+from django.utils.html import format_html
+
+from . import lookups
 from .models import Tender, Order, Client
 
 
+class LookupInput(forms.HiddenInput):
+    """Id en un campo oculto y un texto que autocompleta contra `/api/lookups/`.
+
+    Sólo se renderiza la etiqueta del valor actual (de `lookups.table`), no
+    la lista de opciones.
+    """
+
+    is_hidden = False
+
+    class Media:
+        js = ('licitaciones/lookup.js',)
+
+    def __init__(self, kind, attrs=None):
+        super().__init__(attrs)
+        self.kind = kind
+
+    def render(self, name, value, attrs=None, renderer=None):
+        hidden = super().render(name, value, attrs, renderer)
+        target = (attrs or {}).get('id') or f'id_{name}'
+        label = lookups.table(self.kind).label(value) if value not in (None, '') else ''
+        return format_html(
+            '{}<input type="text" class="lookup" value="{}" list="{}_options" data-target="{}" '
+            'data-lookup="{}" autocomplete="off" placeholder="Buscar..."><datalist id="{}_options"></datalist>',
+            hidden, label, target, target, reverse('lookup_autocomplete', args=[self.kind]), target,
+        )
+
+
+class LookupChoiceField(forms.ModelChoiceField):
+    """`ModelChoiceField` de clientes o productos con `LookupInput`."""
+
+    def __init__(self, kind, **kwargs):
+        model, _ = lookups.KINDS[kind]
+        kwargs.setdefault('widget', LookupInput(kind))
+        super().__init__(queryset=model.objects.all(), **kwargs)
+
+
 class TenderForm(forms.ModelForm):
     class Meta:
         model = Tender
@@ -17,7 +57,7 @@ class TenderForm(forms.ModelForm):
             'awarded_date': 'Fecha adjudicación',
         }
 
-    client_obj = forms.ModelChoiceField(queryset=Client.objects.all(), required=False, label='Cliente')
+    client_obj = LookupChoiceField('clients', required=False, label='Cliente')
 
 
 class ClientForm(forms.ModelForm):
@@ -38,11 +78,37 @@ class OrderForm(forms.ModelForm):
             'unit_cost': 'Coste unitario',
         }
 
+    product = LookupChoiceField('products', label='Producto')
+
+
+class BaseOrderFormSet(BaseInlineFormSet):
+    """Órdenes de una licitación: exige al menos una línea no eliminada.
+
+    La regla se comprueba aquí, sobre los formularios, para no tener que
+    contar las órdenes en la BD al guardar. `hidden_count` son las órdenes
+    existentes que no están en el formset (inline paginado del admin).
+    """
+
+    def __init__(self, *args, hidden_count=0, pager=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hidden_count = hidden_count
+        self.pager = pager
+
+    def clean(self):
+        super().clean()
+        remaining = [
+            f for f in self.forms
+            if getattr(f, 'cleaned_data', None) and not f.cleaned_data.get('DELETE', False)
+        ]
+        if not remaining and not self.hidden_count:
+            raise forms.ValidationError('Debe incluir al menos una orden para la licitación.')
+
 
 OrderFormSet = inlineformset_factory(
     Tender,
     Order,
     form=OrderForm,
+    formset=BaseOrderFormSet,
     extra=1,
     can_delete=True,
 )
@@ -0,0 +1,217 @@
+"""Resolución de identificadores de licitación externos.
+
+Los sistemas externos envían el id con o sin guiones, con espacios o en
+minúsculas ("1234-56-LE24", "123456le24"). Todos se reducen a la misma
+clave con `normalize_identifier`, que es única en la BD
+(`Tender.normalized_identifier`), así que resolver es una consulta por
+índice único; `resolve_many` resuelve un lote en un solo `IN`.
+
+`resolve_many` (y `resolve`) guardan las claves resueltas en una caché
+LRU del proceso (`IDENTIFIER_CACHE_SIZE` entradas) con el id y el
+identificador canónico de la licitación: las órdenes de un lote que
+apuntan a licitaciones ya vistas no consultan la BD. Cada entrada vence a
+los `IDENTIFIER_CACHE_TTL` segundos. `get_tender` no la
+lee: cargar la licitación cuesta una consulta tanto por id como por la
+clave normalizada, así que siempre va por la clave. `get_tenders` y el
+importador sí alimentan la caché con lo que cargan; el importador resuelve
+con `resolve_many` tanto las órdenes del feed como las licitaciones de la
+API bulk.
+
+Al guardar o borrar una licitación (`post_save` de `Tender.save()`,
+`post_delete`) se olvidan su clave actual y la anterior, y con
+`tenders_changed` (p.ej. `Tender.objects.update()`) las anteriores; el
+refresco de totales no cambia el identificador. Otros procesos no se
+enteran: allí la entrada sigue hasta que vence o sale de la LRU, así que quien escribe con
+un id resuelto debe comprobar que la licitación sigue existiendo con esa
+clave (lo hace `BulkImporter.import_tender_documents`). Las claves inexistentes no se
+guardan. Lo leído dentro de una transacción se guarda al confirmarla
+(`on_commit`): si se revierte, la caché no se queda con ids que no
+existen.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Tender, normalize_identifier
+from .signals import tenders_changed
+
+
+IDENTIFIER_CACHE_SIZE = getattr(settings, 'IDENTIFIER_CACHE_SIZE', 10000)
+# Segundos que vale una entrada: acota cuánto tarda un proceso en ver el
+# borrado o renombrado de una licitación hecho en otro.
+IDENTIFIER_CACHE_TTL = getattr(settings, 'IDENTIFIER_CACHE_TTL', 300)
+
+# Licitación resuelta: id y `identifier` canónico (el guardado en la BD).
+Resolved = namedtuple('Resolved', 'pk identifier')
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _get(key):
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[1] <= time.monotonic():
+            del _cache[key]
+            entry = None
+        if entry is not None:
+            _cache.move_to_end(key)
+        _stats['hits' if entry is not None else 'misses'] += 1
+        return entry[0] if entry is not None else None
+
+
+def _store(entries):
+    expires = time.monotonic() + IDENTIFIER_CACHE_TTL
+    with _lock:
+        for key, resolved in entries:
+            _cache[key] = (resolved, expires)
+            _cache.move_to_end(key)
+        while len(_cache) > IDENTIFIER_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _put(entries):
+    """Guarda `[(clave, Resolved)]`; dentro de una transacción, al confirmarla."""
+    entries = list(entries)
+    if not entries:
+        return
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _store(entries))
+    else:
+        _store(entries)
+
+
+def remember(tenders):
+    """Guarda en la caché licitaciones ya cargadas (p.ej. por el importador)."""
+    _put((t.normalized_identifier, Resolved(t.pk, t.identifier)) for t in tenders)
+
+
+def forget(*identifiers):
+    with _lock:
+        for identifier in identifiers:
+            _cache.pop(normalize_identifier(identifier), None)
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+        _stats.update(hits=0, misses=0)
+
+
+def cache_info():
+    """``{'hits', 'misses', 'size', 'maxsize'}`` de la caché de este proceso."""
+    with _lock:
+        return {**_stats, 'size': len(_cache), 'maxsize': IDENTIFIER_CACHE_SIZE}
+
+
+def resolve(identifier):
+    """`Resolved` de `identifier` (con o sin guiones), o None si no existe."""
+    return resolve_many([identifier]).get(identifier)
+
+
+def resolve_many(identifiers):
+    """``{identificador recibido: Resolved}`` de los que existen.
+
+    Las claves que no están en la caché se buscan con una sola consulta.
+    """
+    found, missing = {}, {}
+    for key, received in _keys(identifiers).items():
+        resolved = _get(key)
+        if resolved is None:
+            missing[key] = received
+        else:
+            found.update((identifier, resolved) for identifier in received)
+    if missing:
+        rows = Tender.objects.filter(normalized_identifier__in=list(missing)).values_list(
+            'normalized_identifier', 'pk', 'identifier',
+        )
+        entries = [(key, Resolved(pk, canonical)) for key, pk, canonical in rows]
+        _put(entries)
+        for key, resolved in entries:
+            found.update((identifier, resolved) for identifier in missing[key])
+    return found
+
+
+def get_tender(identifier, queryset=None):
+    """Licitación de `identifier` (con o sin guiones) en una consulta, o None.
+
+    Por la clave normalizada (índice único), sin pasar por la caché.
+    """
+    key = normalize_identifier(identifier)
+    if not key:
+        return None
+    queryset = Tender.objects.all() if queryset is None else queryset
+    return queryset.filter(normalized_identifier=key).first()
+
+
+async def aget_tender(identifier, queryset=None):
+    """Versión asíncrona de `get_tender`."""
+    key = normalize_identifier(identifier)
+    if not key:
+        return None
+    queryset = Tender.objects.all() if queryset is None else queryset
+    return await queryset.filter(normalized_identifier=key).afirst()
+
+
+def get_tenders(identifiers, queryset=None):
+    """``{identificador recibido: Tender}`` de los que existen, en una consulta.
+
+    Como `resolve_many`, pero cargando las licitaciones (por la clave
+    normalizada, que es tan selectiva como el id).
+    """
+    keys = _keys(identifiers)
+    queryset = Tender.objects.all() if queryset is None else queryset
+    return _by_identifier(keys, queryset.filter(normalized_identifier__in=list(keys)) if keys else [])
+
+
+async def aget_tenders(identifiers, queryset=None):
+    """Versión asíncrona de `get_tenders`."""
+    keys = _keys(identifiers)
+    queryset = Tender.objects.all() if queryset is None else queryset
+    tenders = [t async for t in queryset.filter(normalized_identifier__in=list(keys))] if keys else []
+    return _by_identifier(keys, tenders)
+
+
+def _keys(identifiers):
+    keys = {}
+    for identifier in identifiers:
+        key = normalize_identifier(identifier)
+        if key:
+            keys.setdefault(key, []).append(identifier)
+    return keys
+
+
+def _by_identifier(keys, tenders):
+    tenders = list(tenders)
+    remember(tenders)
+    found = {}
+    for tender in tenders:
+        for identifier in keys[tender.normalized_identifier]:
+            found[identifier] = tender
+    return found
+
+
+@receiver(tenders_changed, sender=Tender)
+def _tenders_bulk_written(sender, previous=(), totals_only=False, **kwargs):
+    # `Tender.objects.update()` puede cambiar el identificador.
+    if not totals_only:
+        stale = [t.identifier for t in previous]
+        forget(*stale)
+        transaction.on_commit(lambda: forget(*stale))
+
+
+@receiver(post_save, sender=Tender)
+@receiver(post_delete, sender=Tender)
+def _tender_written(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    stale = (instance.identifier, loaded.get('identifier'))
+    # Como `caching.invalidate`: ahora y al confirmar, después de lo que
+    # se haya leído antes en la misma transacción.
+    forget(*stale)
+    transaction.on_commit(lambda: forget(*stale))
@@ -0,0 +1,683 @@
+"""Pipeline de importación masiva (basada en conjuntos) de datos de muestra.
+
+A diferencia del camino fila a fila de `import_sample_data`, aquí se
+precargan los mapas SKU→producto, identificador→licitación y
+nombre→cliente con pocas consultas, se valida en memoria usando los
+propios campos del modelo y se escribe en lotes con `bulk_create`
+(upsert mediante `update_conflicts`) dentro de transacciones por bloque.
+
+En modo incremental cada registro de origen se identifica por una clave
+estable y una huella de su contenido (`ImportState`); los registros cuya
+huella no cambió se omiten sin tocar las tablas de negocio.
+"""
+import hashlib
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from . import identifiers
+from .models import TENDER_KEY_FIELDS, Tender, Product, Order, Client, ImportState, normalize_identifier
+from .signals import catalog_changed, tenders_changed
+
+
+TWO_PLACES = Decimal('0.01')
+DEFAULT_BATCH_SIZE = 1000
+
+
+def max_decimal_for(field) -> Decimal:
+    """Máximo valor absoluto representable por un `DecimalField`."""
+    int_digits = field.max_digits - field.decimal_places
+    if field.decimal_places:
+        return Decimal('9' * int_digits + '.' + '9' * field.decimal_places)
+    return Decimal('9' * int_digits)
+
+
+def chunked(iterable, size):
+    """Agrupa un iterable en listas de hasta `size` elementos."""
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def fingerprint(record) -> str:
+    """Huella estable del contenido de un registro externo."""
+    payload = json.dumps(record, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def product_key(p) -> str:
+    return str(p.get('sku') or p.get('product_id'))
+
+
+def tender_key(t) -> str:
+    return str(t.get('id') or t.get('identifier') or '')
+
+
+def parse_product(p) -> dict:
+    """Convierte un registro externo de producto a valores del modelo.
+
+    Si no hay precio de venta se aplica un margen por defecto del 20% para
+    cumplir la restricción price>cost.
+    """
+    sku = product_key(p)
+    name = p.get('title') or p.get('name') or ''
+    cost = Decimal(str(p.get('cost', 0)))
+    price_val = p.get('price') or p.get('unit_price')
+    if price_val is None:
+        price = (cost * Decimal('1.20')).quantize(TWO_PLACES)
+    else:
+        price = Decimal(str(price_val))
+    return {'sku': sku, 'name': name, 'price': price, 'cost': cost}
+
+
+def parse_order(o) -> dict:
+    """Convierte un registro externo de orden a valores normalizados.
+
+    `unit_price` se cuantiza a 2 decimales para evitar representaciones en
+    coma flotante con demasiados dígitos; `clamped` indica si hubo que
+    ajustarlo al máximo permitido por el campo.
+    """
+    tender_identifier = o.get('tender_id') or o.get('tender_identifier')
+    product_id = o.get('product_id') or o.get('product_sku') or o.get('sku')
+    quantity = int(o.get('quantity', 1))
+    raw_price = o.get('price') or o.get('unit_price') or 0
+    unit_price = Decimal(str(raw_price)).quantize(TWO_PLACES)
+    max_allowed = max_decimal_for(Order._meta.get_field('unit_price'))
+    clamped = unit_price.copy_abs() > max_allowed
+    if clamped:
+        unit_price = max_allowed
+    return {
+        'tender_identifier': tender_identifier,
+        'product_id': str(product_id),
+        'quantity': quantity,
+        'unit_price': unit_price,
+        'clamped': clamped,
+    }
+
+
+def _optional_decimal(value):
+    return None if value in (None, '') else Decimal(str(value))
+
+
+def parse_tender_document(record):
+    """Convierte una licitación con órdenes anidadas (API bulk) a valores.
+
+    Devuelve `(licitación, líneas)`: un dict con identifier, client y
+    awarded_date, y una lista de dicts con sku, quantity, unit_price y
+    unit_cost (los precios ausentes se toman después del producto).
+    """
+    if not isinstance(record, dict):
+        raise TypeError('Se esperaba un objeto JSON.')
+    identifier = str(record.get('identifier') or record.get('id') or '').strip()
+    if not identifier:
+        raise ValueError('Falta el identificador de la licitación.')
+    orders = record.get('orders')
+    if not isinstance(orders, list) or not orders:
+        raise ValueError('La licitación debe incluir al menos una orden.')
+    lines = []
+    for o in orders:
+        if not isinstance(o, dict):
+            raise TypeError('Cada orden debe ser un objeto JSON.')
+        lines.append({
+            'sku': str(o.get('product_sku') or o.get('sku') or o.get('product_id') or ''),
+            'quantity': int(o.get('quantity', 1)),
+            'unit_price': _optional_decimal(o.get('unit_price', o.get('price'))),
+            'unit_cost': _optional_decimal(o.get('unit_cost')),
+        })
+    tender = {
+        'identifier': identifier,
+        'client': str(record.get('client') or '').strip(),
+        'awarded_date': record.get('awarded_date') or record.get('creation_date'),
+    }
+    return tender, lines
+
+
+def _error_dict(exc):
+    if isinstance(exc, ValidationError):
+        return exc.message_dict if hasattr(exc, 'error_dict') else {'__all__': exc.messages}
+    return {'__all__': [str(exc)]}
+
+
+class StageTimer:
+    """Acumula duraciones y filas procesadas por etapa del pipeline."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {'seconds': 0.0, 'rows': 0})
+            entry['seconds'] += time.perf_counter() - start
+
+    def add_rows(self, name, rows):
+        self.stages.setdefault(name, {'seconds': 0.0, 'rows': 0})['rows'] += rows
+
+    def report(self):
+        """Líneas legibles con duración y filas/seg de cada etapa."""
+        lines = []
+        for name, entry in self.stages.items():
+            secs = entry['seconds']
+            rate = entry['rows'] / secs if secs > 0 else 0.0
+            lines.append(f"{name}: {entry['rows']} filas en {secs:.3f}s ({rate:,.0f} filas/s)")
+        return lines
+
+
+class BulkImporter:
+    """Importa productos, licitaciones y órdenes en lotes.
+
+    Cada método acepta cualquier iterable de registros externos (dicts) y
+    los procesa en bloques de `batch_size` sin materializarlo entero, cada
+    uno en su propia transacción. Los errores de validación se informan por
+    `log_error` y la fila se descarta sin abortar el bloque.
+
+    Con `incremental=True` se consulta `ImportState` una vez por bloque y
+    sólo se escriben los registros nuevos o modificados. `summary` lleva la
+    cuenta de insertados/actualizados/omitidos/errores por entidad.
+    """
+
+    OUTCOMES = ('insertados', 'actualizados', 'omitidos', 'errores')
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, log_error=None, incremental=False):
+        self.batch_size = batch_size
+        self.log_error = log_error or (lambda msg: None)
+        self.incremental = incremental
+        self.timer = StageTimer()
+        self.records_seen = 0
+        self.summary = {}
+        self.products_by_sku = {}
+        self.clients_by_name = {}
+        # Licitaciones cargadas o escritas, por clave normalizada.
+        self.tenders_by_key = {}
+        self._order_occurrences = Counter()
+
+    def count(self, entity, outcome, n=1):
+        self.summary.setdefault(entity, Counter())[outcome] += n
+
+    def error(self, entity, message):
+        self.count(entity, 'errores')
+        self.log_error(message)
+
+    def summary_lines(self):
+        lines = []
+        for entity, counts in self.summary.items():
+            parts = ', '.join(f'{counts[o]} {o}' for o in self.OUTCOMES)
+            lines.append(f'{entity}: {parts}')
+        return lines
+
+    # -- estado incremental ----------------------------------------------
+
+    def _changed(self, entity, keyed):
+        """Filtra `(clave, huella, registro)` dejando sólo los cambiados.
+
+        Devuelve `(cambiados, estados)` donde `estados` mapea clave →
+        `ImportState` previo. Sin modo incremental no filtra nada.
+        """
+        if not self.incremental:
+            return keyed, {}
+        states = {
+            s.source_key: s
+            for s in ImportState.objects.filter(entity=entity, source_key__in=[k for k, _, _ in keyed])
+        }
+        changed = []
+        for key, fp, record in keyed:
+            state = states.get(key)
+            if state is not None and state.fingerprint == fp:
+                self.count(entity, 'omitidos')
+            else:
+                changed.append((key, fp, record))
+        return changed, states
+
+    def _save_states(self, entity, rows):
+        """Guarda `(clave, huella, object_id)` de los registros escritos."""
+        if not self.incremental or not rows:
+            return
+        ImportState.objects.bulk_create(
+            [ImportState(entity=entity, source_key=k, fingerprint=fp, object_id=oid) for k, fp, oid in rows],
+            update_conflicts=True,
+            unique_fields=['entity', 'source_key'],
+            update_fields=['fingerprint', 'object_id', 'updated_at'],
+        )
+
+    def _keyed(self, chunk, key_func):
+        if not self.incremental:
+            return [(None, None, r) for r in chunk]
+        return [(key_func(r), fingerprint(r), r) for r in chunk]
+
+    # -- productos -----------------------------------------------------
+
+    def _load_products(self, skus):
+        missing = [s for s in skus if s not in self.products_by_sku]
+        if missing:
+            self.products_by_sku.update(
+                (p.sku, p) for p in Product.objects.filter(sku__in=missing)
+            )
+
+    def import_products(self, records):
+        fields = {name: Product._meta.get_field(name) for name in ('sku', 'name', 'price', 'cost')}
+        for chunk in chunked(records, self.batch_size):
+            self.records_seen += len(chunk)
+            with self.timer.stage('productos:validación'):
+                keyed, _ = self._changed('productos', self._keyed(chunk, product_key))
+                by_sku = {}
+                for key, fp, p in keyed:
+                    try:
+                        values = parse_product(p)
+                        for name, field in fields.items():
+                            values[name] = field.clean(values[name], None)
+                        if values['price'] <= values['cost']:
+                            raise ValidationError('El precio debe ser mayor que el costo.')
+                    except (ValidationError, InvalidOperation, TypeError, ValueError) as exc:
+                        self.error('productos', f'Error importando producto {p!r}: {exc}')
+                        continue
+                    # El último registro de un mismo SKU prevalece, igual que
+                    # con `update_or_create` fila a fila.
+                    by_sku[values['sku']] = (key, fp, Product(**values))
+                self._load_products(by_sku)
+                existing = {sku for sku in by_sku if sku in self.products_by_sku}
+            if not by_sku:
+                continue
+            with self.timer.stage('productos:escritura'), transaction.atomic():
+                Product.objects.bulk_create(
+                    [obj for _, _, obj in by_sku.values()],
+                    update_conflicts=True,
+                    unique_fields=['sku'],
+                    update_fields=['name', 'price', 'cost'],
+                )
+                self.products_by_sku.update(
+                    (p.sku, p) for p in Product.objects.filter(sku__in=list(by_sku))
+                )
+                self._save_states('productos', [
+                    (key, fp, self.products_by_sku[sku].pk) for sku, (key, fp, _) in by_sku.items()
+                ])
+                catalog_changed.send(sender=Product)
+            self.count('productos', 'actualizados', len(existing))
+            self.count('productos', 'insertados', len(by_sku) - len(existing))
+            self.timer.add_rows('productos:escritura', len(by_sku))
+
+    # -- licitaciones --------------------------------------------------
+
+    def _load_clients(self, names):
+        """Carga o crea los clientes `names`; devuelve los que no estaban cargados."""
+        missing = [n for n in names if n not in self.clients_by_name]
+        if not missing:
+            return missing
+        Client.objects.bulk_create([Client(name=n) for n in missing], ignore_conflicts=True)
+        catalog_changed.send(sender=Client)
+        self.clients_by_name.update(
+            (c.name, c) for c in Client.objects.filter(name__in=missing)
+        )
+        return missing
+
+    def _remember_tenders(self, tenders):
+        tenders = list(tenders)
+        for t in tenders:
+            self.tenders_by_key[t.normalized_identifier] = t
+        # Las órdenes se resuelven después contra la caché del resolvedor.
+        identifiers.remember(tenders)
+
+    def _load_tenders(self, values):
+        """Precarga licitaciones por clave normalizada (una consulta)."""
+        keys = {normalize_identifier(i) for i in values} - set(self.tenders_by_key) - {''}
+        if keys:
+            self._remember_tenders(Tender.objects.filter(normalized_identifier__in=keys))
+
+    def import_tenders(self, records, keys_with_orders):
+        """Crea o actualiza licitaciones.
+
+        Sólo se crean licitaciones nuevas cuya clave normalizada esté en
+        `keys_with_orders`; las existentes se actualizan siempre.
+        """
+        for chunk in chunked(records, self.batch_size):
+            self.records_seen += len(chunk)
+            with self.timer.stage('licitaciones:validación'):
+                keyed, _ = self._changed('licitaciones', self._keyed(chunk, tender_key))
+                candidates = [
+                    Tender(identifier=t.get('id') or t.get('identifier'), awarded_date=t.get('creation_date') or t.get('awarded_date'))
+                    for _, _, t in keyed
+                ]
+                # Validación del modelo en lote; la unicidad no aplica (upsert)
+                # y las órdenes llegan en su propio feed.
+                errors = Tender.objects.bulk_validate([(c, None) for c in candidates], validate_unique=False)
+                parsed = []
+                for n, ((key, fp, t), tender) in enumerate(zip(keyed, candidates)):
+                    if n in errors:
+                        self.error('licitaciones', f'Error validando licitación {tender.identifier}: {errors[n]}')
+                        continue
+                    parsed.append((key, fp, tender.identifier, t.get('client', ''), tender.awarded_date))
+                self._load_tenders(p[2] for p in parsed)
+
+                kept = []
+                for row in parsed:
+                    identifier = row[2]
+                    key = normalize_identifier(identifier)
+                    if key not in self.tenders_by_key and key not in keys_with_orders:
+                        self.count('licitaciones', 'omitidos')
+                        self.log_error(f'Omitiendo licitación sin órdenes: {identifier}')
+                        continue
+                    kept.append(row)
+                self._load_clients({row[3] for row in kept if row[3]})
+
+                # Por clave normalizada: "A-1" y "a1" son la misma licitación,
+                # que conserva su identificador canónico.
+                by_key = {}
+                for key, fp, identifier, client_name, awarded_date in kept:
+                    normalized = normalize_identifier(identifier)
+                    current = self.tenders_by_key.get(normalized)
+                    by_key[normalized] = (key, fp, Tender(
+                        identifier=current.identifier if current else identifier,
+                        normalized_identifier=normalized,
+                        client_obj=self.clients_by_name.get(client_name) if client_name else None,
+                        awarded_date=awarded_date,
+                    ))
+                previous = [self.tenders_by_key[k] for k in by_key if k in self.tenders_by_key]
+            if not by_key:
+                continue
+            with self.timer.stage('licitaciones:escritura'), transaction.atomic():
+                Tender.objects.bulk_create(
+                    [obj for _, _, obj in by_key.values()],
+                    update_conflicts=True,
+                    unique_fields=['normalized_identifier'],
+                    update_fields=['client_obj', 'awarded_date'],
+                )
+                written = Tender.objects.filter(normalized_identifier__in=list(by_key))
+                # El upsert no emite post_save (p.ej. para invalidar la caché).
+                tenders_changed.send(sender=Tender, queryset=written, previous=previous)
+                self._remember_tenders(written)
+                self._save_states('licitaciones', [
+                    (key, fp, self.tenders_by_key[k].pk) for k, (key, fp, _) in by_key.items()
+                ])
+            self.count('licitaciones', 'actualizados', len(previous))
+            self.count('licitaciones', 'insertados', len(by_key) - len(previous))
+            self.timer.add_rows('licitaciones:escritura', len(by_key))
+
+    # -- órdenes -------------------------------------------------------
+
+    def order_key(self, o) -> str:
+        """Clave de origen de una orden.
+
+        Se usa su `id` si el feed lo trae. Si no, la licitación (normalizada)
+        y el producto más el número de aparición de ese par, de modo que una
+        línea cuyo precio o cantidad cambia se actualiza en su lugar (la
+        huella decide si cambió) en vez de duplicarse.
+        """
+        if o.get('id') is not None:
+            return f"id:{o['id']}"
+        tender = normalize_identifier(o.get('tender_id') or o.get('tender_identifier'))
+        product = o.get('product_id') or o.get('product_sku') or o.get('sku')
+        pair = f'{tender}|{product}'
+        self._order_occurrences[pair] += 1
+        return f'{pair}#{self._order_occurrences[pair]}'
+
+    def import_orders(self, records):
+        for chunk in chunked(records, self.batch_size):
+            self.records_seen += len(chunk)
+            with self.timer.stage('órdenes:validación'):
+                keyed, states = self._changed('órdenes', self._keyed(chunk, self.order_key))
+                parsed = []
+                for key, fp, o in keyed:
+                    try:
+                        parsed.append((key, fp, o, parse_order(o)))
+                    except (InvalidOperation, TypeError, ValueError) as exc:
+                        self.error('órdenes', f'Error importando orden {o!r}: {exc}')
+                tender_ids = identifiers.resolve_many({p[3]['tender_identifier'] for p in parsed})
+                self._load_products({p[3]['product_id'] for p in parsed})
+                # Órdenes ya importadas cuyo contenido cambió: se actualizan
+                # en su lugar si la fila sigue existiendo.
+                previous_ids = {states[k].object_id for k, _, _ in keyed if k in states and states[k].object_id}
+                alive = set(Order.objects.filter(pk__in=previous_ids).values_list('pk', flat=True)) if previous_ids else set()
+
+                candidates = []
+                for key, fp, o, v in parsed:
+                    if v['clamped']:
+                        self.log_error(f'unit_price demasiado grande en orden {o.get("id", o)!r}: se ajusta a {v["unit_price"]}')
+                    tender = tender_ids.get(v['tender_identifier'])
+                    if tender is None:
+                        self.error('órdenes', f'Tender no encontrada: {v["tender_identifier"]}')
+                        continue
+                    product = self.products_by_sku.get(v['product_id'])
+                    if product is None:
+                        self.error('órdenes', f'Product no encontrada: {v["product_id"]}')
+                        continue
+                    candidates.append((key, fp, o, Order(
+                        tender_id=tender.pk,
+                        product=product,
+                        quantity=v['quantity'],
+                        unit_price=v['unit_price'] if v['unit_price'] > 0 else product.price,
+                        unit_cost=product.cost,
+                    )))
+                # Validación del modelo en lote, sin consultas: los productos
+                # están cargados y las licitaciones las acaba de resolver
+                # `identifiers`.
+                errors = Order.objects.bulk_validate([c[3] for c in candidates], exclude=('tender',))
+
+                to_create, to_update = [], []
+                for n, (key, fp, o, order) in enumerate(candidates):
+                    if n in errors:
+                        self.error('órdenes', f'Error importando orden {o!r}: {errors[n]}')
+                        continue
+                    state = states.get(key)
+                    if state is not None and state.object_id in alive:
+                        order.pk = state.object_id
+                        to_update.append((key, fp, order))
+                    else:
+                        to_create.append((key, fp, order))
+            if not to_create and not to_update:
+                continue
+            with self.timer.stage('órdenes:escritura'), transaction.atomic():
+                Order.objects.bulk_create([obj for _, _, obj in to_create])
+                Order.objects.bulk_update(
+                    [obj for _, _, obj in to_update],
+                    ['tender', 'product', 'quantity', 'unit_price', 'unit_cost'],
+                )
+                self._save_states('órdenes', [(key, fp, obj.pk) for key, fp, obj in to_create + to_update])
+            self.count('órdenes', 'insertados', len(to_create))
+            self.count('órdenes', 'actualizados', len(to_update))
+            self.timer.add_rows('órdenes:escritura', len(to_create) + len(to_update))
+
+    # -- documentos (licitación + órdenes, API bulk) ----------------------
+
+    DOCUMENT_ENTITY = 'api:licitaciones'
+
+    def import_tender_documents(self, records):
+        """Crea o reemplaza licitaciones con sus órdenes anidadas.
+
+        Genera, en el orden de entrada, un resultado por registro:
+        ``{'index', 'identifier', 'status'}`` con status created, updated,
+        unchanged o error (más `errors`). La clave de idempotencia es
+        `normalized_identifier`: si la licitación ya existe sus órdenes se
+        reemplazan por las del registro, y si el registro es idéntico al
+        último aplicado (`ImportState`) no se escribe nada, de modo que un
+        reintento nunca duplica órdenes. Cada bloque de `batch_size`
+        registros se valida en memoria y se escribe en una transacción.
+        """
+        index = 0
+        seen = set()
+        records = iter(records)
+        while True:
+            # Si el origen falla a mitad de bloque (JSON inválido), los
+            # registros ya leídos se importan antes de propagar el error.
+            chunk, error = [], None
+            try:
+                while len(chunk) < self.batch_size:
+                    chunk.append(next(records))
+            except StopIteration:
+                pass
+            except ValueError as exc:
+                error = exc
+            if chunk:
+                self.records_seen += len(chunk)
+                for result in self._import_document_chunk(chunk, seen):
+                    result['index'] = index
+                    index += 1
+                    yield result
+            if error is not None:
+                raise error
+            if len(chunk) < self.batch_size:
+                return
+
+    def _import_document_chunk(self, chunk, seen):
+        entity = self.DOCUMENT_ENTITY
+        results = [None] * len(chunk)
+
+        def fail(n, identifier, errors):
+            results[n] = {'identifier': identifier, 'status': 'error', 'errors': errors}
+            self.count(entity, 'errores')
+
+        with self.timer.stage('documentos:validación'):
+            parsed = []
+            for n, record in enumerate(chunk):
+                try:
+                    values, lines = parse_tender_document(record)
+                except (InvalidOperation, TypeError, ValueError) as exc:
+                    fail(n, record.get('identifier') if isinstance(record, dict) else None, _error_dict(exc))
+                    continue
+                key = normalize_identifier(values['identifier'])
+                if key in seen:
+                    fail(n, values['identifier'], {'identifier': ['Licitación repetida en la petición.']})
+                    continue
+                seen.add(key)
+                parsed.append((n, key, fingerprint(record), values, lines))
+            # Misma resolución (y caché) que las órdenes del feed.
+            resolved = identifiers.resolve_many(values['identifier'] for _, _, _, values, _ in parsed)
+            # Valores anteriores (cliente, fecha) de las existentes, para
+            # invalidar cachés y recalcular rollups y resúmenes al reemplazarlas.
+            previous = {
+                t.pk: t
+                for t in Tender.objects.filter(pk__in=[r.pk for r in resolved.values()]).only(
+                    *TENDER_KEY_FIELDS, 'normalized_identifier',
+                )
+            } if resolved else {}
+            stale = set()
+            for identifier, r in list(resolved.items()):
+                current = previous.get(r.pk)
+                if current is None or current.normalized_identifier != normalize_identifier(identifier):
+                    # Entrada de la caché obsoleta: otro proceso borró o
+                    # renombró la licitación. Se vuelve a resolver en la BD.
+                    identifiers.forget(identifier)
+                    del resolved[identifier]
+                    stale.add(identifier)
+            if stale:
+                found = Tender.objects.filter(
+                    normalized_identifier__in={normalize_identifier(i) for i in stale},
+                ).only(*TENDER_KEY_FIELDS, 'normalized_identifier')
+                by_key = {t.normalized_identifier: t for t in found}
+                identifiers.remember(by_key.values())
+                for identifier in stale:
+                    tender = by_key.get(normalize_identifier(identifier))
+                    if tender is not None:
+                        resolved[identifier] = identifiers.Resolved(tender.pk, tender.identifier)
+                        previous[tender.pk] = tender
+            self._load_products({line['sku'] for *_, lines in parsed for line in lines})
+            states = {
+                s.source_key: s
+                for s in ImportState.objects.filter(entity=entity, source_key__in=[p[1] for p in parsed])
+            } if parsed else {}
+
+            pending = []
+            for n, key, fp, values, lines in parsed:
+                existing = resolved.get(values['identifier'])
+                state = states.get(key)
+                if existing is not None and state is not None and state.fingerprint == fp and state.object_id == existing.pk:
+                    results[n] = {'identifier': existing.identifier, 'status': 'unchanged'}
+                    self.count(entity, 'omitidos')
+                    continue
+                unknown = sorted({line['sku'] for line in lines if line['sku'] not in self.products_by_sku})
+                if unknown:
+                    fail(n, values['identifier'], {'orders': [f'Producto no encontrado: {sku}' for sku in unknown]})
+                    continue
+                pending.append((n, key, fp, values, lines, existing))
+
+            items = []
+            for n, key, fp, values, lines, existing in pending:
+                # El cliente se asigna (y, si es nuevo, se crea) al escribir,
+                # dentro de la transacción del bloque.
+                tender = Tender(
+                    identifier=existing.identifier if existing else values['identifier'],
+                    awarded_date=values['awarded_date'],
+                )
+                if existing is not None:
+                    tender.pk = existing.pk
+                    tender._state.adding = False
+                orders = [
+                    Order(
+                        product=self.products_by_sku[line['sku']],
+                        quantity=line['quantity'],
+                        unit_price=line['unit_price'],
+                        unit_cost=line['unit_cost'],
+                    )
+                    for line in lines
+                ]
+                items.append((tender, orders))
+            # La unicidad la garantiza la resolución por identificador.
+            errors = Tender.objects.bulk_validate(items, validate_unique=False)
+            valid = []
+            for i, ((n, key, fp, values, _, existing), (tender, orders)) in enumerate(zip(pending, items)):
+                if i in errors:
+                    fail(n, tender.identifier, _error_dict(errors[i]))
+                else:
+                    valid.append((n, key, fp, tender, orders, existing is not None, values['client']))
+        if not valid:
+            return results
+
+        updates = [row[3] for row in valid if row[5]]
+        creates = [row[3] for row in valid if not row[5]]
+        loaded = []
+        try:
+            with self.timer.stage('documentos:escritura'), transaction.atomic():
+                # Los clientes nuevos se crean en la misma transacción: si el
+                # bloque se revierte no quedan clientes huérfanos.
+                loaded = self._load_clients({row[6] for row in valid if row[6]})
+                for row in valid:
+                    row[3].client_obj = self.clients_by_name[row[6]] if row[6] else None
+                # Las órdenes anteriores se borran antes de cambiar fecha o
+                # cliente, así su refresco de totales/rollups cubre los valores
+                # previos; el `bulk_create` de las nuevas cubre los actuales.
+                if updates:
+                    Order.objects.filter(tender__in=[t.pk for t in updates]).delete()
+                    Tender.objects.bulk_update(updates, ['client_obj', 'awarded_date'])
+                Tender.objects.bulk_create(creates)
+                lines = []
+                for row in valid:
+                    for order in row[4]:
+                        order.tender = row[3]
+                    lines.extend(row[4])
+                Order.objects.bulk_create(lines)
+                # Las altas y los cambios de cliente o fecha no emiten
+                # `post_save` (p.ej. para el número de licitaciones por cliente).
+                tenders_changed.send(
+                    sender=Tender,
+                    queryset=Tender.objects.filter(pk__in=[row[3].pk for row in valid]),
+                    previous=[previous[row[3].pk] for row in valid if row[5]],
+                )
+                self._save_states(entity, [(row[1], row[2], row[3].pk) for row in valid])
+        except Exception as exc:
+            # Revertido el bloque, los clientes cargados en él pueden no existir.
+            for name in loaded:
+                self.clients_by_name.pop(name, None)
+            if not isinstance(exc, IntegrityError):
+                raise
+            # Otra escritura concurrente creó la misma licitación: el bloque
+            # se revierte entero y el cliente puede reintentarlo.
+            for row in valid:
+                fail(row[0], row[3].identifier, {'__all__': [f'Conflicto al guardar, reintente: {exc}']})
+            return results
+        identifiers.remember(row[3] for row in valid)
+        for n, _, _, tender, _, updated, _ in valid:
+            results[n] = {'identifier': tender.identifier, 'status': 'updated' if updated else 'created'}
+        self.count(entity, 'actualizados', len(updates))
+        self.count(entity, 'insertados', len(creates))
+        self.timer.add_rows('documentos:escritura', len(lines))
+        return results
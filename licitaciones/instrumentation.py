@@ -0,0 +1,162 @@
+"""Instrumentación por petición: tiempo total, tiempo y número de consultas.
+
+`PerfMiddleware` mide una fracción de las peticiones (`PERF_SAMPLE_RATE`,
+entre 0 y 1) y, para cada una:
+
+- añade la cabecera `Server-Timing` (`total`, `db` y `app`), visible en
+  las herramientas de desarrollo del navegador;
+- registra una línea JSON en el logger ``licitaciones.perf``;
+- la guarda en un buffer circular del proceso (`PERF_BUFFER_SIZE`
+  entradas) que muestra `/debug/perf/` (sólo staff).
+
+Las consultas se cuentan con `connection.execute_wrapper`; el tiempo `db`
+cubre su ejecución, no la lectura de las filas (`fetchmany`), que queda
+en `app`. Las que se repiten con el mismo SQL (distintos parámetros) son
+el síntoma de un N+1, p.ej. un `total_margin()` por fila; se informan las
+más repetidas y las idénticas (mismo SQL y parámetros), que indican
+trabajo duplicado.
+
+Con `PERF_SAMPLE_RATE = 0` (por defecto) el middleware se descarta al
+arrancar (`MiddlewareNotUsed`) y no tiene coste. Es síncrono: bajo ASGI
+las consultas de las vistas `async` se ejecutan en el hilo de
+`sync_to_async`, que es el mismo desde el que se llama al middleware.
+"""
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+PERF_SAMPLE_RATE = getattr(settings, 'PERF_SAMPLE_RATE', 0.0)
+PERF_BUFFER_SIZE = getattr(settings, 'PERF_BUFFER_SIZE', 500)
+# SQL más repetidos que se guardan por petición.
+TOP_REPEATED = 5
+
+logger = logging.getLogger('licitaciones.perf')
+
+_buffer = deque(maxlen=PERF_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+
+
+class QueryRecorder:
+    """`execute_wrapper` que acumula el número, el tiempo y el SQL de las consultas."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.calls = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+            self.calls[(sql, repr(params))] += 1
+
+    def repeated(self):
+        """`[{'sql', 'count'}]` de los SQL ejecutados más de una vez."""
+        return [
+            {'sql': sql, 'count': n}
+            for sql, n in self.statements.most_common(TOP_REPEATED)
+            if n > 1
+        ]
+
+    def duplicates(self):
+        """Ejecuciones de más con SQL y parámetros idénticos."""
+        return sum(n - 1 for n in self.calls.values())
+
+
+def _response_size(response):
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+def record(entry):
+    with _buffer_lock:
+        _buffer.append(entry)
+
+
+def recent(limit=None):
+    """Entradas del buffer, de la más reciente a la más antigua."""
+    with _buffer_lock:
+        entries = list(_buffer)
+    entries.reverse()
+    return entries[:limit] if limit else entries
+
+
+def clear():
+    with _buffer_lock:
+        _buffer.clear()
+
+
+def summary(entries):
+    """Resumen por vista: peticiones, p50/p95 del tiempo total y consultas medias."""
+    by_view = {}
+    for entry in entries:
+        by_view.setdefault(entry['view'], []).append(entry)
+    result = {}
+    for view, items in sorted(by_view.items()):
+        totals = sorted(e['total_ms'] for e in items)
+        result[view] = {
+            'requests': len(items),
+            'p50_ms': round(statistics.median(totals), 2),
+            'p95_ms': totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+            'avg_queries': round(sum(e['queries'] for e in items) / len(items), 1),
+            'max_queries': max(e['queries'] for e in items),
+        }
+    return result
+
+
+class PerfMiddleware:
+    def __init__(self, get_response):
+        if PERF_SAMPLE_RATE <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PERF_SAMPLE_RATE < 1 and random.random() >= PERF_SAMPLE_RATE:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = recorder.seconds * 1000
+
+        match = request.resolver_match
+        entry = {
+            'time': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else '',
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'db_ms': round(db_ms, 2),
+            'queries': recorder.count,
+            'duplicate_queries': recorder.duplicates(),
+            'repeated': recorder.repeated(),
+            'response_bytes': _response_size(response),
+        }
+        record(entry)
+        logger.info(json.dumps(entry, default=str))
+        response['Server-Timing'] = (
+            f'total;dur={total_ms:.1f}, db;dur={db_ms:.1f};desc="{recorder.count} queries", '
+            f'app;dur={total_ms - db_ms:.1f}'
+        )
+        return response
@@ -0,0 +1,167 @@
+"""Opciones `(id, etiqueta)` de clientes y productos, cacheadas por proceso.
+
+Los formularios (`TenderForm`, cada fila de `OrderFormSet`) y el admin no
+incrustan un `<select>` con la tabla entera: muestran un campo de texto
+que consulta `/api/lookups/<tipo>/?q=` y sólo necesitan la etiqueta del
+valor elegido. Ambas cosas salen de una `LookupTable` por tipo que se
+construye una vez por proceso y que comparten todas las filas y
+peticiones.
+
+Cada tabla guarda la *versión* con la que se construyó. La versión vive
+en la caché `LOOKUP_CACHE_ALIAS` y se renueva al escribir clientes o
+productos (`post_save`/`post_delete` y `catalog_changed` para las
+operaciones masivas del importador). Con una caché compartida (`CACHE_URL`)
+todos los procesos reconstruyen su tabla en la siguiente consulta; con la
+caché en memoria por defecto sólo el proceso que escribió se entera. Por
+eso además ninguna tabla se usa más de `LOOKUP_MAX_AGE` segundos: lo escrito
+por otro worker o por `import_sample_data` aparece, como mucho, tras ese
+plazo.
+"""
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Client, Product
+from .signals import catalog_changed
+
+
+LOOKUP_CACHE_ALIAS = getattr(settings, 'LOOKUP_CACHE_ALIAS', 'default')
+AUTOCOMPLETE_LIMIT = getattr(settings, 'AUTOCOMPLETE_LIMIT', 20)
+AUTOCOMPLETE_MAX_LIMIT = 100
+# Antigüedad máxima (segundos) de una tabla aunque su versión no cambie.
+LOOKUP_MAX_AGE = getattr(settings, 'LOOKUP_MAX_AGE', 60)
+
+
+def _client_rows():
+    return Client.objects.order_by().values_list('pk', 'name').iterator()
+
+
+def _product_rows():
+    for pk, name, sku in Product.objects.order_by().values_list('pk', 'name', 'sku').iterator():
+        yield pk, f'{name} ({sku})', sku
+
+
+# tipo -> (modelo, filas `(id, etiqueta, *claves de búsqueda extra)`)
+KINDS = {
+    'clients': (Client, _client_rows),
+    'products': (Product, _product_rows),
+}
+
+
+def fold(text):
+    """Clave de búsqueda: minúsculas y sin tildes ("Clínica" -> "clinica")."""
+    decomposed = unicodedata.normalize('NFKD', str(text).casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _words(text):
+    return re.findall(r'\w+', fold(text))
+
+
+class LookupTable:
+    """Etiquetas por id y un índice ordenado de prefijos para autocompletar.
+
+    Se indexa la etiqueta desde el comienzo de cada palabra (sin tildes ni
+    puntuación), de modo que "norte" encuentra "Hospital Norte", y las
+    claves extra (el SKU).
+    """
+
+    def __init__(self, rows):
+        self.labels = {}
+        index = []
+        for pk, label, *keys in rows:
+            self.labels[pk] = label
+            words = _words(label)
+            index.extend((' '.join(words[i:]), pk) for i in range(len(words)))
+            index.extend((' '.join(_words(key)), pk) for key in keys)
+        index.sort()
+        self.keys = [key for key, _ in index]
+        self.ids = [pk for _, pk in index]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def label(self, pk):
+        try:
+            return self.labels.get(int(pk), '')
+        except (TypeError, ValueError):
+            return ''
+
+    def search(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        """`[(id, etiqueta)]` cuyas palabras o claves empiezan por `prefix`."""
+        prefix = ' '.join(_words(prefix))
+        if not prefix:
+            return []
+        found = {}
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and len(found) < limit and self.keys[i].startswith(prefix):
+            found.setdefault(self.ids[i], None)
+            i += 1
+        return sorted(((pk, self.labels[pk]) for pk in found), key=lambda item: fold(item[1]))
+
+    def choices(self):
+        """Todas las opciones ordenadas por etiqueta, para un `<select>` si se quiere."""
+        return sorted(self.labels.items(), key=lambda item: fold(item[1]))
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def _cache():
+    return caches[LOOKUP_CACHE_ALIAS]
+
+
+def _version_key(kind):
+    return f'lookup-version:{kind}'
+
+
+def table(kind):
+    """`LookupTable` vigente de `kind` ('clients' o 'products')."""
+    key = _version_key(kind)
+    version = _cache().get(key) or _cache().get_or_set(key, time.time(), None)
+
+    def fresh(current):
+        return current is not None and current[0] == version and time.monotonic() - current[1] < LOOKUP_MAX_AGE
+
+    current = _tables.get(kind)
+    if fresh(current):
+        return current[2]
+    with _tables_lock:
+        current = _tables.get(kind)
+        if not fresh(current):
+            _, rows = KINDS[kind]
+            current = _tables[kind] = (version, time.monotonic(), LookupTable(rows()))
+    return current[2]
+
+
+def _bump(kinds):
+    now = time.time()
+    _cache().set_many({_version_key(kind): now for kind in kinds}, None)
+
+
+def invalidate(*kinds):
+    # Como en `caching.invalidate`: ahora y al confirmar la transacción.
+    _bump(kinds)
+    transaction.on_commit(lambda: _bump(kinds))
+
+
+def _kind_of(model):
+    return next(kind for kind, (m, _) in KINDS.items() if m is model)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(catalog_changed)
+def _catalog_written(sender, **kwargs):
+    invalidate(_kind_of(sender))
@@ -0,0 +1,58 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from licitaciones import reporting
+from licitaciones.benchdata import seed_data
+from licitaciones.models import Order
+
+
+def per_instance():
+    """Camino actual: una instancia y aritmética `Decimal` por orden."""
+    margins, percentages, by_tender, by_client = {}, {}, {}, {}
+    for o in Order.objects.select_related('tender').order_by().iterator(chunk_size=reporting.CHUNK_SIZE):
+        margin = o.margin()
+        margins[o.pk] = margin
+        percentages[o.pk] = o.margin_percentage
+        by_tender[o.tender_id] = by_tender.get(o.tender_id, Decimal(0)) + margin
+        client_id = o.tender.client_obj_id
+        by_client[client_id] = by_client.get(client_id, Decimal(0)) + margin
+    return margins, percentages, by_tender, by_client
+
+
+def engine():
+    report = reporting.margin_report()
+    return report.line_margins(), report.margin_percentages(), report.tender_totals(), report.client_totals()
+
+
+class Command(BaseCommand):
+    help = 'Compara el cálculo de márgenes por instancia con el motor en bloque (licitaciones.reporting)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-orders', type=int, default=0, help='Genera antes N órdenes de benchmark.')
+        parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por camino (por defecto %(default)s).')
+
+    def handle(self, *args, **options):
+        if options['seed_orders']:
+            counts = seed_data(options['seed_orders'], log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f'Datos generados: {counts}'))
+
+        backend = 'numpy' if reporting.np is not None else 'enteros de Python (instala numpy para vectorizar)'
+        self.stdout.write(f'Órdenes: {Order.objects.count()}; motor: {backend}')
+        results = {}
+        for name, fn in (('por instancia', per_instance), ('motor en bloque', engine)):
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                results[name] = fn()
+                timings.append(time.perf_counter() - start)
+            results[name + ':t'] = min(timings)
+            self.stdout.write(f'{name}: mejor de {len(timings)} = {min(timings) * 1000:.1f} ms')
+
+        labels = ('márgenes', 'porcentajes', 'totales por licitación', 'totales por cliente')
+        for label, expected, got in zip(labels, results['por instancia'], results['motor en bloque']):
+            if expected != got:
+                raise CommandError(f'El motor no coincide con Order en {label}.')
+        speedup = results['por instancia:t'] / results['motor en bloque:t'] if results['motor en bloque:t'] else 0
+        self.stdout.write(self.style.SUCCESS(f'Resultados idénticos; aceleración x{speedup:.1f}'))
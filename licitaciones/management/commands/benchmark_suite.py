@@ -0,0 +1,193 @@
+import io
+import json
+import statistics
+import time
+import tracemalloc
+from itertools import combinations
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client as HttpClient
+from django.test.utils import CaptureQueriesContext
+
+from licitaciones.benchdata import FILTER_GROUPS, PREFIX, sample_feeds, seed_data, serve_feeds
+from licitaciones.models import ClientSummary, Tender
+
+
+PAGE_SIZE = 100
+# Licitaciones por petición del escenario `tender_batch`.
+BATCH_SIZE = 100
+BENCH_ADMIN = 'bench-admin'
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Suite de benchmarks de las vistas y la importación: latencias, consultas y memoria frente a una línea base'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-orders', type=int, default=0, help='Genera antes N órdenes de benchmark (10k a 5M).')
+        parser.add_argument('--seed-tenders', type=int, help='Licitaciones a generar (por defecto 1 cada 10 órdenes).')
+        parser.add_argument('--seed-clients', type=int, help='Clientes a generar (por defecto 1 cada 50 licitaciones).')
+        parser.add_argument('--seed-products', type=int, help='Productos a generar (por defecto hasta 1000).')
+        parser.add_argument('--repeat', type=int, default=10, help='Repeticiones por escenario (por defecto %(default)s).')
+        parser.add_argument('--import-orders', type=int, default=5000, help='Órdenes del feed de import_sample_data (por defecto %(default)s).')
+        parser.add_argument('--only', action='append', help='Sólo los escenarios cuyo nombre empiece así (repetible).')
+        parser.add_argument('--baseline', help='JSON de una ejecución anterior: falla si algún escenario empeora.')
+        parser.add_argument('--save-baseline', help='Guarda los resultados como línea base en este JSON.')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Empeoramiento relativo admitido en latencia y memoria (por defecto %(default)s).')
+        parser.add_argument('--min-delta-ms', type=float, default=5.0, help='Diferencia de p95 que se ignora como ruido (por defecto %(default)s ms).')
+        parser.add_argument('--min-delta-kb', type=float, default=512, help='Diferencia de memoria que se ignora como ruido (por defecto %(default)s KB).')
+
+    def handle(self, *args, **options):
+        if options['seed_orders']:
+            counts = seed_data(
+                options['seed_orders'],
+                tenders=options['seed_tenders'],
+                clients=options['seed_clients'],
+                products=options['seed_products'],
+                log=self.stdout.write,
+            )
+            self.stdout.write(self.style.SUCCESS(f'Datos generados: {counts}'))
+
+        self.http = HttpClient()
+        self.options = options
+        results = {}
+        for name, run in self.scenarios():
+            if options['only'] and not any(name.startswith(prefix) for prefix in options['only']):
+                continue
+            results[name] = self.measure(run, options['repeat'])
+            r = results[name]
+            self.stdout.write(
+                f"{name}: p50 {r['p50_ms']:.2f} ms, p95 {r['p95_ms']:.2f} ms, "
+                f"{r['queries']} consultas, pico {r['peak_kb']:.0f} KB"
+            )
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as fh:
+                json.dump({'scenarios': results}, fh, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Línea base guardada en {options['save_baseline']}"))
+        if options['baseline']:
+            with open(options['baseline']) as fh:
+                baseline = json.load(fh)['scenarios']
+            regressions = self.compare(results, baseline)
+            if regressions:
+                raise CommandError('Regresiones frente a la línea base:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Sin regresiones frente a la línea base.'))
+
+    # -- escenarios -----------------------------------------------------
+
+    def get(self, path, params=None):
+        def run():
+            response = self.http.get(path, params or {})
+            if response.status_code != 200:
+                raise CommandError(f'{path} respondió {response.status_code}.')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return run
+
+    def scenarios(self):
+        groups = list(FILTER_GROUPS)
+        for size in range(len(groups) + 1):
+            for combo in combinations(groups, size):
+                params = {'page_size': PAGE_SIZE}
+                for group in combo:
+                    params.update(FILTER_GROUPS[group])
+                yield 'tender_list[' + '+'.join(combo or ('sin filtros',)) + ']', self.get('/api/tenders/', params)
+        yield 'tender_list[q]', self.get('/api/tenders/', {'q': f'{PREFIX}Cliente 00000', 'page_size': PAGE_SIZE})
+        yield 'tender_list[html]', self.get('/tenders/')
+
+        tender = Tender.objects.order_by('-order_count', 'pk').first()
+        if tender:
+            yield 'tender_detail', self.get(f'/tenders/{tender.identifier}/')
+        ids = list(Tender.objects.order_by('-awarded_date', '-id').values_list('identifier', flat=True)[:BATCH_SIZE])
+        if ids:
+            yield 'tender_batch', self.get('/api/tenders/batch/', {'ids': ','.join(ids)})
+        yield 'client_list', self.get('/clients/')
+        yield 'client_list[q]', self.get('/clients/', {'q': f'{PREFIX}Cliente 00001'})
+        yield 'client_list[sort=margin]', self.get('/clients/', {'sort': '-margin'})
+        # El cliente con más licitaciones (`--seed-clients 1` las junta todas).
+        client_id = ClientSummary.objects.order_by('-tender_count', 'client_id').values_list('client_id', flat=True).first()
+        if client_id:
+            yield 'client_detail', self.get(f'/clients/{client_id}/')
+
+        admin = get_user_model().objects.filter(username=BENCH_ADMIN).first()
+        if admin is None:
+            admin = get_user_model().objects.create_superuser(BENCH_ADMIN, password=None)
+        self.http.force_login(admin)
+        yield 'admin[tender changelist]', self.get('/admin/licitaciones/tender/')
+        yield 'admin[order changelist]', self.get('/admin/licitaciones/order/')
+
+        if self.options['import_orders']:
+            yield 'import_sample_data[bulk]', self.run_import
+
+    def run_import(self):
+        """Importación por lotes desde un servidor HTTP local; se revierte."""
+        with serve_feeds(self.feeds) as base:
+            try:
+                with transaction.atomic():
+                    call_command(
+                        'import_sample_data', '--bulk', '--no-cache', '--force',
+                        products_file=f'{base}/products', tenders_file=f'{base}/tenders', orders_file=f'{base}/orders',
+                        stdout=io.StringIO(), stderr=io.StringIO(),
+                    )
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    @property
+    def feeds(self):
+        if not hasattr(self, '_feeds'):
+            self._feeds = sample_feeds(self.options['import_orders'])
+        return self._feeds
+
+    # -- medición -------------------------------------------------------
+
+    def measure(self, run, repeat):
+        """Latencias de `repeat` ejecuciones y, aparte, consultas y memoria.
+
+        Cada ejecución empieza con la caché de respuestas vacía, así que se
+        mide el camino que consulta la base de datos.
+        """
+        timings = []
+        for _ in range(max(repeat, 1)):
+            cache.clear()
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) * 1000)
+        # `tracemalloc` ralentiza la ejecución: se mide en una pasada aparte.
+        cache.clear()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        timings.sort()
+        return {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            'queries': len(queries.captured_queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def compare(self, results, baseline):
+        tolerance = 1 + self.options['tolerance']
+        regressions = []
+        for name, base in baseline.items():
+            current = results.get(name)
+            if current is None:
+                continue
+            if current['queries'] > base['queries']:
+                regressions.append(f"{name}: {current['queries']} consultas (antes {base['queries']})")
+            if current['p95_ms'] > base['p95_ms'] * tolerance and current['p95_ms'] - base['p95_ms'] > self.options['min_delta_ms']:
+                regressions.append(f"{name}: p95 {current['p95_ms']:.2f} ms (antes {base['p95_ms']:.2f} ms)")
+            if current['peak_kb'] > base['peak_kb'] * tolerance and current['peak_kb'] - base['peak_kb'] > self.options['min_delta_kb']:
+                regressions.append(f"{name}: pico {current['peak_kb']:.0f} KB (antes {base['peak_kb']:.0f} KB)")
+        return regressions
@@ -0,0 +1,118 @@
+import statistics
+import time
+from itertools import combinations
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from django.db.models import Sum
+from django.http import QueryDict
+
+from licitaciones.benchdata import FILTER_GROUPS, seed_data
+from licitaciones.models import Tender, Order, Client, MarginRollup
+from licitaciones.pagination import before_key
+from licitaciones.views import filter_tenders
+
+
+PAGE_SIZE = 100
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Muestra planes (EXPLAIN) y latencias de las consultas de tender_list/client_detail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-orders', type=int, default=0, help='Genera antes N órdenes de benchmark (p.ej. 1000000).')
+        parser.add_argument('--repeat', type=int, default=10, help='Repeticiones por escenario (por defecto %(default)s).')
+        parser.add_argument('--compare', action='store_true', help='Mide también sin los índices de 0007 (en una transacción que se revierte).')
+        parser.add_argument('--no-explain', action='store_true', help='No imprime los planes, sólo las latencias.')
+
+    def handle(self, *args, **options):
+        if options['seed_orders']:
+            counts = seed_data(options['seed_orders'], log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f'Datos generados: {counts}'))
+
+        self.repeat = options['repeat']
+        self.explain = not options['no_explain']
+        if options['compare']:
+            self.stdout.write(self.style.MIGRATE_HEADING('== Antes (sin índices de listado) =='))
+            try:
+                with transaction.atomic():
+                    self.drop_list_indexes()
+                    self.run_scenarios()
+                    raise _Rollback
+            except _Rollback:
+                pass
+            self.stdout.write(self.style.MIGRATE_HEADING('== Después (con índices) =='))
+        self.run_scenarios()
+
+    def drop_list_indexes(self):
+        """Vuelve temporalmente al esquema previo: sólo índices de FK.
+
+        Se ejecuta el SQL directamente (sin entrar en el schema editor, que
+        en SQLite no puede usarse dentro de una transacción).
+        """
+        editor = connection.schema_editor()
+        quote = connection.ops.quote_name
+        statements = []
+        for model in (Tender, Order):
+            for index in model._meta.indexes:
+                statements.append(editor.sql_delete_index % {'table': quote(model._meta.db_table), 'name': quote(index.name)})
+        statements.append(models.Index(fields=['client_obj'], name='bench_tender_client_fk').create_sql(Tender, editor))
+        statements.append(models.Index(fields=['tender'], name='bench_order_tender_fk').create_sql(Order, editor))
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(str(sql))
+
+    def scenarios(self):
+        groups = list(FILTER_GROUPS)
+        for size in range(len(groups) + 1):
+            for combo in combinations(groups, size):
+                params = QueryDict(mutable=True)
+                for name in combo:
+                    params.update(FILTER_GROUPS[name])
+                rows = filter_tenders(params).values('id', 'identifier', 'awarded_date', 'total_margin', 'client_obj__name')
+                yield 'tender_list[' + '+'.join(combo or ('sin filtros',)) + ']', rows.order_by('-awarded_date', '-id')[:PAGE_SIZE + 1]
+
+        # Búsqueda de texto (`q`): índice de trigramas / FTS5, sin recorrer la tabla.
+        search = filter_tenders({'q': 'Cliente 000001'}).values('id', 'identifier', 'awarded_date', 'total_margin', 'client_obj__name')
+        yield 'tender_list[q]', search.order_by('-awarded_date', '-id')[:PAGE_SIZE + 1]
+
+        # Página por cursor a mitad de la tabla: mismo coste que la primera.
+        total = Tender.objects.count()
+        if total:
+            date, pk = Tender.objects.order_by('-awarded_date', '-id').values_list('awarded_date', 'id')[total // 2]
+            deep = filter_tenders({}).filter(before_key(date, pk))
+            yield 'tender_list[cursor profundo]', deep.order_by('-awarded_date', '-id')[:PAGE_SIZE + 1]
+
+        client = Client.objects.filter(tenders__isnull=False).order_by('pk').first()
+        if client:
+            yield 'client_detail', client.tenders.order_by('-awarded_date')[:PAGE_SIZE]
+
+        # Analítica de márgenes: agrega rollups diarios, no `Order`.
+        yield 'margin_analytics[month,client]', (
+            MarginRollup.objects.values('month', 'client_id', 'client__name')
+            .annotate(total=Sum('margin')).order_by('month', 'client_id', 'client__name')
+        )
+
+        tender = Tender.objects.order_by('-order_count').first()
+        if tender:
+            yield 'tender_totals', Tender.objects.filter(pk=tender.pk).with_computed_totals().values('computed_margin')
+
+    def run_scenarios(self):
+        for name, qs in self.scenarios():
+            timings = []
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                rows = len(list(qs.all()))
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f'{name}: {rows} filas, mediana {statistics.median(timings):.2f} ms, p95 {p95:.2f} ms'
+            )
+            if self.explain:
+                for line in qs.explain().splitlines():
+                    self.stdout.write(f'    {line}')
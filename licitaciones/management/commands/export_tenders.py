@@ -0,0 +1,62 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from licitaciones import exports
+from licitaciones.views import filter_tenders
+
+
+# Opciones del comando que se pasan como filtros de `tender_list`.
+FILTERS = ('q', 'client', 'start_date', 'end_date', 'min_margin', 'max_margin')
+
+
+class Command(BaseCommand):
+    help = 'Exporta licitaciones y sus órdenes a Parquet, Arrow o CSV (en streaming, memoria constante)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Archivo de salida (`-` para stdout, sólo CSV).')
+        parser.add_argument(
+            '--format',
+            choices=('parquet', 'arrow', 'csv'),
+            help='Formato; por defecto se deduce de la extensión (.parquet, .arrow/.feather, .csv).',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=exports.EXPORT_CHUNK_SIZE,
+            help='Filas por lectura del cursor y por row group (por defecto %(default)s).',
+        )
+        for name in FILTERS:
+            parser.add_argument(f'--{name.replace("_", "-")}', dest=name, default='', help=f'Filtro `{name}` de tender_list.')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or self.guess_format(output)
+        if fmt != 'csv' and exports.pyarrow is None:
+            raise CommandError('Parquet/Arrow requieren pyarrow (pip install pyarrow); usa --format csv.')
+        if fmt != 'csv' and output == '-':
+            raise CommandError('Parquet/Arrow necesitan un archivo de salida.')
+
+        params = {name: options[name] for name in FILTERS}
+        rows = exports.export_rows(filter_tenders(params), chunk_size=options['chunk_size'])
+        start = time.perf_counter()
+        if fmt == 'csv':
+            if output == '-':
+                count = exports.write_csv(rows, sys.stdout)
+            else:
+                with open(output, 'w', newline='', encoding='utf-8') as out:
+                    count = exports.write_csv(rows, out)
+        else:
+            count = exports.write_arrow(rows, output, fmt=fmt, batch_size=options['chunk_size'])
+        elapsed = time.perf_counter() - start
+        rate = count / elapsed if elapsed else 0
+        self.stderr.write(self.style.SUCCESS(f'{count} filas exportadas ({fmt}) en {elapsed:.1f} s ({rate:.0f} filas/s).'))
+
+    def guess_format(self, output):
+        lowered = output.lower()
+        if lowered.endswith('.parquet'):
+            return 'parquet'
+        if lowered.endswith(('.arrow', '.feather')):
+            return 'arrow'
+        return 'csv'
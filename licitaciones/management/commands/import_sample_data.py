@@ -1,59 +1,168 @@
-import json
-from decimal import Decimal
-from urllib.request import urlopen
+import time
+from collections import Counter
+from contextlib import ExitStack
+
 from django.conf import settings
 
 from django.core.management.base import BaseCommand
 from django.core.exceptions import ValidationError
 
-from licitaciones.models import Tender, Product, Order, Client
+from licitaciones.feeds import DEFAULT_RETRIES, DEFAULT_TIMEOUT, fetch_all, is_url, open_feed
+from licitaciones import identifiers, metrics
+from licitaciones.importer import BulkImporter, DEFAULT_BATCH_SIZE, normalize_identifier, parse_order, parse_product
+from licitaciones.models import Tender, Product, Order, Client, ImportState
 
 
 TENDER_URL = getattr(settings, 'SAMPLE_TENDER_URL', 'https://kaiken.up.railway.app/webhook/tender-sample')
 PRODUCT_URL = getattr(settings, 'SAMPLE_PRODUCT_URL', 'https://kaiken.up.railway.app/webhook/product-sample')
 ORDER_URL = getattr(settings, 'SAMPLE_ORDER_URL', 'https://kaiken.up.railway.app/webhook/order-sample')
-
-
-def fetch_json(url: str):
-    with urlopen(url) as resp:
-        return json.load(resp)
+CACHE_DIR = getattr(settings, 'SAMPLE_CACHE_DIR', None)
 
 
 class Command(BaseCommand):
     help = 'Importa datos de ejemplo desde los endpoints proporcionados'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Usa el pipeline por lotes (bulk_create/upsert) en lugar de fila a fila.',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Modo por lotes que omite los registros sin cambios según su huella de contenido (implica --bulk).',
+        )
+        parser.add_argument(
+            '--reset-state',
+            action='store_true',
+            help='Borra las huellas de importaciones anteriores antes de empezar.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Filas por lote/transacción en modo --bulk (por defecto %(default)s).',
+        )
+        # Los feeds pueden leerse de un archivo local o de stdin (`-`) en
+        # lugar de descargarse de las URLs configuradas.
+        parser.add_argument('--products-file', help='Ruta (o `-` para stdin) del feed de productos.')
+        parser.add_argument('--tenders-file', help='Ruta (o `-` para stdin) del feed de licitaciones.')
+        parser.add_argument('--orders-file', '--file', dest='orders_file', help='Ruta (o `-` para stdin) del feed de órdenes.')
+        parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='Timeout por petición HTTP en segundos.')
+        parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help='Reintentos por descarga ante errores de red/5xx.')
+        parser.add_argument('--cache-dir', default=CACHE_DIR, help='Directorio de caché HTTP (ETag/Last-Modified) de los feeds.')
+        parser.add_argument('--no-cache', action='store_true', help='Ignora la caché HTTP y descarga todo.')
+        parser.add_argument('--force', action='store_true', help='Importa aunque ningún feed haya cambiado.')
+        parser.add_argument(
+            '--stats-file',
+            default=metrics.IMPORT_STATS_FILE,
+            help='JSON donde se guarda el resumen de la importación para /metrics (por defecto IMPORT_STATS_FILE).',
+        )
+
     def handle(self, *args, **options):
-        self.stdout.write('Descargando productos...')
-        products = fetch_json(PRODUCT_URL)
-        for p in products:
-            try:
-                sku = str(p.get('sku') or p.get('product_id'))
-                name = p.get('title') or p.get('name') or ''
-                cost = Decimal(str(p.get('cost', 0)))
-                # Si no hay precio de venta, aplicar un margen por defecto para cumplir la restricción price>cost
-                price_val = p.get('price') or p.get('unit_price')
-                if price_val is None:
-                    price = (cost * Decimal('1.20')).quantize(Decimal('0.01'))
+        sources = {
+            'productos': options['products_file'] or PRODUCT_URL,
+            'órdenes': options['orders_file'] or ORDER_URL,
+            'licitaciones': options['tenders_file'] or TENDER_URL,
+        }
+        cache_dir = None if options['no_cache'] else options['cache_dir']
+        start = time.perf_counter()
+        if options['reset_state']:
+            ImportState.objects.all().delete()
+        # Se inicializa todo antes del `try` para que el resumen de
+        # `--stats-file` se escriba también si falla la descarga o una etapa.
+        feeds, importer, records, skipped, failed = {}, None, None, False, True
+        try:
+            with ExitStack() as stack:
+                # Las URLs se descargan en paralelo, una sola vez cada una, a
+                # un archivo local; luego se recorren como generadores (las
+                # órdenes dos veces).
+                urls = {label: src for label, src in sources.items() if is_url(src)}
+                if urls:
+                    self.stdout.write(f"Descargando {', '.join(urls)}...")
+                downloaded = fetch_all(
+                    list(urls.values()),
+                    cache_dir=cache_dir,
+                    timeout=options['timeout'],
+                    retries=options['retries'],
+                )
+                for feed in downloaded:
+                    stack.enter_context(feed)
+                feeds.update(zip(urls, downloaded))
+                for label, src in sources.items():
+                    if label not in feeds:
+                        feeds[label] = stack.enter_context(open_feed(src))
+
+                skipped = not options['force'] and not any(f.changed for f in feeds.values())
+                if skipped:
+                    self.stdout.write(self.style.SUCCESS('Feeds sin cambios (304); se omite la importación.'))
                 else:
-                    price = Decimal(str(price_val))
+                    products, orders, tenders = feeds['productos'], feeds['órdenes'], feeds['licitaciones']
+                    if options['bulk'] or options['incremental']:
+                        importer = BulkImporter(
+                            batch_size=options['batch_size'],
+                            log_error=self.stderr.write,
+                            incremental=options['incremental'],
+                        )
+                        self.handle_bulk(importer, products, orders, tenders)
+                    else:
+                        records = self.handle_rows(products, orders, tenders)
+                    for feed in feeds.values():
+                        feed.commit()
+            failed = False
+        finally:
+            if options['stats_file']:
+                self.write_stats(
+                    options['stats_file'], feeds, importer, records, skipped, failed, time.perf_counter() - start,
+                )
+
+    def write_stats(self, path, feeds, importer, records, skipped, failed, elapsed):
+        """Resumen para `/metrics`, también si se omitió o falló la importación.
+
+        `feeds` marca cada feed como cambiado o no (304, servido desde la
+        caché); el modo fila a fila cuenta registros pero no mide etapas.
+        Si la importación falló, los registros y etapas son los que se
+        alcanzaron a procesar.
+        """
+        stats = {
+            'finished_at': time.time(),
+            'duration_seconds': elapsed,
+            'skipped': skipped,
+            'failed': failed,
+            'feeds': {label: 'changed' if feed.changed else 'unchanged' for label, feed in feeds.items()},
+            'fetch_seconds': {label: feed.seconds for label, feed in feeds.items() if is_url(feed.name)},
+            'records': {entity: dict(counts) for entity, counts in (records or {}).items()},
+            'stage_seconds': {},
+        }
+        if importer is not None:
+            stats['records'] = {entity: dict(counts) for entity, counts in importer.summary.items()}
+            stats['stage_seconds'] = {name: entry['seconds'] for name, entry in importer.timer.stages.items()}
+        metrics.write_import_stats(stats, path)
+
+    def handle_rows(self, products, orders, tenders):
+        """Importación fila a fila, validando cada registro con `save()`.
 
-                Product.objects.update_or_create(
-                    sku=sku,
-                    defaults={'name': name, 'price': price, 'cost': cost},
+        Devuelve ``{entidad: Counter(resultado)}``, como `BulkImporter.summary`.
+        """
+        summary = {entity: Counter() for entity in ('productos', 'licitaciones', 'órdenes')}
+        for p in products:
+            try:
+                values = parse_product(p)
+                _, created = Product.objects.update_or_create(
+                    sku=values.pop('sku'),
+                    defaults=values,
                 )
+                summary['productos']['insertados' if created else 'actualizados'] += 1
             except Exception as exc:
+                summary['productos']['errores'] += 1
                 self.stderr.write(f'Error importando producto {p!r}: {exc}')
 
-        # Descargar órdenes primero para saber qué tenders tienen productos
-        orders_data = fetch_json(ORDER_URL)
-        tender_to_orders = {}
-        for o in orders_data:
-            tid = o.get('tender_id') or o.get('tender_identifier')
-            key = str(tid or '').replace('-', '')
-            tender_to_orders.setdefault(key, []).append(o)
+        # Recorrer las órdenes primero para saber qué tenders tienen productos
+        tender_keys = {
+            normalize_identifier(o.get('tender_id') or o.get('tender_identifier')) for o in orders
+        }
 
-        self.stdout.write('Descargando licitaciones...')
-        tenders = fetch_json(TENDER_URL)
         for t in tenders:
             identifier = t.get('id') or t.get('identifier')
             client_name = t.get('client', '')
@@ -66,21 +175,23 @@ class Command(BaseCommand):
                 if client_name:
                     client_obj, _ = Client.objects.get_or_create(name=client_name)
 
-                # Si existe, actualizar y validar mediante save()
-                existing = Tender.objects.filter(identifier=identifier).first()
+                # Si existe (con o sin guiones), actualizar y validar mediante save()
+                existing = identifiers.get_tender(identifier)
                 if existing:
-                    existing.client = client_name
                     existing.client_obj = client_obj
                     existing.awarded_date = awarded_date
                     try:
                         existing.save()
                     except ValidationError as ve:
+                        summary['licitaciones']['errores'] += 1
                         self.stderr.write(f'Error validando licitación {identifier}: {ve}')
                         continue
+                    summary['licitaciones']['actualizados'] += 1
                 else:
                     # Sólo crear la tender si existen órdenes asociadas
-                    normalized = str(identifier or '').replace('-', '')
-                    if normalized not in tender_to_orders:
+                    normalized = normalize_identifier(identifier)
+                    if normalized not in tender_keys:
+                        summary['licitaciones']['omitidos'] += 1
                         self.stderr.write(f'Omitiendo licitación sin órdenes: {identifier}')
                         continue
 
@@ -88,73 +199,82 @@ class Command(BaseCommand):
                     try:
                         tender.save()
                     except ValidationError as ve:
+                        summary['licitaciones']['errores'] += 1
                         self.stderr.write(f'Error creando licitación {identifier}: {ve}')
                         continue
+                    summary['licitaciones']['insertados'] += 1
             except Exception as exc:
+                summary['licitaciones']['errores'] += 1
                 self.stderr.write(f'Error importando licitación {t!r}: {exc}')
 
-        self.stdout.write('Descargando órdenes...')
-        orders = fetch_json(ORDER_URL)
         for o in orders:
             try:
-                tender_identifier = o.get('tender_id') or o.get('tender_identifier')
-                product_id = o.get('product_id') or o.get('product_sku') or o.get('sku')
-                quantity = int(o.get('quantity', 1))
-
-                # Convertir y normalizar unit_price a 2 decimales para evitar
-                # problemas con representaciones en coma flotante que generan
-                # demasiados dígitos al validar el DecimalField.
-                raw_price = o.get('price') or o.get('unit_price') or 0
-                unit_price = Decimal(str(raw_price))
-                # Quantize to the Order.unit_price decimal places
-                unit_price = unit_price.quantize(Decimal('0.01'))
-
-                # Asegurar que el valor no exceda la precisión total del campo
-                field = Order._meta.get_field('unit_price')
-                max_digits = field.max_digits
-                decimal_places = field.decimal_places
-                int_digits = max_digits - decimal_places
-                # Construir el máximo permitido, por ejemplo '999... .99'
-                if decimal_places:
-                    max_allowed = Decimal(''.join(['9'] * int_digits) + '.' + ''.join(['9'] * decimal_places))
-                else:
-                    max_allowed = Decimal(''.join(['9'] * int_digits))
+                values = parse_order(o)
+                tender_identifier = values['tender_identifier']
+                product_id = values['product_id']
+                quantity = values['quantity']
+                unit_price = values['unit_price']
+                if values['clamped']:
+                    self.stderr.write(f'unit_price demasiado grande en orden {o.get("id", o)!r}: se ajusta a {unit_price}')
 
-                if unit_price.copy_abs() > max_allowed:
-                    self.stderr.write(f'unit_price demasiado grande en orden {o.get("id", o)!r}: {unit_price} -> se ajusta a {max_allowed}')
-                    unit_price = max_allowed
-
-                # Intentamos buscar por identifier exacto
-                try:
-                    tender = Tender.objects.get(identifier=tender_identifier)
-                except Tender.DoesNotExist:
-                    # Buscar por normalized_identifier si viene sin guiones
-                    normalized = str(tender_identifier or '').replace('-', '')
-                    try:
-                        tender = Tender.objects.get(normalized_identifier=normalized)
-                    except Tender.DoesNotExist:
-                        self.stderr.write(f'Tender no encontrada: {tender_identifier}')
-                        continue
-                product = Product.objects.get(sku=str(product_id))
+                # Con o sin guiones; las órdenes de una misma licitación
+                # la resuelven desde la caché.
+                tender = identifiers.resolve(tender_identifier)
+                if tender is None:
+                    summary['órdenes']['errores'] += 1
+                    self.stderr.write(f'Tender no encontrada: {tender_identifier}')
+                    continue
+                product = Product.objects.get(sku=product_id)
 
                 try:
                     Order.objects.create(
-                        tender=tender,
+                        tender_id=tender.pk,
                         product=product,
                         quantity=quantity,
                         unit_price=unit_price if unit_price > 0 else product.price,
                         unit_cost=product.cost,
                     )
                 except ValidationError as ve:
+                    summary['órdenes']['errores'] += 1
                     self.stderr.write(f"Error importando orden {o!r}: {ve.message_dict if hasattr(ve,'message_dict') else ve}")
                     continue
+                summary['órdenes']['insertados'] += 1
             except Tender.DoesNotExist:
+                summary['órdenes']['errores'] += 1
                 self.stderr.write(f'Tender no encontrada: {tender_identifier}')
             except Product.DoesNotExist:
+                summary['órdenes']['errores'] += 1
                 self.stderr.write(f'Product no encontrada: {product_id}')
             except Exception as exc:
+                summary['órdenes']['errores'] += 1
                 self.stderr.write(f'Error importando orden {o!r}: {exc}')
 
         self.stdout.write(self.style.SUCCESS('Importación finalizada.'))
+        return summary
+
+    def handle_bulk(self, importer, products, orders, tenders):
+        """Importación por lotes: pocas consultas por bloque en vez de por fila.
 
+        `importer` lo crea `handle` para que sus contadores lleguen al resumen
+        de la importación aunque una etapa falle.
+        """
+        start = time.perf_counter()
 
+        importer.import_products(products)
+        with importer.timer.stage('órdenes:claves'):
+            keys_with_orders = {
+                normalize_identifier(o.get('tender_id') or o.get('tender_identifier')) for o in orders
+            }
+        importer.import_tenders(tenders, keys_with_orders)
+        importer.import_orders(orders)
+
+        elapsed = time.perf_counter() - start
+        for line in importer.timer.report():
+            self.stdout.write(f'  {line}')
+        self.stdout.write('Resumen:')
+        for line in importer.summary_lines():
+            self.stdout.write(f'  {line}')
+        rows = importer.records_seen
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(f'Total: {rows} registros en {elapsed:.3f}s ({rate:,.0f} registros/s)')
+        self.stdout.write(self.style.SUCCESS('Importación finalizada.'))
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Servidores que se comparan con `--compare`: (nombre, módulo, worker class, entorno).
+PROFILES = (
+    ('WSGI (gunicorn sync)', 'kaiken.wsgi', 'sync', {'KAIKEN_ASYNC_VIEWS': '0'}),
+    ('ASGI (gunicorn + uvicorn)', 'kaiken.asgi', 'uvicorn.workers.UvicornWorker', {'KAIKEN_ASYNC_VIEWS': '0'}),
+    ('ASGI, vistas async', 'kaiken.asgi', 'uvicorn.workers.UvicornWorker', {'KAIKEN_ASYNC_VIEWS': '1'}),
+)
+# Perfiles de base de datos de `--db-profiles`: (nombre, entorno). El
+# primero es la configuración anterior (conexiones persistentes sin pool,
+# PRAGMAs por defecto de SQLite); el segundo, la de kaiken/settings.py.
+DB_PROFILES = (
+    ('sin ajustes de BD', {'DB_POOL_MAX_SIZE': '0', 'SQLITE_TUNING': '0'}),
+    ('pool + PRAGMAs', {}),
+)
+DEFAULT_PATHS = ('/api/tenders/', '/tenders/')
+
+
+async def fetch(host, port, path):
+    """GET con una conexión nueva; devuelve `(status, segundos)`."""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    status = int(data.split(b' ', 2)[1]) if data else 0
+    return status, time.perf_counter() - start
+
+
+async def slow_client(host, port, done, interval=0.5):
+    """Cliente lento: envía la petición byte a byte mientras dure la carga.
+
+    Con workers síncronos cada uno ocupa un worker entero; con ASGI sólo
+    una corrutina en espera.
+    """
+    while not done.is_set():
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            for byte in f'GET /api/tenders/ HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode():
+                if done.is_set():
+                    break
+                writer.write(bytes([byte]))
+                await writer.drain()
+                await asyncio.sleep(interval)
+            writer.close()
+        except OSError:
+            await asyncio.sleep(interval)
+
+
+async def run_load(host, port, paths, total, concurrency, bust_cache, slow_clients=0, timeout=10):
+    latencies, errors = [], 0
+    counter = iter(range(total))
+    done = asyncio.Event()
+    slow = [asyncio.create_task(slow_client(host, port, done)) for _ in range(slow_clients)]
+    await asyncio.sleep(1 if slow_clients else 0)
+
+    async def worker():
+        nonlocal errors
+        for n in counter:
+            path = paths[n % len(paths)]
+            if bust_cache:
+                path += ('&' if '?' in path else '?') + f'nocache={n}'
+            try:
+                status, elapsed = await asyncio.wait_for(fetch(host, port, path), timeout)
+            except (OSError, asyncio.TimeoutError):
+                errors += 1
+                continue
+            if status != 200:
+                errors += 1
+            else:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await asyncio.gather(*slow)
+    return latencies, errors, elapsed
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise CommandError(f'El servidor terminó al arrancar (código {proc.returncode}).')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError('El servidor no respondió a tiempo.')
+
+
+class Command(BaseCommand):
+    help = 'Prueba de carga HTTP (req/s y latencias p50/p99) de las vistas de lectura; compara WSGI síncrono con ASGI y los ajustes de BD'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Servidor a medir (por defecto %(default)s).')
+        parser.add_argument('--path', action='append', dest='paths', help='Ruta a pedir (repetible); por defecto /api/tenders/ y /tenders/.')
+        parser.add_argument('--requests', type=int, default=2000, help='Peticiones totales (por defecto %(default)s).')
+        parser.add_argument('--concurrency', type=int, default=100, help='Peticiones simultáneas (por defecto %(default)s).')
+        parser.add_argument('--bust-cache', action='store_true', help='Añade un parámetro distinto a cada petición para medir sin caché de respuestas.')
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='Conexiones adicionales que envían su petición muy lentamente durante la prueba.',
+        )
+        parser.add_argument('--timeout', type=float, default=10, help='Segundos máximos por petición (por defecto %(default)s).')
+        parser.add_argument(
+            '--compare', action='store_true',
+            help='Arranca gunicorn con WSGI (workers sync) y con ASGI (uvicorn), sin y con vistas async, en puertos libres y los mide.',
+        )
+        parser.add_argument('--workers', type=int, default=2, help='Workers de gunicorn con --compare (por defecto %(default)s).')
+        parser.add_argument(
+            '--db-profiles', action='store_true',
+            help='Con --compare, mide cada servidor sin y con los ajustes de BD (pool de PostgreSQL, PRAGMAs de SQLite).',
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or list(DEFAULT_PATHS)
+        load = (paths, options['requests'], options['concurrency'], options['bust_cache'], options['slow_clients'], options['timeout'])
+        if not options['compare']:
+            url = urlsplit(options['url'])
+            self.report(options['url'], *asyncio.run(run_load(url.hostname, url.port or 80, *load)))
+            return
+
+        if shutil.which('gunicorn') is None:
+            raise CommandError('--compare requiere gunicorn.')
+        db_profiles = DB_PROFILES if options['db_profiles'] else (('', {}),)
+        for name, app, worker_class, app_env in PROFILES:
+            if worker_class.startswith('uvicorn'):
+                try:
+                    import uvicorn  # noqa: F401
+                except ImportError:
+                    raise CommandError('El perfil ASGI requiere uvicorn (pip install uvicorn).')
+            for db_name, db_env in db_profiles:
+                port = _free_port()
+                cmd = [
+                    'gunicorn', app, '--bind', f'127.0.0.1:{port}', '--workers', str(options['workers']),
+                    # `--threads 1`: con hilos (gunicorn.conf.py) `sync` pasaría a `gthread`.
+                    '--worker-class', worker_class, '--threads', '1', '--log-level', 'warning',
+                ]
+                env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'kaiken.settings'), **app_env, **db_env)
+                proc = subprocess.Popen(cmd, cwd=settings.BASE_DIR, env=env, stdout=sys.stderr)
+                try:
+                    _wait_for_port(port, proc)
+                    self.report(f'{name}, {db_name}' if db_name else name, *asyncio.run(run_load('127.0.0.1', port, *load)))
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=30)
+
+    def report(self, name, latencies, errors, elapsed):
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f'{name}: ninguna petición completada ({errors} errores).'))
+            return
+        latencies.sort()
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(
+            f'{name}: {len(latencies) / elapsed:.0f} req/s, p50 {statistics.median(latencies) * 1000:.1f} ms, '
+            f'p99 {pct(0.99):.1f} ms, {errors} errores de {len(latencies) + errors}'
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from licitaciones.summaries import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde las licitaciones los totales por cliente (ClientSummary)'
+
+    def handle(self, *args, **options):
+        written = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Totales recalculados: {written} clientes.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from licitaciones.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde las órdenes los rollups diarios de margen (MarginRollup)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-days',
+            type=int,
+            default=31,
+            help='Días de adjudicación agregados por transacción (por defecto %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild(options['batch_days'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f'Rollups recalculados: {written} filas.'))
@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from licitaciones.models import Tender
+
+
+class Command(BaseCommand):
+    help = 'Recalcula (o verifica con --verify) los totales almacenados en Tender desde sus órdenes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Sólo compara los totales almacenados con los calculados y falla si hay diferencias.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Licitaciones por transacción al recalcular (por defecto %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            return self.verify()
+
+        batch_size = options['batch_size']
+        ids = Tender.objects.order_by('pk').values_list('pk', flat=True)
+        last_pk, updated = 0, 0
+        # Por rangos de pk para no bloquear toda la tabla en una transacción.
+        while True:
+            chunk = list(ids.filter(pk__gt=last_pk)[:batch_size])
+            if not chunk:
+                break
+            with transaction.atomic():
+                updated += Tender.objects.filter(pk__gte=chunk[0], pk__lte=chunk[-1]).refresh_totals()
+            last_pk = chunk[-1]
+        self.stdout.write(self.style.SUCCESS(f'Totales recalculados para {updated} licitaciones.'))
+
+    def verify(self):
+        # Se compara en Python con importes cuantizados: SQLite suma los
+        # decimales como REAL y una igualdad en SQL daría falsos positivos.
+        cents = Decimal('0.01')
+        rows = Tender.objects.with_computed_totals().values_list(
+            'identifier', 'total_margin', 'computed_margin', 'total_revenue', 'computed_revenue',
+            'order_count', 'computed_count',
+        )
+        bad = []
+        for identifier, margin, c_margin, revenue, c_revenue, count, c_count in rows.iterator(chunk_size=2000):
+            if (
+                Decimal(margin).quantize(cents) != Decimal(c_margin).quantize(cents)
+                or Decimal(revenue).quantize(cents) != Decimal(c_revenue).quantize(cents)
+                or count != c_count
+            ):
+                bad.append(identifier)
+        if bad:
+            sample = ', '.join(bad[:20])
+            raise CommandError(f'Totales desincronizados en {len(bad)} licitaciones (p.ej. {sample}). Ejecuta sin --verify para recalcular.')
+        self.stdout.write(self.style.SUCCESS('Totales de licitaciones consistentes.'))
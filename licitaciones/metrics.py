@@ -0,0 +1,361 @@
+"""Métricas en formato de texto de Prometheus (`/metrics`).
+
+Peticiones HTTP: contador y histograma de latencia por nombre de ruta
+(`tender_list`, `tender_detail`, ...), método y código, que registra
+`metrics_middleware`. Cada hilo incrementa su propio *shard* sin locks
+(sólo ese hilo lo escribe); al exportar se suman todos.
+
+Varios procesos (workers de gunicorn): con `METRICS_DIR` un hilo de cada
+proceso vuelca su instantánea a ``<METRICS_DIR>/web-<pid>.json`` cada
+`METRICS_FLUSH_INTERVAL` segundos si cambió (escritura atómica con
+`os.replace`) y `/metrics` suma las de todos los procesos. Cuando un
+worker termina, el hook `child_exit` de gunicorn (gunicorn.conf.py) llama a
+`retire`, que suma su fichero a ``dead.json`` y lo borra: los contadores no
+retroceden al reciclar workers y los ficheros no se acumulan. Si el hook no
+llegó a correr, el primer volcado de un proceso que reutiliza el pid
+retira antes el fichero del anterior en vez de pisarlo. Sin `METRICS_DIR`
+sólo se ven las del proceso que responde.
+
+Importación: `import_sample_data` guarda el resumen de su última
+ejecución (registros por entidad y resultado, duración de las descargas y
+de cada etapa) en `IMPORT_STATS_FILE`, que `/metrics` lee y expone como
+gauges.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso en desarrollo.
+    fcntl = None
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+
+METRICS_ENABLED = getattr(settings, 'METRICS_ENABLED', True)
+METRICS_DIR = getattr(settings, 'METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+IMPORT_STATS_FILE = getattr(settings, 'IMPORT_STATS_FILE', '') or (
+    os.path.join(METRICS_DIR, 'importer.json') if METRICS_DIR else ''
+)
+# Límites (segundos) de los buckets del histograma de latencia.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard:
+    """Métricas de un hilo: `requests[(vista, método, código)]` y `latency[vista]`."""
+
+    def __init__(self):
+        self.requests = Counter()
+        # vista -> [cuenta por bucket..., +Inf, suma]
+        self.latency = {}
+
+    def observe(self, view, method, status, seconds):
+        self.requests[(view, method, status)] += 1
+        row = self.latency.get(view)
+        if row is None:
+            row = self.latency[view] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        row[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        row[-1] += seconds
+
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+_dirty = False
+_flusher_pid = None
+# Fichero que ya escribió este proceso (`flush` retira antes el de un
+# proceso anterior con el mismo pid).
+_owned_file = None
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def observe_request(view, method, status, seconds):
+    """Registra una petición; con `METRICS_DIR`, el hilo de volcado la escribirá."""
+    global _dirty
+    _shard().observe(view, method, str(status), seconds)
+    if METRICS_DIR:
+        _dirty = True
+        if _flusher_pid != os.getpid():
+            _start_flusher()
+
+
+def _start_flusher():
+    """Arranca el hilo de volcado de este proceso (también tras un `fork`)."""
+    global _flusher_pid
+    with _shards_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+def _flush_loop():
+    global _dirty
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        if _dirty:
+            _dirty = False
+            try:
+                flush()
+            except OSError:
+                _dirty = True
+
+
+def snapshot():
+    """Suma de los shards de este proceso: ``{'requests': [...], 'latency': {...}}``.
+
+    `list(d.items())` copia el dict de una vez (bajo el GIL), así que se
+    puede leer mientras otros hilos lo incrementan.
+    """
+    with _shards_lock:
+        shards = list(_shards)
+    requests, latency = Counter(), {}
+    for shard in shards:
+        for key, n in list(shard.requests.items()):
+            requests[key] += n
+        for view, row in list(shard.latency.items()):
+            _add_row(latency, view, list(row))
+    return {'requests': [[*key, n] for key, n in requests.items()], 'latency': latency}
+
+
+def _add_row(latency, view, row):
+    total = latency.get(view)
+    if total is None:
+        latency[view] = row
+    else:
+        for i, value in enumerate(row):
+            total[i] += value
+
+
+def _process_file(pid):
+    return os.path.join(METRICS_DIR, f'web-{pid}.json')
+
+
+@contextmanager
+def _dir_lock(shared=False):
+    """Lock de `METRICS_DIR`: exclusivo para `retire`, compartido para leer.
+
+    Así `collect` nunca ve un proceso retirado a la vez en ``dead.json`` y
+    en su propio fichero.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(METRICS_DIR, 'metrics.lock'), 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def flush():
+    """Escribe la instantánea de este proceso en `METRICS_DIR`."""
+    global _owned_file
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _process_file(os.getpid())
+    if _owned_file != path:
+        retire(os.getpid())
+        _owned_file = path
+    tmp = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(snapshot(), fh)
+    os.replace(tmp, path)
+
+
+def retire(pid):
+    """Suma el fichero de un proceso terminado a ``dead.json`` y lo borra."""
+    path = _process_file(pid)
+    if not os.path.exists(path):
+        return
+    with _dir_lock():
+        data = _read_json(path)
+        if data:
+            dead = os.path.join(METRICS_DIR, 'dead.json')
+            requests, latency = _merge([_read_json(dead) or {'requests': [], 'latency': {}}, data])
+            tmp = f'{dead}.tmp'
+            with open(tmp, 'w') as fh:
+                json.dump({'requests': [[*key, n] for key, n in requests.items()], 'latency': latency}, fh)
+            os.replace(tmp, dead)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _read_json(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def collect():
+    """Métricas HTTP de todos los procesos: ``(requests Counter, latency dict)``."""
+    snapshots = [snapshot()]
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        own = os.path.basename(_process_file(os.getpid()))
+        with _dir_lock(shared=True):
+            for name in sorted(os.listdir(METRICS_DIR)):
+                if (name.startswith('web-') and name.endswith('.json') and name != own) or name == 'dead.json':
+                    data = _read_json(os.path.join(METRICS_DIR, name))
+                    if data:
+                        snapshots.append(data)
+    return _merge(snapshots)
+
+
+def _merge(snapshots):
+    requests, latency = Counter(), {}
+    for data in snapshots:
+        for view, method, status, n in data['requests']:
+            requests[(view, method, status)] += n
+        for view, row in data['latency'].items():
+            _add_row(latency, view, list(row))
+    return requests, latency
+
+
+# -- importación ------------------------------------------------------------
+
+def write_import_stats(stats, path=None):
+    """Guarda el resumen de una importación para `/metrics` (escritura atómica)."""
+    path = path or IMPORT_STATS_FILE
+    if not path:
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(stats, fh)
+    os.replace(tmp, path)
+    return path
+
+
+def read_import_stats(path=None):
+    path = path or IMPORT_STATS_FILE
+    return _read_json(path) if path else None
+
+
+# -- exposición -------------------------------------------------------------
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Texto de exposición de Prometheus (versión 0.0.4)."""
+    requests, latency = collect()
+    lines = [
+        '# HELP kaiken_http_requests_total Peticiones HTTP por nombre de ruta, método y código.',
+        '# TYPE kaiken_http_requests_total counter',
+    ]
+    for (view, method, status), n in sorted(requests.items()):
+        lines.append(f'kaiken_http_requests_total{_labels(view=view, method=method, status=status)} {n}')
+    lines += [
+        '# HELP kaiken_http_request_duration_seconds Latencia de las peticiones HTTP por nombre de ruta.',
+        '# TYPE kaiken_http_request_duration_seconds histogram',
+    ]
+    for view, row in sorted(latency.items()):
+        cumulative = 0
+        for bound, n in zip((*LATENCY_BUCKETS, '+Inf'), row):
+            cumulative += n
+            le = bound if bound == '+Inf' else _number(bound)
+            lines.append(f'kaiken_http_request_duration_seconds_bucket{_labels(view=view, le=le)} {cumulative}')
+        lines.append(f'kaiken_http_request_duration_seconds_sum{_labels(view=view)} {_number(row[-1])}')
+        lines.append(f'kaiken_http_request_duration_seconds_count{_labels(view=view)} {cumulative}')
+
+    stats = read_import_stats()
+    if stats:
+        lines += [
+            '# HELP kaiken_import_records Registros de la última importación por entidad y resultado.',
+            '# TYPE kaiken_import_records gauge',
+        ]
+        for entity, counts in sorted(stats.get('records', {}).items()):
+            for outcome, n in sorted(counts.items()):
+                lines.append(f'kaiken_import_records{_labels(entity=entity, outcome=outcome)} {n}')
+        lines += [
+            '# HELP kaiken_import_fetch_seconds Duración de la descarga de cada feed en la última importación.',
+            '# TYPE kaiken_import_fetch_seconds gauge',
+        ]
+        for feed, seconds in sorted(stats.get('fetch_seconds', {}).items()):
+            lines.append(f'kaiken_import_fetch_seconds{_labels(feed=feed)} {_number(seconds)}')
+        lines += [
+            '# HELP kaiken_import_feed_changed 1 si el feed cambió en la última importación, 0 si no (304, servido desde la caché).',
+            '# TYPE kaiken_import_feed_changed gauge',
+        ]
+        for feed, state in sorted(stats.get('feeds', {}).items()):
+            lines.append(f'kaiken_import_feed_changed{_labels(feed=feed)} {int(state == "changed")}')
+        lines += [
+            '# HELP kaiken_import_stage_seconds Duración de cada etapa (validación, escritura en BD) en la última importación.',
+            '# TYPE kaiken_import_stage_seconds gauge',
+        ]
+        for stage, seconds in sorted(stats.get('stage_seconds', {}).items()):
+            entity, _, step = stage.partition(':')
+            lines.append(f'kaiken_import_stage_seconds{_labels(entity=entity, stage=step)} {_number(seconds)}')
+        for name, key, help_text in (
+            ('kaiken_import_skipped', 'skipped', '1 si la última importación se omitió porque ningún feed cambió.'),
+            ('kaiken_import_failed', 'failed', '1 si la última importación terminó con un error.'),
+            ('kaiken_import_duration_seconds', 'duration_seconds', 'Duración total de la última importación.'),
+            ('kaiken_import_last_run_timestamp_seconds', 'finished_at', 'Fin de la última importación (epoch).'),
+        ):
+            if key in stats:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {_number(stats[key])}']
+    return '\n'.join(lines) + '\n'
+
+
+# -- middleware ------------------------------------------------------------
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    # Sin ruta (404) se agrupa en una sola serie para no crear una por URL.
+    return match.view_name if match else '<unmatched>'
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Cuenta las peticiones y su latencia por nombre de ruta.
+
+    La latencia de una respuesta en streaming cubre hasta que la vista la
+    devuelve, no el envío del cuerpo.
+    """
+    if not METRICS_ENABLED:
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            start = time.perf_counter()
+            response = await get_response(request)
+            observe_request(_view_name(request), request.method, response.status_code, time.perf_counter() - start)
+            return response
+    else:
+        def middleware(request):
+            start = time.perf_counter()
+            response = get_response(request)
+            observe_request(_view_name(request), request.method, response.status_code, time.perf_counter() - start)
+            return response
+    return middleware
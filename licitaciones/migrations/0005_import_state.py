@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('licitaciones', '0004_remove_tender_client'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=16)),
+                ('source_key', models.CharField(max_length=255)),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('entity', 'source_key'), name='import_state_entity_source_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:11
+
+from django.db import migrations, models
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    Tender = apps.get_model('licitaciones', 'Tender')
+    Order = apps.get_model('licitaciones', 'Order')
+    money = models.DecimalField(max_digits=18, decimal_places=2)
+    qty = Cast(F('quantity'), output_field=money)
+    orders = Order.objects.filter(tender=OuterRef('pk')).order_by().values('tender')
+
+    def total(aggregate, output_field):
+        return Coalesce(
+            Subquery(orders.annotate(v=aggregate).values('v'), output_field=output_field),
+            Value(0, output_field=output_field),
+            output_field=output_field,
+        )
+
+    Tender.objects.update(
+        total_margin=total(Sum(ExpressionWrapper((F('unit_price') - F('unit_cost')) * qty, output_field=money)), money),
+        total_revenue=total(Sum(ExpressionWrapper(F('unit_price') * qty, output_field=money)), money),
+        order_count=total(Count('pk'), models.IntegerField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('licitaciones', '0005_import_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tender',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tender',
+            name='total_margin',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='tender',
+            name='total_revenue',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=18),
+        ),
+        migrations.RunPython(backfill_totals, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('licitaciones', '0006_tender_totals'),
+    ]
+
+    # Primero se crean los índices nuevos y después se eliminan los índices
+    # de FK que pasan a estar cubiertos por ellos.
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['tender', 'unit_price', 'unit_cost', 'quantity'], name='order_tender_amounts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tender',
+            index=models.Index(fields=['-awarded_date', '-id'], name='tender_awarded_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tender',
+            index=models.Index(condition=models.Q(('client_obj__isnull', False)), fields=['client_obj', '-awarded_date'], name='tender_client_awarded_idx'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='tender',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='licitaciones.tender'),
+        ),
+        migrations.AlterField(
+            model_name='tender',
+            name='client_obj',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tenders', to='licitaciones.client'),
+        ),
+    ]
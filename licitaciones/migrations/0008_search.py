@@ -0,0 +1,98 @@
+from django.db import migrations
+
+
+# SQL copiado de `licitaciones/search.py` tal como estaba en esta migración:
+# las migraciones no importan código de la aplicación, que puede cambiar.
+TENDER_FTS_ROW = (
+    "INSERT INTO licitaciones_tender_fts(rowid, identifier, normalized_identifier, client_name) "
+    "VALUES (new.id, new.identifier, new.normalized_identifier, "
+    "COALESCE((SELECT name FROM licitaciones_client WHERE id = new.client_obj_id), ''));"
+)
+
+SQLITE_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS licitaciones_tender_fts "
+    "USING fts5(identifier, normalized_identifier, client_name, tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS licitaciones_client_fts USING fts5(name, tokenize='trigram')",
+]
+
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS licitaciones_tender_fts_ai AFTER INSERT ON licitaciones_tender BEGIN "
+    f"{TENDER_FTS_ROW} END",
+    "CREATE TRIGGER IF NOT EXISTS licitaciones_tender_fts_au "
+    "AFTER UPDATE OF identifier, normalized_identifier, client_obj_id ON licitaciones_tender BEGIN "
+    f"DELETE FROM licitaciones_tender_fts WHERE rowid = old.id; {TENDER_FTS_ROW} END",
+    "CREATE TRIGGER IF NOT EXISTS licitaciones_tender_fts_ad AFTER DELETE ON licitaciones_tender BEGIN "
+    "DELETE FROM licitaciones_tender_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS licitaciones_client_fts_ai AFTER INSERT ON licitaciones_client BEGIN "
+    "INSERT INTO licitaciones_client_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS licitaciones_client_fts_au AFTER UPDATE OF name ON licitaciones_client BEGIN "
+    "UPDATE licitaciones_client_fts SET name = new.name WHERE rowid = new.id; "
+    "UPDATE licitaciones_tender_fts SET client_name = new.name "
+    "WHERE rowid IN (SELECT id FROM licitaciones_tender WHERE client_obj_id = new.id); END",
+    "CREATE TRIGGER IF NOT EXISTS licitaciones_client_fts_ad AFTER DELETE ON licitaciones_client BEGIN "
+    "DELETE FROM licitaciones_client_fts WHERE rowid = old.id; END",
+]
+
+SQLITE_REBUILD = [
+    "DELETE FROM licitaciones_tender_fts",
+    "INSERT INTO licitaciones_tender_fts(rowid, identifier, normalized_identifier, client_name) "
+    "SELECT t.id, t.identifier, t.normalized_identifier, COALESCE(c.name, '') "
+    "FROM licitaciones_tender t LEFT JOIN licitaciones_client c ON c.id = t.client_obj_id",
+    "DELETE FROM licitaciones_client_fts",
+    "INSERT INTO licitaciones_client_fts(rowid, name) SELECT id, name FROM licitaciones_client",
+]
+
+SQLITE_TRIGGER_NAMES = [
+    'licitaciones_tender_fts_ai', 'licitaciones_tender_fts_au', 'licitaciones_tender_fts_ad',
+    'licitaciones_client_fts_ai', 'licitaciones_client_fts_au', 'licitaciones_client_fts_ad',
+]
+
+POSTGRES_SCHEMA = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS tender_identifier_trgm ON licitaciones_tender USING gin (identifier gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS tender_normalized_trgm ON licitaciones_tender USING gin (normalized_identifier gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS client_name_trgm ON licitaciones_client USING gin (name gin_trgm_ops)',
+]
+
+
+def install(apps, schema_editor):
+    conn = schema_editor.connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for sql in POSTGRES_SCHEMA:
+                cursor.execute(sql)
+        elif conn.vendor == 'sqlite':
+            try:
+                for sql in SQLITE_SCHEMA:
+                    cursor.execute(sql)
+            except Exception:
+                # SQLite compilado sin FTS5 o sin tokenizador trigram.
+                return
+            for sql in SQLITE_TRIGGERS + SQLITE_REBUILD:
+                cursor.execute(sql)
+
+
+def uninstall(apps, schema_editor):
+    conn = schema_editor.connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for name in ('tender_identifier_trgm', 'tender_normalized_trgm', 'client_name_trgm'):
+                cursor.execute(f'DROP INDEX IF EXISTS {name}')
+        elif conn.vendor == 'sqlite':
+            for name in SQLITE_TRIGGER_NAMES:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            for table in ('licitaciones_tender_fts', 'licitaciones_client_fts'):
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('licitaciones', '0007_list_indexes'),
+    ]
+
+    # Índices GIN de trigramas (PostgreSQL) o tablas FTS5 + triggers
+    # (SQLite); ver `licitaciones/search.py`.
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, ExpressionWrapper, F, Sum
+from django.db.models.functions import Cast
+
+
+def backfill_rollups(apps, schema_editor):
+    Order = apps.get_model('licitaciones', 'Order')
+    MarginRollup = apps.get_model('licitaciones', 'MarginRollup')
+    money = models.DecimalField(max_digits=18, decimal_places=2)
+    qty = Cast(F('quantity'), output_field=money)
+    rows = (
+        Order.objects.order_by()
+        .values('tender__awarded_date', 'tender__client_obj_id', 'product_id')
+        .annotate(
+            margin=Sum(ExpressionWrapper((F('unit_price') - F('unit_cost')) * qty, output_field=money)),
+            revenue=Sum(ExpressionWrapper(F('unit_price') * qty, output_field=money)),
+            total_quantity=Sum('quantity'),
+            orders=Count('pk'),
+        )
+    )
+    MarginRollup.objects.bulk_create(
+        (
+            MarginRollup(
+                day=r['tender__awarded_date'], month=r['tender__awarded_date'].replace(day=1), client_id=r['tender__client_obj_id'], product_id=r['product_id'],
+                margin=r['margin'], revenue=r['revenue'], quantity=r['total_quantity'], order_count=r['orders'],
+            )
+            for r in rows.iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('licitaciones', '0008_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarginRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('month', models.DateField()),
+                ('margin', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('quantity', models.PositiveBigIntegerField(default=0)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('client', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='licitaciones.client')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='licitaciones.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='rollup_day_idx'), models.Index(fields=['client', 'day'], name='rollup_client_day_idx'), models.Index(fields=['product', 'day'], name='rollup_product_day_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
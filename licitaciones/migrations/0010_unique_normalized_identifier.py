@@ -0,0 +1,112 @@
+import re
+
+from django.db import migrations, models
+
+
+def renormalize_identifiers(apps, schema_editor):
+    """Recalcula la clave (sin guiones ni espacios, en mayúsculas) antes de hacerla única."""
+    Tender = apps.get_model('licitaciones', 'Tender')
+    by_key, changed = {}, []
+    for t in Tender.objects.order_by('pk').only('pk', 'identifier', 'normalized_identifier').iterator(chunk_size=2000):
+        key = re.sub(r'[\s\-\u2010-\u2015]+', '', t.identifier or '').upper()
+        by_key.setdefault(key, []).append(t.identifier)
+        if t.normalized_identifier != key:
+            t.normalized_identifier = key
+            changed.append(t)
+    duplicates = {key: ids for key, ids in by_key.items() if len(ids) > 1}
+    if duplicates:
+        listed = '; '.join(', '.join(ids) for ids in list(duplicates.values())[:20])
+        raise RuntimeError(
+            f'{len(duplicates)} grupos de licitaciones difieren sólo en guiones, espacios o mayúsculas '
+            f'y deben unificarse antes de migrar: {listed}'
+        )
+    Tender.objects.bulk_update(changed, ['normalized_identifier'], batch_size=2000)
+
+
+# SQL de la búsqueda de SQLite tal como lo dejó la migración 0008 (las
+# migraciones no importan código de la aplicación, que puede cambiar).
+TENDER_FTS_ROW = (
+    "INSERT INTO licitaciones_tender_fts(rowid, identifier, normalized_identifier, client_name) "
+    "VALUES (new.id, new.identifier, new.normalized_identifier, "
+    "COALESCE((SELECT name FROM licitaciones_client WHERE id = new.client_obj_id), ''));"
+)
+
+SQLITE_TRIGGERS = {
+    'licitaciones_tender_fts_ai': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_tender_fts_ai AFTER INSERT ON licitaciones_tender BEGIN "
+        f"{TENDER_FTS_ROW} END"
+    ),
+    'licitaciones_tender_fts_au': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_tender_fts_au "
+        "AFTER UPDATE OF identifier, normalized_identifier, client_obj_id ON licitaciones_tender BEGIN "
+        f"DELETE FROM licitaciones_tender_fts WHERE rowid = old.id; {TENDER_FTS_ROW} END"
+    ),
+    'licitaciones_tender_fts_ad': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_tender_fts_ad AFTER DELETE ON licitaciones_tender BEGIN "
+        "DELETE FROM licitaciones_tender_fts WHERE rowid = old.id; END"
+    ),
+    'licitaciones_client_fts_ai': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_client_fts_ai AFTER INSERT ON licitaciones_client BEGIN "
+        "INSERT INTO licitaciones_client_fts(rowid, name) VALUES (new.id, new.name); END"
+    ),
+    'licitaciones_client_fts_au': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_client_fts_au AFTER UPDATE OF name ON licitaciones_client BEGIN "
+        "UPDATE licitaciones_client_fts SET name = new.name WHERE rowid = new.id; "
+        "UPDATE licitaciones_tender_fts SET client_name = new.name "
+        "WHERE rowid IN (SELECT id FROM licitaciones_tender WHERE client_obj_id = new.id); END"
+    ),
+    'licitaciones_client_fts_ad': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_client_fts_ad AFTER DELETE ON licitaciones_client BEGIN "
+        "DELETE FROM licitaciones_client_fts WHERE rowid = old.id; END"
+    ),
+}
+
+SQLITE_REBUILD = [
+    "DELETE FROM licitaciones_tender_fts",
+    "INSERT INTO licitaciones_tender_fts(rowid, identifier, normalized_identifier, client_name) "
+    "SELECT t.id, t.identifier, t.normalized_identifier, COALESCE(c.name, '') "
+    "FROM licitaciones_tender t LEFT JOIN licitaciones_client c ON c.id = t.client_obj_id",
+    "DELETE FROM licitaciones_client_fts",
+    "INSERT INTO licitaciones_client_fts(rowid, name) SELECT id, name FROM licitaciones_client",
+]
+
+
+def drop_search_triggers(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for name in SQLITE_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def install_search_triggers(apps, schema_editor):
+    """Recrea los triggers y reindexa, si existen las tablas FTS (ver 0008)."""
+    conn = schema_editor.connection
+    if conn.vendor != 'sqlite' or 'licitaciones_tender_fts' not in conn.introspection.table_names():
+        return
+    with conn.cursor() as cursor:
+        for sql in [*SQLITE_TRIGGERS.values(), *SQLITE_REBUILD]:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('licitaciones', '0009_margin_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(renormalize_identifiers, reverse_code=migrations.RunPython.noop),
+        # SQLite reconstruye la tabla: sin los triggers de búsqueda mientras tanto.
+        migrations.RunPython(drop_search_triggers, install_search_triggers),
+        migrations.AlterField(
+            model_name='tender',
+            name='normalized_identifier',
+            field=models.CharField(
+                blank=True, max_length=128, unique=True,
+                error_messages={'unique': 'Ya existe una licitación con el mismo identificador sin guiones.'},
+            ),
+        ),
+        migrations.RunPython(install_search_triggers, drop_search_triggers),
+    ]
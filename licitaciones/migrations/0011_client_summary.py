@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def backfill_summaries(apps, schema_editor):
+    Tender = apps.get_model('licitaciones', 'Tender')
+    ClientSummary = apps.get_model('licitaciones', 'ClientSummary')
+    rows = (
+        Tender.objects.filter(client_obj__isnull=False).order_by()
+        .values('client_obj_id')
+        .annotate(tenders=Count('pk'), orders=Sum('order_count'), revenue=Sum('total_revenue'), margin=Sum('total_margin'), last_awarded=Max('awarded_date'))
+    )
+    ClientSummary.objects.bulk_create(
+        (
+            ClientSummary(
+                client_id=r['client_obj_id'], tender_count=r['tenders'], order_count=r['orders'], revenue=r['revenue'],
+                cost=r['revenue'] - r['margin'], margin=r['margin'], last_awarded_date=r['last_awarded'],
+            )
+            for r in rows.iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('licitaciones', '0010_unique_normalized_identifier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientSummary',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='licitaciones.client')),
+                ('tender_count', models.PositiveIntegerField(default=0)),
+                ('order_count', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('margin', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('last_awarded_date', models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+# Los índices de 0008 eran sobre la columna, pero `icontains` compila a
+# ``UPPER("col"::text) LIKE UPPER(%s)``, que sólo puede usar un índice sobre
+# esa misma expresión. SQL copiado de `licitaciones/search.py`.
+INDEXES = [
+    ('tender_identifier_trgm', 'tender_identifier_upper_trgm', 'licitaciones_tender', 'identifier'),
+    ('tender_normalized_trgm', 'tender_normalized_upper_trgm', 'licitaciones_tender', 'normalized_identifier'),
+    ('client_name_trgm', 'client_name_upper_trgm', 'licitaciones_client', 'name'),
+]
+
+
+def upper_indexes(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor != 'postgresql':
+        return
+    with conn.cursor() as cursor:
+        for old, new, table, column in INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {old}')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {new} ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)')
+
+
+def column_indexes(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor != 'postgresql':
+        return
+    with conn.cursor() as cursor:
+        for old, new, table, column in INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {new}')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {old} ON {table} USING gin ({column} gin_trgm_ops)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('licitaciones', '0011_client_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(upper_indexes, column_indexes),
+    ]
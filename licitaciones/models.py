@@ -1,47 +1,355 @@
+import re
 from decimal import Decimal
 
-from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import F, Sum, ExpressionWrapper, DecimalField
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import models, transaction
+from django.db.models import (
+    Case, F, FloatField, Sum, Count, ExpressionWrapper, DecimalField, OuterRef, Subquery, Value, When, Window,
+)
+from django.db.models.expressions import Col
+from django.db.models.functions import Cast, Coalesce, RowNumber
+
+from .signals import tenders_changed
 
 
 # Create your models here.
 
+MONEY_FIELD = DecimalField(max_digits=18, decimal_places=2)
+# Campos agregados de `Tender` que se mantienen desde las órdenes.
+TENDER_TOTAL_FIELDS = ('total_margin', 'total_revenue', 'order_count')
+# Campos de `Tender` de los que dependen la caché y los rollups.
+TENDER_KEY_FIELDS = ('identifier', 'client_obj_id', 'awarded_date')
+# Argumentos de `Tender.objects.update()` que cambian esos campos.
+KEY_UPDATE_FIELDS = frozenset({'identifier', 'normalized_identifier', 'client_obj', 'client_obj_id', 'awarded_date'})
+# Licitaciones por refresco cuando se enumeran (límite de parámetros de SQLite).
+TENDER_REFRESH_BATCH = 500
+# Identificadores (normalizados) que coinciden con rutas fijas bajo
+# `api/tenders/` y `tenders/` (licitaciones/urls.py): su detalle quedaría
+# tapado por esas rutas.
+RESERVED_IDENTIFIERS = frozenset({'BULK', 'BATCH', 'EXPORT.CSV', 'NEW'})
+RESERVED_IDENTIFIER_MESSAGE = 'El identificador %s está reservado por una ruta de la aplicación.'
+
+
+def normalize_identifier(value) -> str:
+    """Clave con la que se cruzan los ids de licitación externos.
+
+    Sin guiones ni espacios y en mayúsculas: "1234-56-le24 " y
+    "123456LE24" son la misma licitación.
+    """
+    return re.sub(r'[\s\-\u2010-\u2015]+', '', str(value or '')).upper()
+
+
+def order_margin_expr(prefix=''):
+    """Expresión SQL del margen de una línea: (precio - coste) * cantidad.
+
+    `prefix` permite usarla desde otra tabla (p.ej. ``'orders__'``).
+    """
+    return ExpressionWrapper(
+        (F(f'{prefix}unit_price') - F(f'{prefix}unit_cost')) * Cast(F(f'{prefix}quantity'), output_field=MONEY_FIELD),
+        output_field=MONEY_FIELD,
+    )
+
+
+def order_revenue_expr(prefix=''):
+    return ExpressionWrapper(
+        F(f'{prefix}unit_price') * Cast(F(f'{prefix}quantity'), output_field=MONEY_FIELD),
+        output_field=MONEY_FIELD,
+    )
+
+
+def clean_batch(objs, exclude=(), clean=True):
+    """Valida `objs` (del mismo modelo) como `full_clean()`, pero en lote.
+
+    Las FKs se comprueban con una consulta por modelo relacionado, y
+    ninguna si el objeto relacionado ya está cargado. No valida unicidad
+    (ver `TenderQuerySet.bulk_validate`). Los objetos válidos quedan
+    marcados para que `save()` no los vuelva a validar. Devuelve
+    ``{índice: ValidationError}``.
+    """
+    errors = {}
+    if not objs:
+        return errors
+    fk_fields = [f for f in objs[0]._meta.concrete_fields if f.many_to_one and f.name not in exclude]
+    missing = {}
+    for f in fk_fields:
+        ids = {getattr(o, f.attname) for o in objs if getattr(o, f.attname) is not None and not f.is_cached(o)}
+        found = set(f.related_model._base_manager.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+        missing[f.name] = ids - found
+
+    skip = set(exclude) | {f.name for f in fk_fields}
+    for i, obj in enumerate(objs):
+        field_errors = {}
+        try:
+            obj.clean_fields(exclude=skip)
+        except ValidationError as e:
+            field_errors = e.update_error_dict(field_errors)
+        for f in fk_fields:
+            value = getattr(obj, f.attname)
+            try:
+                # Sólo null/blank/choices: la existencia ya se comprobó arriba.
+                models.Field.validate(f, value, obj)
+                if value in missing[f.name]:
+                    raise ValidationError(f'{f.related_model._meta.verbose_name} {value!r} no existe.', code='invalid')
+            except ValidationError as e:
+                field_errors.setdefault(f.name, []).extend(e.error_list)
+        if clean and not field_errors:
+            try:
+                obj.clean()
+            except ValidationError as e:
+                field_errors = e.update_error_dict(field_errors)
+        if field_errors:
+            errors[i] = ValidationError(field_errors)
+        else:
+            obj._validated = True
+    return errors
+
+
+class TenderQuerySet(models.QuerySet):
+    def refresh_totals(self):
+        """Recalcula los totales almacenados desde las órdenes en un UPDATE.
+
+        Sólo toca las licitaciones del queryset, así que mantenerlas tras
+        escribir órdenes cuesta lo mismo que agregar las órdenes afectadas.
+        """
+        orders = Order.objects.filter(tender=OuterRef('pk')).order_by().values('tender')
+
+        def total(aggregate, output_field):
+            return Coalesce(
+                Subquery(orders.annotate(v=aggregate).values('v'), output_field=output_field),
+                Value(0, output_field=output_field),
+                output_field=output_field,
+            )
+
+        listening = tenders_changed.has_listeners(Tender)
+        # Sin savepoint: los llamantes ya abren su transacción y así no se
+        # añaden consultas a cada escritura de órdenes.
+        with transaction.atomic(using=self.db, savepoint=False):
+            # Los totales anteriores permiten a los receptores aplicar
+            # diferencias (p.ej. `summaries`) en vez de volver a agregar. Se
+            # leen con la fila bloqueada (en orden de pk, sin interbloqueos)
+            # hasta el final de la transacción: otra escritura sobre la misma
+            # licitación espera y lee los totales ya actualizados, así sus
+            # diferencias no se solapan.
+            previous = list(
+                self.select_for_update().only(*TENDER_KEY_FIELDS, *TENDER_TOTAL_FIELDS).order_by('pk')
+            ) if listening else []
+            count = self.update(
+                total_margin=total(Sum(order_margin_expr()), MONEY_FIELD),
+                total_revenue=total(Sum(order_revenue_expr()), MONEY_FIELD),
+                order_count=total(Count('pk'), models.IntegerField()),
+            )
+            if count and listening:
+                tenders_changed.send(sender=Tender, queryset=self, previous=previous, totals_only=True)
+        return count
+
+    def update(self, **kwargs):
+        """`UPDATE` que emite `tenders_changed` si cambia identificador, cliente o fecha.
+
+        Igual que las operaciones masivas de `OrderQuerySet`: sin `post_save`,
+        la caché, los rollups y los resúmenes por cliente no se enterarían.
+        Los valores anteriores se leen antes del UPDATE, con la fila
+        bloqueada. Los totales (`refresh_totals`) no cambian esos campos.
+        """
+        if isinstance(kwargs.get('identifier'), str) and 'normalized_identifier' not in kwargs:
+            kwargs['normalized_identifier'] = normalize_identifier(kwargs['identifier'])
+        if not KEY_UPDATE_FIELDS & set(kwargs) or not tenders_changed.has_listeners(Tender):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            previous = list(self.select_for_update().only(*TENDER_KEY_FIELDS).order_by('pk'))
+            count = super().update(**kwargs)
+            for start in range(0, len(previous), TENDER_REFRESH_BATCH):
+                batch = previous[start:start + TENDER_REFRESH_BATCH]
+                tenders_changed.send(
+                    sender=Tender, queryset=Tender.objects.filter(pk__in=[t.pk for t in batch]), previous=batch,
+                )
+        return count
+
+    update.alters_data = True
+
+    def with_computed_totals(self):
+        """Anota los totales calculados desde las órdenes (para verificar)."""
+        return self.annotate(
+            computed_margin=Coalesce(Sum(order_margin_expr('orders__')), Value(0, output_field=MONEY_FIELD), output_field=MONEY_FIELD),
+            computed_revenue=Coalesce(Sum(order_revenue_expr('orders__')), Value(0, output_field=MONEY_FIELD), output_field=MONEY_FIELD),
+            computed_count=Count('orders'),
+        )
+
+    def bulk_validate(self, items, validate_unique=True):
+        """Valida en memoria lotes de licitaciones con sus órdenes.
+
+        `items` son pares `(tender, orders)`; `orders=None` omite las
+        líneas (p.ej. el importador, que las carga aparte). La regla de "al
+        menos una orden" se comprueba sobre `orders` para las licitaciones
+        nuevas, sin consultar la BD, y la unicidad de `identifier` con una
+        sola consulta para todo el lote. Devuelve ``{índice: ValidationError}``.
+        """
+        items = list(items)
+        tenders = [t for t, _ in items]
+        for tender in tenders:
+            if tender.identifier:
+                tender.normalized_identifier = normalize_identifier(tender.identifier)
+        errors = {i: e.update_error_dict({}) for i, e in clean_batch(tenders, clean=False).items()}
+
+        def add(i, field, message):
+            errors.setdefault(i, {}).setdefault(field, []).append(message)
+
+        for i, tender in enumerate(tenders):
+            if tender.normalized_identifier in RESERVED_IDENTIFIERS:
+                add(i, 'identifier', RESERVED_IDENTIFIER_MESSAGE % tender.identifier)
+
+        if validate_unique:
+            # La clave normalizada es única: cubre también el `identifier` exacto.
+            def duplicate(i, identifier):
+                if tenders[i].identifier == identifier:
+                    add(i, 'identifier', tenders[i].unique_error_message(Tender, ('identifier',)))
+                else:
+                    add(i, 'identifier', f'Ya existe la licitación {identifier} (mismo identificador sin guiones).')
+
+            seen = {}
+            for i, tender in enumerate(tenders):
+                key = tender.normalized_identifier
+                if key in seen:
+                    duplicate(i, tenders[seen[key]].identifier)
+                seen.setdefault(key, i)
+            taken = self.model._base_manager.filter(normalized_identifier__in=list(seen)).values_list(
+                'normalized_identifier', 'identifier', 'pk',
+            )
+            for key, identifier, pk in taken:
+                for i, tender in enumerate(tenders):
+                    if tender.normalized_identifier == key and tender.pk != pk:
+                        duplicate(i, identifier)
+
+        lines = [(i, o) for i, (tender, orders) in enumerate(items) if orders is not None for o in orders]
+        for i, (tender, orders) in enumerate(items):
+            if orders is not None and tender._state.adding and not orders:
+                add(i, NON_FIELD_ERRORS, 'No se permiten licitaciones sin productos.')
+            for order in orders or ():
+                order.tender = tender
+        # La licitación de cada línea es la del par (aún sin pk si es nueva).
+        for n, error in Order.objects.bulk_validate([o for _, o in lines], exclude=('tender',)).items():
+            i = lines[n][0]
+            for message in error.messages:
+                add(i, 'orders', message)
+
+        for i in errors:
+            tenders[i].__dict__.pop('_validated', None)
+            for order in items[i][1] or ():
+                order.__dict__.pop('_validated', None)
+        return {i: ValidationError(e) for i, e in sorted(errors.items())}
+
+    def save_with_orders(self, tender, orders=(), deleted=()):
+        """Valida y guarda `tender` con sus órdenes en una transacción.
+
+        `orders` son las líneas nuevas o modificadas y `deleted` las que se
+        eliminan. Se insertan/actualizan en bloque (un solo refresco de
+        totales por operación) en lugar de una `save()` por línea.
+        """
+        orders = list(orders)
+        errors = self.bulk_validate([(tender, orders)])
+        if errors:
+            raise errors[0]
+        with transaction.atomic(using=self.db):
+            tender.save()
+            for order in orders:
+                order.tender = tender
+            if deleted:
+                Order.objects.filter(pk__in=[o.pk for o in deleted]).delete()
+                if not orders and not tender.orders.exists():
+                    raise ValidationError('No se permiten licitaciones sin productos.')
+            new = [o for o in orders if o._state.adding]
+            changed = [o for o in orders if not o._state.adding]
+            if new:
+                Order.objects.bulk_create(new)
+                for order in new:
+                    order._state.adding = False
+            if changed:
+                Order.objects.bulk_update(changed, ['tender', 'product', 'quantity', 'unit_price', 'unit_cost'])
+            tender.refresh_from_db(fields=TENDER_TOTAL_FIELDS)
+        return tender
+
+    def create_with_orders(self, orders, **kwargs):
+        """Como `create()`, pero junto con sus órdenes (ver `save_with_orders`)."""
+        tender = self.model(**kwargs)
+        return self.save_with_orders(tender, orders)
+
 
 class Tender(models.Model):
     """Licitación adjudicada."""
 
     identifier = models.CharField(max_length=128, unique=True)
-    # Identificador normalizado (sin guiones) para búsquedas robustas desde
-    # sistemas externos que pueden enviar el id sin guiones.
-    normalized_identifier = models.CharField(max_length=128, blank=True, db_index=True)
+    # Identificador normalizado (`normalize_identifier`) para resolver los ids
+    # de sistemas externos, que pueden llegar sin guiones o en minúsculas.
+    # Único: dos licitaciones no pueden diferir sólo en eso.
+    normalized_identifier = models.CharField(
+        max_length=128, blank=True, unique=True,
+        error_messages={'unique': 'Ya existe una licitación con el mismo identificador sin guiones.'},
+    )
     # Relación con tabla de clientes.
-    client_obj = models.ForeignKey('Client', null=True, blank=True, on_delete=models.SET_NULL, related_name='tenders')
+    # Sin índice propio: lo cubre el índice parcial (client_obj, awarded_date).
+    client_obj = models.ForeignKey('Client', null=True, blank=True, on_delete=models.SET_NULL, related_name='tenders', db_index=False)
     awarded_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Totales desnormalizados: sum((price-cost)*qty), sum(price*qty) y nº de
+    # órdenes. Los mantiene `Order` (save/delete y operaciones masivas) vía
+    # `TenderQuerySet.refresh_totals`; `rebuild_tender_totals` los verifica.
+    total_margin = models.DecimalField(max_digits=18, decimal_places=2, default=0, db_index=True, editable=False)
+    total_revenue = models.DecimalField(max_digits=18, decimal_places=2, default=0, editable=False)
+    order_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = TenderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Listado y paginación por cursor: ORDER BY awarded_date DESC, id DESC
+            # con filtros por rango de fechas.
+            models.Index(fields=['-awarded_date', '-id'], name='tender_awarded_id_idx'),
+            # Licitaciones de un cliente ordenadas por fecha (client_detail).
+            # Parcial: las licitaciones sin cliente nunca se buscan por él.
+            models.Index(
+                fields=['client_obj', '-awarded_date'],
+                name='tender_client_awarded_idx',
+                condition=models.Q(client_obj__isnull=False),
+            ),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover - trivial
         client_name = self.client_obj.name if self.client_obj else ''
         return f"{self.identifier} - {client_name}"
 
-    def total_margin(self) -> Decimal:
-        """Calcula el margen total de la licitación: sum((price-cost)*qty).
-
-        Usa agregaciones para evitar traer todas las filas a memoria.
-        """
-        expr = ExpressionWrapper((F('unit_price') - F('unit_cost')) * F('quantity'), output_field=DecimalField())
-        result = self.orders.aggregate(total=Sum(expr))
-        return result['total'] or Decimal('0')
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores originales de los campos por los que se indexan caché y
+        # rollups, para actualizar también los anteriores si cambian.
+        instance._loaded_values = {f: instance.__dict__.get(f) for f in TENDER_KEY_FIELDS}
+        return instance
 
     def save(self, *args, **kwargs):
         # Mantener `normalized_identifier` sincronizado con `identifier`.
         if self.identifier:
-            self.normalized_identifier = str(self.identifier).replace('-', '')
-        # Ejecutar validaciones de modelo siempre (no se permite bypass).
-        self.full_clean()
+            self.normalized_identifier = normalize_identifier(self.identifier)
+        # Ejecutar validaciones de modelo siempre, salvo si la instancia ya
+        # se validó en lote (`TenderQuerySet.bulk_validate`).
+        if not self.__dict__.pop('_validated', False):
+            self.full_clean()
+        # Los totales sólo los escriben las órdenes: no pisarlos con los
+        # valores (posiblemente obsoletos) cargados en esta instancia.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in TENDER_TOTAL_FIELDS
+            ]
         super().save(*args, **kwargs)
+        self._loaded_values = {f: getattr(self, f) for f in TENDER_KEY_FIELDS}
+
+    def refresh_totals(self):
+        """Recalcula y recarga los totales almacenados de esta licitación."""
+        Tender.objects.filter(pk=self.pk).refresh_totals()
+        self.refresh_from_db(fields=TENDER_TOTAL_FIELDS)
 
     def clean(self):
+        if normalize_identifier(self.identifier) in RESERVED_IDENTIFIERS:
+            raise ValidationError({'identifier': RESERVED_IDENTIFIER_MESSAGE % self.identifier})
         # No permitir que una licitación existente quede sin órdenes.
         # Para nuevas instancias (sin pk) la validación se omite aquí porque
         # normalmente se crean primero y luego se añaden las órdenes.
@@ -78,6 +386,118 @@ class Client(models.Model):
 
 
 
+class OrderQuerySet(models.QuerySet):
+    """Operaciones masivas que mantienen los totales de `Tender`.
+
+    `bulk_create`, `update` (y por tanto `bulk_update`) y `delete` no pasan
+    por `Order.save()`/`delete()`, así que refrescan aquí los totales de
+    las licitaciones afectadas.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            Tender.objects.filter(pk__in={o.tender_id for o in objs}).refresh_totals()
+        return objs
+
+    def update(self, **kwargs):
+        moved = 'tender' in kwargs or 'tender_id' in kwargs
+        with transaction.atomic(using=self.db):
+            if not (moved or self._filters_on(kwargs)):
+                count = super().update(**kwargs)
+                Tender.objects.filter(pk__in=Subquery(self.order_by().values('tender_id'))).refresh_totals()
+                return count
+            # Tras el UPDATE el filtro ya no encontraría las licitaciones de
+            # origen: se leen antes (una fila por licitación, no por orden).
+            tender_ids = set(self.order_by().values_list('tender_id', flat=True).distinct())
+            new = kwargs.get('tender', kwargs.get('tender_id'))
+            # Destino por fila (`bulk_update`, que ya tiene los ids en memoria):
+            # se releen esas órdenes después.
+            order_ids = list(self.values_list('pk', flat=True)) if hasattr(new, 'resolve_expression') else None
+            count = super().update(**kwargs)
+            if order_ids is not None:
+                tender_ids.update(Order.objects.filter(pk__in=order_ids).values_list('tender_id', flat=True).distinct())
+            elif moved:
+                tender_ids.add(getattr(new, 'pk', new))
+            tender_ids = sorted(tender_ids - {None})
+            for start in range(0, len(tender_ids), TENDER_REFRESH_BATCH):
+                Tender.objects.filter(pk__in=tender_ids[start:start + TENDER_REFRESH_BATCH]).refresh_totals()
+        return count
+
+    def _filters_on(self, kwargs):
+        """¿Filtra el queryset por alguno de los campos que asigna `update(**kwargs)`?"""
+        fields = {self.model._meta.get_field(name) for name in kwargs}
+        stack = [self.query.where]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Col) and node.target in fields:
+                return True
+            if hasattr(node, 'children'):
+                stack.extend(node.children)
+            elif hasattr(node, 'get_source_expressions'):
+                stack.extend(node.get_source_expressions())
+        return False
+
+    update.alters_data = True
+
+    def bulk_validate(self, orders, exclude=()):
+        """Valida órdenes en memoria (ver `clean_batch`).
+
+        Completa antes precio y coste desde el producto, como `Order.save()`,
+        cargando en una consulta los productos que no estén en memoria.
+        """
+        orders = list(orders)
+        pending = {
+            o.product_id for o in orders
+            if (not o.unit_price or not o.unit_cost) and o.product_id and not Order.product.is_cached(o)
+        }
+        products = Product.objects.in_bulk(pending) if pending else {}
+        for order in orders:
+            product = products.get(order.product_id) or (order.product if Order.product.is_cached(order) else None)
+            if product is not None:
+                if not order.unit_price:
+                    order.unit_price = product.price
+                if not order.unit_cost:
+                    order.unit_cost = product.cost
+        return clean_batch(orders, exclude=exclude)
+
+    def with_line_margins(self):
+        """Anota cada línea con su margen calculado en SQL.
+
+        - `line_margin`: (precio - coste) * cantidad.
+        - `line_margin_pct`: margen unitario sobre el precio, en % (float).
+        - `line_number`, `running_margin`, `running_revenue`: posición y
+          acumulados de la línea dentro de su licitación, en orden de id.
+
+        Las funciones ventana se calculan sobre todas las líneas de la
+        licitación; filtrar por `line_number` (no por id) conserva los
+        acumulados al paginar.
+        """
+        window = {'partition_by': F('tender_id'), 'order_by': F('id').asc()}
+        return self.annotate(
+            line_margin=order_margin_expr(),
+            line_margin_pct=Case(
+                When(unit_price=0, then=Value(0.0)),
+                # En float: SQLite guarda los importes enteros como INTEGER.
+                default=Cast(F('unit_price') - F('unit_cost'), FloatField()) * 100 / Cast('unit_price', FloatField()),
+                output_field=FloatField(),
+            ),
+            line_number=Window(RowNumber(), **window),
+            running_margin=Window(Sum(order_margin_expr()), output_field=MONEY_FIELD, **window),
+            running_revenue=Window(Sum(order_revenue_expr()), output_field=MONEY_FIELD, **window),
+        )
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            tender_ids = set(self.values_list('tender_id', flat=True))
+            result = super().delete()
+            Tender.objects.filter(pk__in=tender_ids).refresh_totals()
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class Order(models.Model):
     """Detalle de productos adjudicados en una licitación.
 
@@ -85,22 +505,44 @@ class Order(models.Model):
     preservar el historial si el `Product` cambia luego.
     """
 
-    tender = models.ForeignKey(Tender, related_name='orders', on_delete=models.CASCADE)
+    # Sin índice propio: lo cubre `order_tender_amounts_idx`.
+    tender = models.ForeignKey(Tender, related_name='orders', on_delete=models.CASCADE, db_index=False)
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=12, decimal_places=2)
     unit_cost = models.DecimalField(max_digits=12, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Cubre las agregaciones por licitación (totales, detalle): el
+            # margen se calcula sólo desde el índice, sin leer la tabla.
+            models.Index(fields=['tender', 'unit_price', 'unit_cost', 'quantity'], name='order_tender_amounts_idx'),
+        ]
+
     def __str__(self) -> str:  # pragma: no cover - trivial
         return f"{self.tender.identifier} - {self.product.sku} x{self.quantity}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Recordar la licitación original para refrescar ambas si cambia.
+        instance._loaded_tender_id = instance.__dict__.get('tender_id')
+        return instance
+
     def clean(self):
         """Validaciones de negocio.
 
         - unit_price debe ser > unit_cost
         - quantity > 0 (ya lo garantiza PositiveIntegerField)
+
+        Sin unitarios (p.ej. el inline del admin, donde son de sólo lectura)
+        no se compara: se completan desde el producto al guardar/validar.
         """
+        if self.unit_price is None or self.unit_cost is None:
+            return
         if self.unit_price <= self.unit_cost:
             raise ValidationError('El precio unitario debe ser mayor que el costo unitario.')
 
@@ -110,9 +552,24 @@ class Order(models.Model):
             self.unit_price = self.product.price
         if not self.unit_cost:
             self.unit_cost = self.product.cost
-        # Ejecutar validaciones
-        self.full_clean()
-        super().save(*args, **kwargs)
+        # Ejecutar validaciones (salvo si ya se validó en lote); como en
+        # lote, sin consultar las FKs cuyo objeto ya está cargado.
+        if not self.__dict__.pop('_validated', False):
+            errors = clean_batch([self])
+            self.__dict__.pop('_validated', None)
+            if errors:
+                raise errors[0]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            tender_ids = {self.tender_id, getattr(self, '_loaded_tender_id', None)} - {None}
+            Tender.objects.filter(pk__in=tender_ids).refresh_totals()
+        self._loaded_tender_id = self.tender_id
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Tender.objects.filter(pk=self.tender_id).refresh_totals()
+        return result
 
     def margin(self) -> Decimal:
         return (self.unit_price - self.unit_cost) * Decimal(self.quantity)
@@ -131,3 +588,75 @@ class Order(models.Model):
         except Exception:
             return Decimal('0.00')
 
+
+class ImportState(models.Model):
+    """Huella del último registro importado por entidad e id de origen.
+
+    Permite a la importación incremental saltarse los registros cuyo
+    contenido no cambió desde la ejecución anterior.
+    """
+
+    entity = models.CharField(max_length=16)
+    source_key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=40)
+    # Pk de la fila creada/actualizada (p.ej. la `Order`) para poder
+    # actualizarla si el registro de origen cambia.
+    object_id = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['entity', 'source_key'], name='import_state_entity_source_key')
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover - trivial
+        return f"{self.entity}:{self.source_key}"
+
+
+class MarginRollup(models.Model):
+    """Margen diario (por fecha de adjudicación) por cliente y producto.
+
+    Lo mantiene `licitaciones.rollups` al escribir órdenes y licitaciones;
+    `rebuild_margin_rollups` lo recalcula entero desde `Order`.
+    """
+
+    day = models.DateField()
+    # Primer día del mes de `day`: agrupar por mes es agrupar por columna
+    # (SQLite trunca fechas con una función Python, fila a fila).
+    month = models.DateField()
+    client = models.ForeignKey(Client, null=True, blank=True, on_delete=models.CASCADE, related_name='+', db_index=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    margin = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    quantity = models.PositiveBigIntegerField(default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day'], name='rollup_day_idx'),
+            models.Index(fields=['client', 'day'], name='rollup_client_day_idx'),
+            models.Index(fields=['product', 'day'], name='rollup_product_day_idx'),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover - trivial
+        return f"{self.day} {self.client_id}/{self.product_id}: {self.margin}"
+
+
+class ClientSummary(models.Model):
+    """Totales por cliente (listado y ficha de clientes).
+
+    Se agregan desde los totales desnormalizados de sus licitaciones. Lo
+    mantiene `licitaciones.summaries` al escribir licitaciones y órdenes;
+    `rebuild_client_summaries` lo recalcula entero.
+    """
+
+    client = models.OneToOneField(Client, primary_key=True, on_delete=models.CASCADE, related_name='summary')
+    tender_count = models.PositiveIntegerField(default=0)
+    order_count = models.PositiveBigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    margin = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    last_awarded_date = models.DateField(null=True, blank=True)
+
+    def __str__(self) -> str:  # pragma: no cover - trivial
+        return f"{self.client_id}: {self.tender_count} licitaciones, {self.margin}"
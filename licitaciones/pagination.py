@@ -0,0 +1,152 @@
+"""Paginación por cursor (keyset) para listados ordenados por fecha.
+
+En lugar de `COUNT(*)` + `OFFSET` (que empeora linealmente en páginas
+profundas) se filtra por la última clave vista `(awarded_date, id)`, de
+modo que cada página cuesta lo mismo sin importar su posición.
+
+Los resultados de búsqueda ordenados por relevancia no tienen una clave
+ordenable estable: usan cursores de desplazamiento (`encode_offset_cursor`),
+acotados por la ventana de candidatos de `search.RANK_WINDOW`.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode(payload) -> str:
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode(token):
+    raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    return json.loads(raw)
+
+
+def encode_cursor(awarded_date, pk, reverse=False) -> str:
+    """Codifica una posición como token opaco (base64 url-safe)."""
+    payload = {'d': awarded_date.isoformat(), 'i': pk}
+    if reverse:
+        payload['r'] = 1
+    return _encode(payload)
+
+
+def decode_cursor(token):
+    """Devuelve `(awarded_date, id, reverse)` o lanza `InvalidCursor`."""
+    try:
+        payload = _decode(token)
+        return (
+            datetime.date.fromisoformat(payload['d']),
+            int(payload['i']),
+            bool(payload.get('r')),
+        )
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursor(str(exc)) from exc
+
+
+def encode_offset_cursor(offset) -> str:
+    """Token opaco de un desplazamiento (resultados por relevancia)."""
+    return _encode({'o': offset})
+
+
+def decode_offset_cursor(token):
+    """Devuelve el desplazamiento o lanza `InvalidCursor`."""
+    try:
+        offset = int(_decode(token)['o'])
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursor(str(exc)) from exc
+    if offset < 0:
+        raise InvalidCursor('Desplazamiento negativo.')
+    return offset
+
+
+class KeysetPage:
+    """Página de resultados con cursores a la página siguiente y anterior."""
+
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+
+def _key(row):
+    if isinstance(row, dict):
+        return row['awarded_date'], row['id']
+    return row.awarded_date, row.pk
+
+
+def before_key(date, pk):
+    """Condición `(awarded_date, id) < (date, pk)`.
+
+    El `awarded_date <= date` redundante permite al planificador usar el
+    índice `(awarded_date, id)` como rango en lugar de recorrerlo entero.
+    """
+    return Q(awarded_date__lte=date) & (Q(awarded_date__lt=date) | Q(awarded_date=date, id__lt=pk))
+
+
+def _keyset_query(queryset, cursor, page_size):
+    """Consulta de una página (`page_size + 1` filas) y su contexto."""
+    if cursor:
+        date, pk, reverse = decode_cursor(cursor)
+    else:
+        date, pk, reverse = None, None, False
+    if not reverse:
+        qs = queryset.order_by('-awarded_date', '-id')
+        if date is not None:
+            qs = qs.filter(before_key(date, pk))
+    else:
+        qs = queryset.order_by('awarded_date', 'id').filter(
+            Q(awarded_date__gte=date) & (Q(awarded_date__gt=date) | Q(awarded_date=date, id__gt=pk))
+        )
+    return qs[:page_size + 1], date, reverse
+
+
+def _keyset_page(rows, page_size, date, reverse):
+    has_more = len(rows) > page_size
+    if not reverse:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(*_key(rows[-1])) if has_more else None
+        prev_cursor = encode_cursor(*_key(rows[0]), reverse=True) if rows and date is not None else None
+    else:
+        rows = rows[:page_size][::-1]
+        prev_cursor = encode_cursor(*_key(rows[0]), reverse=True) if has_more else None
+        next_cursor = encode_cursor(*_key(rows[-1])) if rows else None
+    return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def paginate_keyset(queryset, cursor=None, page_size=10):
+    """Pagina `queryset` en orden `(-awarded_date, -id)`.
+
+    `queryset` puede ser de instancias o de `values()` (que debe incluir
+    `id` y `awarded_date`). Se piden `page_size + 1` filas para saber si
+    hay más sin contar el total.
+    """
+    qs, date, reverse = _keyset_query(queryset, cursor, page_size)
+    return _keyset_page(list(qs), page_size, date, reverse)
+
+
+async def apaginate_keyset(queryset, cursor=None, page_size=10):
+    """Versión asíncrona de `paginate_keyset` (ORM asíncrono)."""
+    qs, date, reverse = _keyset_query(queryset, cursor, page_size)
+    return _keyset_page([row async for row in qs], page_size, date, reverse)
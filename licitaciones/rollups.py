@@ -0,0 +1,133 @@
+"""Mantenimiento de `MarginRollup` (margen diario por cliente y producto).
+
+Un *slice* es un par `(día, cliente)`: todas las órdenes de licitaciones
+adjudicadas ese día a ese cliente. Cuando cambian órdenes o licitaciones se
+recalculan sólo los slices afectados (borrar + agregar sus órdenes), así
+que el coste es proporcional al cambio y no al tamaño de `Order`.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .importer import chunked
+from .models import Client, MarginRollup, Order, Tender, order_margin_expr, order_revenue_expr
+from .signals import tenders_changed
+
+
+SLICE_BATCH = 500
+
+
+def _slice_q(pairs, day_field, client_field):
+    q = Q()
+    for day, client_id in pairs:
+        q |= Q(**{day_field: day, client_field: client_id})
+    return q
+
+
+def _aggregate(orders):
+    """Filas de `MarginRollup` para las órdenes dadas (aún sin guardar)."""
+    rows = (
+        orders.order_by()
+        .values('tender__awarded_date', 'tender__client_obj_id', 'product_id')
+        .annotate(
+            margin=Sum(order_margin_expr()),
+            revenue=Sum(order_revenue_expr()),
+            total_quantity=Sum('quantity'),
+            orders=Count('pk'),
+        )
+    )
+    return [
+        MarginRollup(
+            day=r['tender__awarded_date'],
+            month=r['tender__awarded_date'].replace(day=1),
+            client_id=r['tender__client_obj_id'],
+            product_id=r['product_id'],
+            margin=r['margin'],
+            revenue=r['revenue'],
+            quantity=r['total_quantity'],
+            order_count=r['orders'],
+        )
+        for r in rows
+    ]
+
+
+def refresh_slices(pairs):
+    """Recalcula los rollups de los pares `(día, client_id)` dados."""
+    pairs = sorted({(d, c) for d, c in pairs if d is not None}, key=lambda p: (p[0], p[1] or 0))
+    for chunk in chunked(pairs, SLICE_BATCH):
+        with transaction.atomic():
+            MarginRollup.objects.filter(_slice_q(chunk, 'day', 'client_id')).delete()
+            orders = Order.objects.filter(_slice_q(chunk, 'tender__awarded_date', 'tender__client_obj_id'))
+            MarginRollup.objects.bulk_create(_aggregate(orders))
+
+
+@transaction.atomic
+def rebuild(batch_days=31, log=None):
+    """Reconstruye todos los rollups agregando por rangos de `batch_days` días.
+
+    Todo en una transacción: los lectores ven los rollups anteriores hasta
+    que termina.
+    """
+    log = log or (lambda msg: None)
+    dates = Tender.objects.filter(order_count__gt=0).order_by('awarded_date').values_list('awarded_date', flat=True)
+    first, last = dates.first(), dates.last()
+    MarginRollup.objects.all().delete()
+    written = 0
+    start = first
+    while start is not None and start <= last:
+        end = start + datetime.timedelta(days=batch_days)
+        rows = MarginRollup.objects.bulk_create(_aggregate(
+            Order.objects.filter(tender__awarded_date__gte=start, tender__awarded_date__lt=end)
+        ))
+        written += len(rows)
+        log(f'  {start.isoformat()}..{end.isoformat()}: {len(rows)} filas')
+        start = end
+    return written
+
+
+# -- mantenimiento incremental ---------------------------------------------
+
+def _pair(values):
+    return values.get('awarded_date'), values.get('client_obj_id')
+
+
+@receiver(tenders_changed, sender=Tender)
+def _tenders_bulk_written(sender, queryset, previous=(), totals_only=False, **kwargs):
+    pairs = {(t.awarded_date, t.client_obj_id) for t in previous}
+    # Con `totals_only` fecha y cliente no cambian: basta `previous`.
+    if not totals_only:
+        pairs.update(queryset.values_list('awarded_date', 'client_obj_id'))
+    refresh_slices(pairs)
+
+
+@receiver(post_save, sender=Tender)
+def _tender_saved(sender, instance, created, **kwargs):
+    # Una licitación nueva aún no tiene órdenes (las suyas emiten
+    # `tenders_changed`); sólo importa si cambian su fecha o cliente.
+    if created:
+        return
+    current = (instance.awarded_date, instance.client_obj_id)
+    loaded = _pair(getattr(instance, '_loaded_values', {}))
+    if loaded != current:
+        refresh_slices({current, loaded})
+
+
+@receiver(post_delete, sender=Tender)
+def _tender_deleted(sender, instance, **kwargs):
+    # Sus órdenes se borraron en cascada, sin pasar por `OrderQuerySet`.
+    refresh_slices({(instance.awarded_date, instance.client_obj_id)})
+
+
+@receiver(pre_delete, sender=Client)
+def _client_deleting(sender, instance, **kwargs):
+    # Sus rollups se borran en cascada y sus licitaciones pasan a no tener
+    # cliente: se recalculan después los slices `(día, None)`.
+    instance._rollup_days = set(Tender.objects.filter(client_obj=instance).values_list('awarded_date', flat=True))
+
+
+@receiver(post_delete, sender=Client)
+def _client_deleted(sender, instance, **kwargs):
+    refresh_slices({(day, None) for day in getattr(instance, '_rollup_days', ())})
@@ -0,0 +1,274 @@
+"""Búsqueda de texto para el buscador `q` de licitaciones y clientes.
+
+`icontains` (``LIKE '%...%'``) obliga a recorrer la tabla completa en cada
+búsqueda. Aquí se usan índices de texto según el motor:
+
+- PostgreSQL: extensión `pg_trgm` con índices GIN (`gin_trgm_ops`) sobre
+  ``UPPER(col::text)`` de identifier, normalized_identifier y el nombre del
+  cliente: es la expresión exacta a la que Django compila `icontains`
+  (``UPPER("col"::text) LIKE UPPER(%s)``), así que el filtro usa el índice.
+  Un índice sobre la columna sin `UPPER` no serviría. El orden se da por
+  `TrigramSimilarity`.
+- SQLite: tablas virtuales FTS5 con tokenizador `trigram` (búsqueda por
+  subcadena, sin distinguir mayúsculas) mantenidas por triggers; el orden
+  se da por `bm25`.
+
+Con otros motores, o con términos de menos de 3 caracteres (los trigramas
+no pueden indexarlos), se recurre a `icontains`.
+"""
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Client, normalize_identifier
+from .pagination import KeysetPage, decode_offset_cursor, encode_offset_cursor
+
+
+MIN_TERM_LENGTH = 3
+# Cuántos candidatos (mejor rankeados) se consideran al ordenar por relevancia.
+RANK_WINDOW = getattr(settings, 'SEARCH_RANK_WINDOW', 1000)
+
+TENDER_FTS = 'licitaciones_tender_fts'
+CLIENT_FTS = 'licitaciones_client_fts'
+
+# Tablas FTS presentes, por alias de conexión: se consultan una vez, no
+# en cada búsqueda. `install_search`/`uninstall_search` las olvidan.
+_fts_tables = {}
+
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TENDER_FTS} USING fts5(identifier, normalized_identifier, client_name, tokenize='trigram')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {CLIENT_FTS} USING fts5(name, tokenize='trigram')",
+]
+
+_TENDER_FTS_ROW = (
+    f"INSERT INTO {TENDER_FTS}(rowid, identifier, normalized_identifier, client_name) "
+    "VALUES (new.id, new.identifier, new.normalized_identifier, "
+    "COALESCE((SELECT name FROM licitaciones_client WHERE id = new.client_obj_id), ''));"
+)
+
+SQLITE_TRIGGERS = {
+    'licitaciones_tender_fts_ai': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_tender_fts_ai AFTER INSERT ON licitaciones_tender BEGIN "
+        f"{_TENDER_FTS_ROW} END"
+    ),
+    'licitaciones_tender_fts_au': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_tender_fts_au "
+        "AFTER UPDATE OF identifier, normalized_identifier, client_obj_id ON licitaciones_tender BEGIN "
+        f"DELETE FROM {TENDER_FTS} WHERE rowid = old.id; {_TENDER_FTS_ROW} END"
+    ),
+    'licitaciones_tender_fts_ad': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_tender_fts_ad AFTER DELETE ON licitaciones_tender BEGIN "
+        f"DELETE FROM {TENDER_FTS} WHERE rowid = old.id; END"
+    ),
+    'licitaciones_client_fts_ai': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_client_fts_ai AFTER INSERT ON licitaciones_client BEGIN "
+        f"INSERT INTO {CLIENT_FTS}(rowid, name) VALUES (new.id, new.name); END"
+    ),
+    'licitaciones_client_fts_au': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_client_fts_au AFTER UPDATE OF name ON licitaciones_client BEGIN "
+        f"UPDATE {CLIENT_FTS} SET name = new.name WHERE rowid = new.id; "
+        f"UPDATE {TENDER_FTS} SET client_name = new.name "
+        "WHERE rowid IN (SELECT id FROM licitaciones_tender WHERE client_obj_id = new.id); END"
+    ),
+    'licitaciones_client_fts_ad': (
+        "CREATE TRIGGER IF NOT EXISTS licitaciones_client_fts_ad AFTER DELETE ON licitaciones_client BEGIN "
+        f"DELETE FROM {CLIENT_FTS} WHERE rowid = old.id; END"
+    ),
+}
+
+SQLITE_REBUILD = [
+    f"DELETE FROM {TENDER_FTS}",
+    f"INSERT INTO {TENDER_FTS}(rowid, identifier, normalized_identifier, client_name) "
+    "SELECT t.id, t.identifier, t.normalized_identifier, COALESCE(c.name, '') "
+    "FROM licitaciones_tender t LEFT JOIN licitaciones_client c ON c.id = t.client_obj_id",
+    f"DELETE FROM {CLIENT_FTS}",
+    f"INSERT INTO {CLIENT_FTS}(rowid, name) SELECT id, name FROM licitaciones_client",
+]
+
+# Índice GIN de trigramas por columna, sobre la expresión de `icontains`.
+POSTGRES_INDEXES = {
+    'tender_identifier_upper_trgm': ('licitaciones_tender', 'identifier'),
+    'tender_normalized_upper_trgm': ('licitaciones_tender', 'normalized_identifier'),
+    'client_name_upper_trgm': ('licitaciones_client', 'name'),
+}
+POSTGRES_SCHEMA = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+    for name, (table, column) in POSTGRES_INDEXES.items()
+]
+
+
+def install_search(conn=None):
+    """Crea (si faltan) los índices/tablas de búsqueda del motor actual.
+
+    Es idempotente. En SQLite, si faltaba algún trigger (p.ej. porque una
+    migración reconstruyó la tabla) se reindexa todo el contenido.
+    """
+    conn = conn or connection
+    _fts_tables.pop(conn.alias, None)
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for sql in POSTGRES_SCHEMA:
+                cursor.execute(sql)
+        elif conn.vendor == 'sqlite':
+            try:
+                for sql in SQLITE_SCHEMA:
+                    cursor.execute(sql)
+            except Exception:
+                # SQLite compilado sin FTS5 o sin tokenizador trigram.
+                return
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            existing = {row[0] for row in cursor.fetchall()}
+            if not set(SQLITE_TRIGGERS) <= existing:
+                for sql in SQLITE_TRIGGERS.values():
+                    cursor.execute(sql)
+                for sql in SQLITE_REBUILD:
+                    cursor.execute(sql)
+
+
+def uninstall_search(conn=None):
+    conn = conn or connection
+    _fts_tables.pop(conn.alias, None)
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for name in POSTGRES_INDEXES:
+                cursor.execute(f'DROP INDEX IF EXISTS {name}')
+        elif conn.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            for table in (TENDER_FTS, CLIENT_FTS):
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+def ensure_search_schema(sender, using='default', **kwargs):
+    """Receptor de `post_migrate`: reinstala la búsqueda si hace falta."""
+    conn = connections[using]
+    if 'licitaciones_tender' in conn.introspection.table_names():
+        install_search(conn)
+
+
+def _fts_available(conn, table):
+    if conn.vendor != 'sqlite':
+        return False
+    if conn.alias not in _fts_tables:
+        _fts_tables[conn.alias] = {t for t in conn.introspection.table_names() if t in (TENDER_FTS, CLIENT_FTS)}
+    return table in _fts_tables[conn.alias]
+
+
+def _match_expr(*terms):
+    """Expresión MATCH de FTS5: cada término como frase literal."""
+    phrases = []
+    for term in terms:
+        if len(term) >= MIN_TERM_LENGTH and term not in phrases:
+            phrases.append(term)
+    return ' OR '.join('"%s"' % t.replace('"', '""') for t in phrases)
+
+
+def _terms(q):
+    q = q.strip()
+    return q, normalize_identifier(q)
+
+
+def _fts_subquery(table, match):
+    return RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match])
+
+
+def _fts_ranked_ids(table, match, limit):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT rowid FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s', [match, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _rank_by_ids(queryset, ranked_ids, limit, offset=0):
+    """Ordena según `ranked_ids` y completa (por fecha) si no alcanza."""
+    position = {pk: i for i, pk in enumerate(ranked_ids)}
+
+    def key(row):
+        return position[row['id'] if isinstance(row, dict) else row.pk]
+
+    ranked = sorted(queryset.filter(pk__in=ranked_ids), key=key)
+    rows = ranked[offset:offset + limit]
+    if len(rows) < limit:
+        start = max(offset - len(ranked), 0)
+        rows += list(queryset.exclude(pk__in=ranked_ids)[start:start + limit - len(rows)])
+    return rows
+
+
+def filter_tenders_by_text(queryset, q):
+    """Filtra licitaciones por identificador (con o sin guiones) o cliente."""
+    q, normalized = _terms(q)
+    if not q:
+        return queryset
+    if len(q) >= MIN_TERM_LENGTH and _fts_available(connection, TENDER_FTS):
+        return queryset.filter(pk__in=_fts_subquery(TENDER_FTS, _match_expr(q, normalized)))
+    # En PostgreSQL estos `icontains` usan los índices GIN de trigramas sobre
+    # `UPPER(col::text)`; el del cliente va como subconsulta para poder usar
+    # el índice de Client.
+    cond = Q(identifier__icontains=q) | Q(client_obj__in=Client.objects.filter(name__icontains=q))
+    if normalized:
+        cond |= Q(normalized_identifier__icontains=normalized)
+    return queryset.filter(cond)
+
+
+def rank_tenders(queryset, q, limit, offset=0):
+    """Devuelve hasta `limit` filas de `queryset` ordenadas por relevancia.
+
+    `queryset` ya debe estar filtrado con `filter_tenders_by_text`; se
+    saltan las primeras `offset`.
+    """
+    q, normalized = _terms(q)
+    if len(q) >= MIN_TERM_LENGTH:
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramSimilarity
+            from django.db.models.functions import Greatest
+
+            rank = Greatest(
+                TrigramSimilarity('identifier', q),
+                TrigramSimilarity('normalized_identifier', normalized),
+                TrigramSimilarity('client_obj__name', q),
+            )
+            return list(queryset.annotate(search_rank=rank).order_by('-search_rank', '-awarded_date', '-id')[offset:offset + limit])
+        if _fts_available(connection, TENDER_FTS):
+            ids = _fts_ranked_ids(TENDER_FTS, _match_expr(q, normalized), RANK_WINDOW)
+            return _rank_by_ids(queryset, ids, limit, offset)
+    return list(queryset[offset:offset + limit])
+
+
+def paginate_ranked(queryset, q, cursor=None, page_size=10):
+    """`KeysetPage` de `rank_tenders` con cursores de desplazamiento.
+
+    Como `paginate_keyset`, pide `page_size + 1` filas para saber si hay
+    más; un cursor inválido lanza `InvalidCursor`.
+    """
+    offset = decode_offset_cursor(cursor) if cursor else 0
+    rows = rank_tenders(queryset, q, page_size + 1, offset)
+    return KeysetPage(
+        rows[:page_size],
+        next_cursor=encode_offset_cursor(offset + page_size) if len(rows) > page_size else None,
+        prev_cursor=encode_offset_cursor(max(offset - page_size, 0)) if offset else None,
+    )
+
+
+def search_clients(queryset, q):
+    """Filtra clientes por nombre y los ordena por relevancia (queryset)."""
+    q = q.strip()
+    if not q:
+        return queryset
+    if len(q) >= MIN_TERM_LENGTH:
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramSimilarity
+
+            return (
+                queryset.filter(name__icontains=q)
+                .annotate(search_rank=TrigramSimilarity('name', q))
+                .order_by('-search_rank', *queryset.query.order_by)
+            )
+        if _fts_available(connection, CLIENT_FTS):
+            match = _match_expr(q)
+            rank = RawSQL(f'SELECT rank FROM {CLIENT_FTS} WHERE {CLIENT_FTS} MATCH %s AND rowid = licitaciones_client.id', [match])
+            return (
+                queryset.filter(pk__in=_fts_subquery(CLIENT_FTS, match))
+                .annotate(search_rank=rank)
+                .order_by('search_rank', *queryset.query.order_by)
+            )
+    return queryset.filter(name__icontains=q)
@@ -0,0 +1,13 @@
+from django.dispatch import Signal
+
+
+# Licitaciones modificadas por operaciones masivas que no emiten
+# `post_save` (UPDATE de totales, upserts del importador).
+# Argumentos: `queryset` con las licitaciones afectadas y, opcionalmente,
+# `previous`: instancias con los valores anteriores al cambio, y
+# `totals_only=True` si sólo cambiaron los totales (`refresh_totals`).
+tenders_changed = Signal()
+
+# Clientes o productos escritos en bloque (`bulk_create` del importador),
+# que tampoco emiten `post_save`. `sender` es el modelo (`Client`/`Product`).
+catalog_changed = Signal()
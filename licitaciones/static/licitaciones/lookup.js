@@ -0,0 +1,37 @@
+// Autocompletado de `LookupInput` (forms.py): al escribir se piden las
+// opciones a `data-lookup` y al elegir una se copia su id al campo oculto
+// `data-target`. Funciona también en las filas que se añaden después.
+(function () {
+  var timers = new WeakMap();
+
+  function matching(list, text) {
+    return Array.prototype.find.call(list.options, function (option) {
+      return option.value === text;
+    });
+  }
+
+  document.addEventListener('input', function (event) {
+    var input = event.target;
+    if (!input.matches || !input.matches('input.lookup')) return;
+    var hidden = document.getElementById(input.dataset.target);
+    var list = document.getElementById(input.getAttribute('list'));
+    var option = matching(list, input.value);
+    hidden.value = option ? option.dataset.id : '';
+    if (option || !input.value.trim()) return;
+
+    clearTimeout(timers.get(input));
+    timers.set(input, setTimeout(function () {
+      fetch(input.dataset.lookup + '?q=' + encodeURIComponent(input.value))
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          list.innerHTML = '';
+          data.results.forEach(function (item) {
+            var el = document.createElement('option');
+            el.value = item.label;
+            el.dataset.id = item.id;
+            list.appendChild(el);
+          });
+        });
+    }, 150));
+  });
+})();
@@ -0,0 +1,161 @@
+"""Mantenimiento de `ClientSummary` (totales por cliente).
+
+Al escribir órdenes (`refresh_totals`) se suma a cada cliente la diferencia
+entre los totales nuevos y los anteriores de sus licitaciones (leídos con
+la fila bloqueada), así que el coste no depende de cuántas licitaciones
+tenga. Cuando se crean, mueven o
+borran licitaciones se recalculan los clientes afectados agregando los
+totales ya almacenados en sus licitaciones (una fila por licitación).
+Sólo tienen fila los clientes con licitaciones: el resto cuenta como cero.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Q, Sum, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .importer import chunked
+from .models import MONEY_FIELD, ClientSummary, Tender
+from .signals import tenders_changed
+
+
+CLIENT_BATCH = 500
+SUMMARY_FIELDS = ('tender_count', 'order_count', 'revenue', 'cost', 'margin', 'last_awarded_date')
+
+
+def _summaries(condition):
+    """`ClientSummary` (sin guardar) de los clientes con licitaciones que cumplen `condition`."""
+    rows = (
+        Tender.objects.filter(condition, client_obj__isnull=False)
+        .order_by()
+        .values('client_obj_id')
+        .annotate(
+            tenders=Count('pk'),
+            orders=Sum('order_count'),
+            revenue=Sum('total_revenue'),
+            margin=Sum('total_margin'),
+            last_awarded=Max('awarded_date'),
+        )
+    )
+    return [
+        ClientSummary(
+            client_id=r['client_obj_id'],
+            tender_count=r['tenders'],
+            order_count=r['orders'],
+            revenue=r['revenue'],
+            cost=r['revenue'] - r['margin'],
+            margin=r['margin'],
+            last_awarded_date=r['last_awarded'],
+        )
+        for r in rows
+    ]
+
+
+def _refresh(condition, client_ids=()):
+    summaries = _summaries(condition)
+    if summaries:
+        ClientSummary.objects.bulk_create(
+            summaries, update_conflicts=True, unique_fields=['client'], update_fields=SUMMARY_FIELDS,
+        )
+    # Los que se quedaron sin licitaciones pierden su fila.
+    empty = set(client_ids) - {s.client_id for s in summaries}
+    if empty:
+        ClientSummary.objects.filter(client_id__in=empty).delete()
+
+
+def refresh_clients(client_ids=(), tenders=None):
+    """Recalcula los totales de los clientes dados (ids) y de los de `tenders`.
+
+    Con `tenders` (queryset de licitaciones) sus clientes se filtran con una
+    subconsulta, en la misma consulta que agrega.
+    """
+    client_ids = sorted({c for c in client_ids if c is not None})
+    if tenders is not None:
+        _refresh(Q(client_obj_id__in=tenders.values('client_obj_id')) | Q(client_obj_id__in=client_ids), client_ids)
+        return
+    for chunk in chunked(client_ids, CLIENT_BATCH):
+        _refresh(Q(client_obj_id__in=chunk), chunk)
+
+
+def apply_deltas(previous, tenders):
+    """Suma a cada cliente la diferencia de totales de `tenders` frente a `previous`.
+
+    `previous` son las licitaciones con los totales anteriores y `tenders`
+    un queryset con las mismas ya actualizadas (mismo cliente y fecha). Un
+    cliente sin fila no se toca: su primera licitación la crea al
+    recalcularlo entero (`post_save` o `tenders_changed` de la alta).
+    """
+    # `refresh_totals` no cambia el cliente: sin clientes no hay nada que sumar.
+    if not any(t.client_obj_id is not None for t in previous):
+        return
+    deltas = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    for t in previous:
+        if t.client_obj_id is not None:
+            d = deltas[t.client_obj_id]
+            d[0] -= t.order_count
+            d[1] -= t.total_revenue
+            d[2] -= t.total_margin
+    rows = tenders.filter(client_obj__isnull=False).values_list('client_obj_id', 'order_count', 'total_revenue', 'total_margin')
+    for client_id, orders, revenue, margin in rows:
+        d = deltas[client_id]
+        d[0] += orders
+        d[1] += revenue
+        d[2] += margin
+    deltas = {c: (orders, revenue, revenue - margin, margin) for c, (orders, revenue, margin) in deltas.items() if any((orders, revenue, margin))}
+    if not deltas:
+        return
+
+    # Un solo UPDATE para todos los clientes: campo + CASE client_id ... END.
+    def shifted(field, i, output_field):
+        return F(field) + Case(
+            *[When(client_id=c, then=Value(d[i], output_field=output_field)) for c, d in deltas.items()],
+            default=Value(0, output_field=output_field),
+            output_field=output_field,
+        )
+
+    ClientSummary.objects.filter(client_id__in=list(deltas)).update(
+        order_count=shifted('order_count', 0, IntegerField()),
+        revenue=shifted('revenue', 1, MONEY_FIELD),
+        cost=shifted('cost', 2, MONEY_FIELD),
+        margin=shifted('margin', 3, MONEY_FIELD),
+    )
+
+
+@transaction.atomic
+def rebuild():
+    """Recalcula los totales de todos los clientes.
+
+    Todo en una transacción: los lectores ven los totales anteriores hasta
+    que termina.
+    """
+    ClientSummary.objects.all().delete()
+    return len(ClientSummary.objects.bulk_create(_summaries(Q()), batch_size=2000))
+
+
+# -- mantenimiento incremental ---------------------------------------------
+
+@receiver(tenders_changed, sender=Tender)
+def _tenders_bulk_written(sender, queryset, previous=(), totals_only=False, **kwargs):
+    if totals_only:
+        apply_deltas(previous, queryset)
+    else:
+        refresh_clients({t.client_obj_id for t in previous}, tenders=queryset)
+
+
+@receiver(post_save, sender=Tender)
+def _tender_saved(sender, instance, created, **kwargs):
+    # Una licitación nueva cuenta aunque aún no tenga órdenes; una existente
+    # sólo si cambian su cliente o su fecha (los totales llegan con
+    # `tenders_changed`).
+    loaded = getattr(instance, '_loaded_values', {})
+    previous = (loaded.get('client_obj_id'), loaded.get('awarded_date'))
+    if created or previous != (instance.client_obj_id, instance.awarded_date):
+        refresh_clients({instance.client_obj_id, previous[0]})
+
+
+@receiver(post_delete, sender=Tender)
+def _tender_deleted(sender, instance, **kwargs):
+    refresh_clients({instance.client_obj_id})
+
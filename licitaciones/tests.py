@@ -1,3 +1,1558 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+from unittest import mock, skipUnless
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import admin as licitaciones_admin, async_views, dbtuning, identifiers, instrumentation, lookups, metrics, reporting, search, views
+from .caching import cache_stats, reset_cache_stats
+from .feeds import download, iter_json_records
+from .forms import OrderFormSet
+from .importer import BulkImporter
+from .pagination import encode_offset_cursor
+from .management.commands import import_sample_data
+from .reporting import margin_report
+from .models import Tender, TenderQuerySet, Product, Order, Client, ClientSummary, MarginRollup, normalize_identifier
+
+
+SAMPLE_PRODUCTS = [
+    {'sku': 'P-1', 'title': 'Guantes', 'cost': '10.00', 'price': '15.00'},
+    {'sku': 'P-2', 'title': 'Mascarillas', 'cost': '2.00'},
+    {'sku': 'P-3', 'title': 'Inválido', 'cost': '5.00', 'price': '4.00'},
+]
+SAMPLE_TENDERS = [
+    {'id': '1234-56-LE24', 'client': 'Hospital Norte', 'creation_date': '2024-03-01'},
+    {'id': '9999-00-LE24', 'client': 'Hospital Sur', 'creation_date': '2024-03-02'},
+]
+SAMPLE_ORDERS = [
+    {'tender_id': '123456LE24', 'product_id': 'P-1', 'quantity': 3, 'price': 20},
+    {'tender_id': '1234-56-LE24', 'product_id': 'P-2', 'quantity': 10, 'price': 0},
+    {'tender_id': '1234-56-LE24', 'product_id': 'NOPE', 'quantity': 1, 'price': 5},
+]
+
+
+def follow_link(client, url, rel):
+    """URL de la cabecera `Link` con relación `rel` (o None)."""
+    link = client.get(url).headers.get('Link', '')
+    for part in link.split(', '):
+        if part.endswith(f'rel="{rel}"'):
+            return part[1:part.index('>')]
+    return None
+
+
+def make_tender(identifier, client=None, lines=((1, '15.00', '10.00'),), awarded_date='2024-01-01'):
+    """Crea una licitación con sus órdenes `(cantidad, precio, coste)`."""
+    product, _ = Product.objects.get_or_create(sku='SKU-T', defaults={'name': 'Test', 'price': Decimal('15.00'), 'cost': Decimal('10.00')})
+    client_obj = Client.objects.get_or_create(name=client)[0] if client else None
+    tender = Tender.objects.create(identifier=identifier, client_obj=client_obj, awarded_date=awarded_date)
+    for quantity, price, cost in lines:
+        Order.objects.create(tender=tender, product=product, quantity=quantity, unit_price=Decimal(price), unit_cost=Decimal(cost))
+    return tender
+
+
+class TenderTotalsTests(TestCase):
+    def assertTotals(self, tender, margin, revenue, count):
+        tender.refresh_from_db()
+        self.assertEqual(
+            (tender.total_margin, tender.total_revenue, tender.order_count),
+            (Decimal(margin), Decimal(revenue), count),
+        )
+
+    def test_totals_follow_order_writes(self):
+        tender = make_tender('A-1', lines=((2, '15.00', '10.00'),))
+        self.assertTotals(tender, '10.00', '30.00', 1)
+
+        order = tender.orders.get()
+        order.quantity = 3
+        order.save()
+        self.assertTotals(tender, '15.00', '45.00', 1)
+
+        product = Product.objects.get()
+        Order.objects.bulk_create([
+            Order(tender=tender, product=product, quantity=1, unit_price=Decimal('12.00'), unit_cost=Decimal('10.00')),
+        ])
+        self.assertTotals(tender, '17.00', '57.00', 2)
+
+        Order.objects.filter(tender=tender).update(quantity=1)
+        self.assertTotals(tender, '7.00', '27.00', 2)
+
+        Order.objects.filter(unit_price=Decimal('12.00')).delete()
+        self.assertTotals(tender, '5.00', '15.00', 1)
+
+        tender.orders.get().delete()
+        self.assertTotals(tender, '0', '0', 0)
+
+    def test_moving_an_order_refreshes_both_tenders(self):
+        a = make_tender('A-1')
+        b = make_tender('B-1')
+        order = Order.objects.get(tender=a)
+        order.tender = b
+        order.save()
+        self.assertTotals(a, '0', '0', 0)
+        self.assertTotals(b, '10.00', '30.00', 2)
+
+    def test_queryset_update_refreshes_without_loading_orders(self):
+        a = make_tender('A-1', lines=((2, '15.00', '10.00'),) * 3)
+        b = make_tender('B-1', lines=((1, '15.00', '10.00'),))
+        # Sin tocar el filtro ni la licitación: los totales se refrescan con
+        # una subconsulta, sin leer las órdenes (mismas consultas con más filas).
+        with CaptureQueriesContext(connection) as ctx:
+            Order.objects.filter(tender=a).update(quantity=1)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('SELECT "licitaciones_order"')])
+        self.assertTotals(a, '15.00', '45.00', 3)
+        # Filtrando por el campo que se asigna, y moviendo de licitación.
+        Order.objects.filter(quantity=1).update(quantity=4)
+        self.assertTotals(a, '60.00', '180.00', 3)
+        self.assertTotals(b, '20.00', '60.00', 1)
+        Order.objects.filter(tender=b).update(tender=a)
+        self.assertTotals(a, '80.00', '240.00', 4)
+        self.assertTotals(b, '0', '0', 0)
+
+    def test_single_order_save_cost(self):
+        # Una `save()` por fila: guardar, refrescar totales (con sus totales
+        # previos), rollup del día y diferencia del resumen del cliente. Los
+        # formularios (alta y admin) guardan en bloque con `save_with_orders`.
+        tender = make_tender('A-1', client='Hospital')
+        order = tender.orders.select_related('product').get()
+        order.quantity = 5
+        with self.assertNumQueries(12):
+            order.save()
+        self.assertTotals(tender, '25.00', '75.00', 1)
+
+    def test_saving_a_stale_tender_keeps_totals(self):
+        tender = make_tender('A-1')
+        stale = Tender.objects.get(pk=tender.pk)
+        Order.objects.create(tender=tender, product=Product.objects.get(), quantity=1, unit_price=Decimal('15.00'), unit_cost=Decimal('10.00'))
+        stale.save()
+        self.assertTotals(tender, '10.00', '30.00', 2)
+
+    def test_rebuild_and_verify_command(self):
+        tender = make_tender('A-1')
+        call_command('rebuild_tender_totals', '--verify', stdout=io.StringIO())
+        Tender.objects.filter(pk=tender.pk).update(total_margin=Decimal('999'))
+        with self.assertRaises(CommandError):
+            call_command('rebuild_tender_totals', '--verify', stdout=io.StringIO())
+        call_command('rebuild_tender_totals', stdout=io.StringIO())
+        self.assertTotals(tender, '5.00', '15.00', 1)
+
+    def test_margin_filter_uses_stored_total(self):
+        make_tender('A-1', lines=((10, '15.00', '10.00'),))
+        make_tender('B-1')
+        response = self.client.get(reverse('tender_list'), {'min_margin': '20'})
+        self.assertEqual([r['identifier'] for r in response.json()], ['A-1'])
+
+
+class CreateWithOrdersTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(sku='SKU-V', name='Test', price=Decimal('15.00'), cost=Decimal('10.00'))
+
+    def lines(self, n):
+        return [Order(product=self.product, quantity=1) for _ in range(n)]
+
+    def test_query_count_does_not_grow_with_lines(self):
+        with self.assertNumQueries(15) as ctx:
+            tender = Tender.objects.create_with_orders(self.lines(1), identifier='N-1', awarded_date='2024-01-01')
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            big = Tender.objects.create_with_orders(self.lines(25), identifier='N-2', awarded_date='2024-01-01')
+        self.assertEqual((tender.order_count, tender.total_margin), (1, Decimal('5.00')))
+        self.assertEqual((big.order_count, big.total_margin), (25, Decimal('125.00')))
+        self.assertEqual(big.normalized_identifier, 'N2')
+
+    def test_rejects_missing_lines_duplicates_and_bad_lines(self):
+        make_tender('D-1')
+        with self.assertRaisesMessage(ValidationError, 'sin productos'):
+            Tender.objects.create_with_orders([], identifier='E-1', awarded_date='2024-01-01')
+        with self.assertRaises(ValidationError) as ctx:
+            Tender.objects.create_with_orders(self.lines(1), identifier='D-1', awarded_date='2024-01-01')
+        self.assertIn('identifier', ctx.exception.message_dict)
+        bad = Order(product=self.product, quantity=1, unit_price=Decimal('9.00'))
+        with self.assertRaisesMessage(ValidationError, 'mayor que el costo'):
+            Tender.objects.create_with_orders([bad], identifier='E-2', awarded_date='2024-01-01')
+        self.assertFalse(Tender.objects.filter(identifier__startswith='E-').exists())
+
+        errors = Tender.objects.bulk_validate([
+            (Tender(identifier='F-1', awarded_date='2024-01-01'), self.lines(1)),
+            (Tender(identifier='F-1', awarded_date='no-fecha'), self.lines(1)),
+        ])
+        self.assertEqual(list(errors), [1])
+        self.assertEqual(set(errors[1].message_dict), {'identifier', 'awarded_date'})
+
+    def post_tender(self, identifier, lines):
+        data = {
+            'identifier': identifier, 'client_obj': '', 'awarded_date': '2024-01-01',
+            'orders-TOTAL_FORMS': str(len(lines)), 'orders-INITIAL_FORMS': '0',
+        }
+        for n, (quantity, price, cost) in enumerate(lines):
+            data.update({
+                f'orders-{n}-product': self.product.pk, f'orders-{n}-quantity': quantity,
+                f'orders-{n}-unit_price': price, f'orders-{n}-unit_cost': cost,
+            })
+        return self.client.post(reverse('tender_create'), data)
+
+    def test_tender_create_view(self):
+        response = self.post_tender('V-1', [])
+        self.assertContains(response, 'Debe incluir al menos una orden')
+        response = self.post_tender('V-1', [(2, '15.00', '10.00'), (1, '12.00', '10.00')])
+        self.assertRedirects(response, reverse('tender_detail_html', args=['V-1']))
+        self.assertEqual(Tender.objects.get(identifier='V-1').total_margin, Decimal('12.00'))
+
+
+class AdminPerformanceTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        self.client.force_login(get_user_model().objects.create_superuser('admin', password=None))
+        make_tender('A-1', client='Hospital', lines=((1, '15.00', '10.00'), (2, '12.00', '10.00')))
+        make_tender('B-1', client='Clínica')
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelists_run_constant_queries(self):
+        urls = ('/admin/licitaciones/tender/', '/admin/licitaciones/tender/?o=6', '/admin/licitaciones/order/?o=6')
+        before = [self.queries(url) for url in urls]
+        for n in range(10):
+            make_tender(f'C-{n}', client=f'Cliente {n}', lines=((1, '15.00', '10.00'), (1, '14.00', '10.00')))
+        self.assertEqual([self.queries(url) for url in urls], before)
+
+    def test_sorts_by_annotated_margin(self):
+        for order, expected in (('6', ['A-1', 'B-1']), ('-6', ['B-1', 'A-1'])):
+            response = self.client.get('/admin/licitaciones/tender/', {'o': order})
+            self.assertEqual([t.identifier for t in response.context['cl'].result_list], expected)
+        # 9.00 / 39.00 y 5.00 / 15.00
+        self.assertContains(response, '23.08 %')
+        self.assertContains(response, '33.33 %')
+        for order, expected in (('5', ['B-1', 'A-1']), ('-5', ['A-1', 'B-1'])):
+            response = self.client.get('/admin/licitaciones/tender/', {'o': order})
+            self.assertEqual([t.identifier for t in response.context['cl'].result_list], expected)
+        self.assertContains(response, '<td class="field-total_margin_display">9,00</td>', html=True)
+        self.assertContains(response, 'Total Margin')
+
+    def test_estimated_count_only_for_large_unfiltered_tables(self):
+        paginator = licitaciones_admin.EstimatedCountPaginator
+        with mock.patch.object(licitaciones_admin, 'estimated_count', return_value=2_000_000):
+            self.assertEqual(paginator(Order.objects.order_by('pk'), 100).count, 2_000_000)
+            self.assertEqual(paginator(Order.objects.filter(quantity=2).order_by('pk'), 100).count, 1)
+        with mock.patch.object(licitaciones_admin, 'estimated_count', return_value=10):
+            self.assertEqual(paginator(Order.objects.order_by('pk'), 100).count, 3)
+
+    @mock.patch.object(licitaciones_admin.OrderInline, 'per_page', 1)
+    def test_order_inline_is_paginated(self):
+        tender = Tender.objects.get(identifier='A-1')
+        url = f'/admin/licitaciones/tender/{tender.pk}/change/'
+        response = self.client.get(url, {'lineas': 2})
+        [formset] = [f.formset for f in response.context['inline_admin_formsets']]
+        self.assertEqual([f.instance.quantity for f in formset.forms], [2])
+        self.assertContains(response, 'página 2 de 2')
+        # Borrar la única línea visible no deja la licitación sin órdenes.
+        order = formset.forms[0].instance
+        data = {
+            'identifier': 'A-1', 'client_obj': tender.client_obj_id, 'awarded_date': '2024-01-01',
+            'orders-TOTAL_FORMS': '1', 'orders-INITIAL_FORMS': '1', 'orders-MIN_NUM_FORMS': '0', 'orders-MAX_NUM_FORMS': '1000',
+            'orders-0-id': order.pk, 'orders-0-tender': tender.pk, 'orders-0-product': order.product_id,
+            'orders-0-quantity': '2', 'orders-0-DELETE': 'on',
+        }
+        response = self.client.post(f'{url}?lineas=2', data)
+        self.assertEqual(response.status_code, 302)
+        tender.refresh_from_db()
+        self.assertEqual((tender.order_count, tender.total_margin), (1, Decimal('5.00')))
+
+    def test_inline_save_does_not_save_per_order(self):
+        tender = make_tender('C-1', client='Hospital', lines=((1, '15.00', '10.00'),) * 8)
+        orders = list(tender.orders.order_by('pk'))
+        data = {
+            'identifier': tender.identifier, 'client_obj': tender.client_obj_id, 'awarded_date': '2024-01-01',
+            'orders-TOTAL_FORMS': str(len(orders)), 'orders-INITIAL_FORMS': str(len(orders)),
+            'orders-MIN_NUM_FORMS': '0', 'orders-MAX_NUM_FORMS': '1000',
+        }
+        for n, order in enumerate(orders):
+            data.update({
+                f'orders-{n}-id': order.pk, f'orders-{n}-tender': tender.pk,
+                f'orders-{n}-product': order.product_id, f'orders-{n}-quantity': '3',
+            })
+        # Las órdenes se guardan en bloque (`save_with_orders`), nunca con una
+        # `Order.save()` por fila.
+        with mock.patch.object(Order, 'save', side_effect=AssertionError('Order.save por fila')):
+            response = self.client.post(f'/admin/licitaciones/tender/{tender.pk}/change/', data)
+        self.assertEqual(response.status_code, 302)
+        tender.refresh_from_db()
+        self.assertEqual((tender.order_count, tender.total_margin), (8, Decimal('120.00')))
+
+
+class LookupTests(TestCase):
+    def setUp(self):
+        self.norte = Client.objects.create(name='Hospital Norte')
+        self.clinica = Client.objects.create(name='Clínica Sur')
+        self.product = Product.objects.create(sku='SKU-L1', name='Guantes de látex', price=Decimal('2.00'), cost=Decimal('1.00'))
+
+    def search(self, kind, q, **params):
+        response = self.client.get(reverse('lookup_autocomplete', args=[kind]), {'q': q, **params})
+        return [item['label'] for item in response.json()['results']]
+
+    def test_prefix_search_by_word_without_accents(self):
+        self.assertEqual(self.search('clients', 'norte'), ['Hospital Norte'])
+        self.assertEqual(self.search('clients', 'CLINI'), ['Clínica Sur'])
+        self.assertEqual(self.search('products', 'latex'), ['Guantes de látex (SKU-L1)'])
+        self.assertEqual(self.search('products', 'sku-l'), ['Guantes de látex (SKU-L1)'])
+        self.assertEqual(self.search('clients', ''), [])
+        self.assertEqual(self.client.get(reverse('lookup_autocomplete', args=['tenders'])).status_code, 404)
+
+    def test_table_is_rebuilt_after_writes(self):
+        Client.objects.create(name='Hospital Oeste')
+        self.assertEqual(self.search('clients', 'hosp', limit=1), ['Hospital Norte'])
+        self.assertEqual(self.search('clients', 'hosp'), ['Hospital Norte', 'Hospital Oeste'])
+        table = lookups.table('clients')
+        with self.assertNumQueries(0):
+            self.assertIs(lookups.table('clients'), table)
+        # Altas en bloque del importador (sin post_save).
+        BulkImporter()._load_clients({'Hospital Este'})
+        self.assertEqual(self.search('clients', 'este'), ['Hospital Este'])
+
+    def test_writes_from_other_processes_show_up_after_max_age(self):
+        self.assertEqual(self.search('clients', 'norte'), ['Hospital Norte'])
+        # Un UPDATE sin señales, como el de otro worker con su propia caché.
+        Client.objects.filter(pk=self.norte.pk).update(name='Hospital Poniente')
+        self.assertEqual(self.search('clients', 'norte'), ['Hospital Norte'])
+        now = lookups.time.monotonic()
+        with mock.patch.object(lookups.time, 'monotonic', return_value=now + lookups.LOOKUP_MAX_AGE):
+            self.assertEqual(self.search('clients', 'poniente'), ['Hospital Poniente'])
+
+    def test_forms_render_only_the_selected_label(self):
+        response = self.client.get(reverse('tender_create'))
+        self.assertNotContains(response, '<option')
+        self.assertContains(response, 'licitaciones/lookup.js')
+        form = OrderFormSet(instance=Tender()).empty_form
+        form.initial['product'] = self.product.pk
+        lookups.table('products')
+        with self.assertNumQueries(0):
+            html = str(form['product'])
+        self.assertIn('value="Guantes de látex (SKU-L1)"', html)
+
+
+@override_settings(TENDER_BULK_TOKEN='secreto')
+class TenderBulkApiTests(TestCase):
+    def setUp(self):
+        Product.objects.create(sku='SKU-A', name='Guantes', price=Decimal('15.00'), cost=Decimal('10.00'))
+        Product.objects.create(sku='SKU-B', name='Mascarillas', price=Decimal('3.00'), cost=Decimal('2.00'))
+
+    def doc(self, identifier, client='Hospital', lines=(('SKU-A', 2),), awarded_date='2024-01-01'):
+        return {
+            'identifier': identifier, 'client': client, 'awarded_date': awarded_date,
+            'orders': [{'product_sku': sku, 'quantity': quantity} for sku, quantity in lines],
+        }
+
+    def post(self, body, content_type='application/json', **headers):
+        headers.setdefault('Authorization', 'Bearer secreto')
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        return self.client.post(reverse('tender_bulk'), body, content_type=content_type, headers=headers)
+
+    def test_creates_and_reports_per_record(self):
+        response = self.post([
+            self.doc('B-1', lines=(('SKU-A', 2), ('SKU-B', 5))),
+            self.doc('B-2', client='Clínica'),
+            self.doc('B-3', lines=(('NOPE', 1),)),
+            {'identifier': 'B-4', 'awarded_date': '2024-01-01', 'orders': []},
+            self.doc('B-5', awarded_date='no-fecha'),
+            self.doc('B1'),
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['summary'], {'created': 2, 'updated': 0, 'unchanged': 0, 'error': 4})
+        self.assertEqual([r['status'] for r in data['results']], ['created', 'created', 'error', 'error', 'error', 'error'])
+        self.assertEqual([r['index'] for r in data['results']], list(range(6)))
+        self.assertIn('orders', data['results'][2]['errors'])
+        self.assertIn('awarded_date', data['results'][4]['errors'])
+        tender = Tender.objects.get(identifier='B-1')
+        self.assertEqual((tender.order_count, tender.total_margin, tender.client_obj.name), (2, Decimal('15.00'), 'Hospital'))
+        self.assertEqual(tender.normalized_identifier, 'B1')
+        self.assertFalse(Tender.objects.filter(identifier__in=['B-3', 'B-4', 'B-5']).exists())
+
+    def test_retries_are_idempotent(self):
+        docs = [self.doc('R-1'), self.doc('R-2')]
+        self.post(docs)
+        response = self.post(docs)
+        self.assertEqual(response.json()['summary']['unchanged'], 2)
+        self.assertEqual(Order.objects.count(), 2)
+        # Mismo id sin guiones y otras líneas: se reemplazan, no se suman.
+        response = self.post([self.doc('R2', client='Clínica', lines=(('SKU-B', 4),), awarded_date='2024-02-01')])
+        self.assertEqual(response.json()['results'], [{'identifier': 'R-2', 'status': 'updated', 'index': 0}])
+        tender = Tender.objects.get(identifier='R-2')
+        self.assertEqual((tender.order_count, tender.total_margin, tender.client_obj.name), (1, Decimal('4.00'), 'Clínica'))
+        self.assertEqual(Order.objects.count(), 2)
+        rollups = MarginRollup.objects.order_by('day').values_list('day', 'margin')
+        self.assertEqual([(d.isoformat(), m) for d, m in rollups], [('2024-01-01', Decimal('10.00')), ('2024-02-01', Decimal('4.00'))])
+
+    def test_ndjson_query_count_does_not_grow_with_records(self):
+        def ndjson(prefix, count, lines):
+            return '\n'.join(json.dumps(self.doc(f'{prefix}-{n}', lines=(('SKU-A', 1),) * lines)) for n in range(count))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.post(ndjson('N', 1, 1), content_type='application/x-ndjson')
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            # 150 líneas: aún caben en un INSERT con el límite de parámetros de SQLite.
+            response = self.post(ndjson('M', 10, 15), content_type='application/x-ndjson')
+        self.assertEqual(response.json()['summary']['created'], 10)
+        self.assertEqual(Order.objects.filter(tender__identifier__startswith='M-').count(), 150)
+
+    def test_invalid_json_and_token(self):
+        response = self.post('[' + json.dumps(self.doc('J-1')) + ', {"identifier": ')
+        self.assertEqual(response.status_code, 400)
+        # Los registros leídos antes del error se importan y se informan.
+        self.assertEqual(response.json()['results'], [{'identifier': 'J-1', 'status': 'created', 'index': 0}])
+        self.assertTrue(Tender.objects.filter(identifier='J-1').exists())
+        self.assertEqual(self.post([self.doc('T-1')], Authorization='').status_code, 401)
+        self.assertEqual(self.post([self.doc('T-1')], Authorization='Bearer otro').status_code, 401)
+        self.assertEqual(self.post([self.doc('T-1')]).json()['summary']['created'], 1)
+
+    def test_rolled_back_chunk_leaves_no_clients(self):
+        with mock.patch.object(Order.objects, 'bulk_create', side_effect=IntegrityError('carrera')):
+            response = self.post([self.doc('C-1', client='Cliente Nuevo')])
+        self.assertEqual(response.json()['summary']['error'], 1)
+        self.assertFalse(Client.objects.filter(name='Cliente Nuevo').exists())
+        self.assertEqual(self.post([self.doc('C-1', client='Cliente Nuevo')]).json()['summary']['created'], 1)
+        self.assertEqual(Tender.objects.get(identifier='C-1').client_obj.name, 'Cliente Nuevo')
+
+    def test_identifiers_shadowed_by_routes_are_rejected(self):
+        response = self.post([self.doc('bulk'), self.doc('Ba-tch'), self.doc('export.csv'), self.doc('bulk-1')])
+        self.assertEqual([r['status'] for r in response.json()['results']], ['error', 'error', 'error', 'created'])
+        self.assertIn('reservado', response.json()['results'][0]['errors']['identifier'][0])
+        with self.assertRaises(ValidationError):
+            make_tender('new')
+
+    def test_rejected_without_configured_token(self):
+        # Con la configuración por defecto (sin token) nadie puede escribir.
+        with self.settings(TENDER_BULK_TOKEN=''):
+            self.assertEqual(self.post([self.doc('T-1')], Authorization='').status_code, 403)
+            self.assertEqual(self.post([self.doc('T-1')], Authorization='Bearer ').status_code, 403)
+        self.assertFalse(Tender.objects.filter(identifier='T-1').exists())
+
+
+class TenderListApiTests(TestCase):
+    def test_json_list_uses_annotated_margin(self):
+        make_tender('A-1', client='Hospital', lines=((2, '15.00', '10.00'), (1, '5.50', '5.00')), awarded_date='2024-02-01')
+        make_tender('B-2', awarded_date='2024-01-01')
+        response = self.client.get(reverse('tender_list'))
+        self.assertEqual(response.json(), [
+            {'identifier': 'A-1', 'client': 'Hospital', 'awarded_date': '2024-02-01', 'total_margin': '10.50'},
+            {'identifier': 'B-2', 'client': '', 'awarded_date': '2024-01-01', 'total_margin': '5.00'},
+        ])
+
+    def test_json_list_query_count_is_constant(self):
+        make_tender('A-1', client='Hospital')
+        with self.assertNumQueries(1):
+            self.client.get(reverse('tender_list'))
+        for n in range(10):
+            make_tender(f'X-{n}', client=f'Cliente {n}')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('tender_list'), {'client': 'Cliente'})
+        self.assertEqual(len(response.json()), 10)
+
+
+class TenderDetailApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_tender('A-1', client='Hospital', lines=((2, '15.00', '10.00'), (3, '0.30', '0.10'), (1, '5.00', '4.00')))
+        make_tender('B-1', lines=((1, '9.00', '6.00'),))
+
+    def test_lines_with_sql_margins_in_two_queries(self):
+        with self.assertNumQueries(2):
+            data = self.client.get(reverse('tender_detail', args=['A-1'])).json()
+        self.assertEqual(data['client'], 'Hospital')
+        self.assertEqual(data['total_margin'], '11.60')
+        self.assertEqual(
+            [(i['margin'], i['margin_pct'], i['running_margin'], i['running_revenue']) for i in data['items']],
+            [('10.00', '33.33', '10.00', '30.00'), ('0.60', '66.67', '10.60', '30.90'), ('1.00', '20.00', '11.60', '35.90')],
+        )
+        self.assertNotIn('items_next_cursor', data)
+
+    def test_items_limit_and_cursor_keep_running_totals(self):
+        url = reverse('tender_detail', args=['A-1'])
+        first = self.client.get(url, {'items_limit': 2}).json()
+        self.assertEqual([i['margin'] for i in first['items']], ['10.00', '0.60'])
+        second = self.client.get(url, {'items_limit': 2, 'items_cursor': first['items_next_cursor']}).json()
+        self.assertEqual([(i['margin'], i['running_margin']) for i in second['items']], [('1.00', '11.60')])
+        self.assertIsNone(second['items_next_cursor'])
+        self.assertEqual(self.client.get(url, {'items_cursor': 'x'}).status_code, 400)
+        response = self.client.get(reverse('tender_detail_html', args=['A-1']), {'items_limit': 2})
+        self.assertContains(response, 'items_cursor=2')
+
+    def test_batch_returns_details_in_two_queries(self):
+        with self.assertNumQueries(2):
+            data = self.client.get(reverse('tender_batch'), {'ids': 'B-1,NOPE,A-1', 'items_limit': 1}).json()
+        self.assertEqual([t['identifier'] for t in data['tenders']], ['B-1', 'A-1'])
+        self.assertEqual(data['missing'], ['NOPE'])
+        self.assertEqual([len(t['items']) for t in data['tenders']], [1, 1])
+        self.assertEqual([t['items_next_cursor'] for t in data['tenders']], [None, '1'])
+        single = self.client.get(reverse('tender_detail', args=['A-1']), {'items_limit': 1}).json()
+        self.assertEqual(data['tenders'][1], single)
+        self.assertEqual(self.client.get(reverse('tender_batch')).status_code, 400)
+        with mock.patch.object(views, 'TENDER_BATCH_MAX', 1):
+            self.assertEqual(self.client.get(reverse('tender_batch'), {'ids': ['A-1', 'B-1']}).status_code, 400)
+
+
+class IdentifierResolverTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        identifiers.clear()
+        self.tender = make_tender('1234-56-LE24', client='Hospital')
+
+    def test_normalizes_dashes_spaces_and_case(self):
+        self.assertEqual(normalize_identifier(' 1234-56-le24 '), '123456LE24')
+        self.assertEqual(self.tender.normalized_identifier, '123456LE24')
+        with self.assertRaises(ValidationError):
+            make_tender('123456le24')
+        errors = Tender.objects.bulk_validate([(Tender(identifier='1234 56 LE24', awarded_date='2024-01-01'), None)])
+        self.assertIn('1234-56-LE24', str(errors[0]))
+
+    def test_resolve_many_uses_one_query_then_the_cache(self):
+        # Lo leído dentro de una transacción (la del test) se guarda al confirmar.
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            found = identifiers.resolve_many(['1234-56-LE24', '123456le24', 'NOPE'])
+        self.assertEqual(found, {
+            '1234-56-LE24': (self.tender.pk, '1234-56-LE24'),
+            '123456le24': (self.tender.pk, '1234-56-LE24'),
+        })
+        with self.assertNumQueries(0):
+            self.assertEqual(identifiers.resolve('123456LE24').pk, self.tender.pk)
+        with mock.patch.object(identifiers, 'IDENTIFIER_CACHE_SIZE', 1):
+            make_tender('B-1')
+            with self.captureOnCommitCallbacks(execute=True):
+                identifiers.resolve_many(['B-1'])
+            self.assertEqual(identifiers.cache_info()['size'], 1)
+        # Revertida la transacción, no queda nada de lo leído en ella.
+        identifiers.clear()
+        identifiers.resolve('B-1')
+        self.assertEqual(identifiers.cache_info()['size'], 0)
+
+    def test_save_invalidates_and_get_tender_skips_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            identifiers.resolve('1234-56-LE24')
+        self.tender.identifier = '1234-56-LE25'
+        self.tender.save()
+        self.assertIsNone(identifiers.resolve('123456LE24'))
+        # Una entrada obsoleta (p.ej. de otro proceso) no afecta a `get_tender`,
+        # que siempre hace una sola consulta por la clave.
+        with self.captureOnCommitCallbacks(execute=True):
+            identifiers.remember([Tender(pk=self.tender.pk + 1000, identifier='X', normalized_identifier='123456LE25')])
+        with self.assertNumQueries(1):
+            self.assertEqual(identifiers.get_tender('123456le25'), self.tender)
+        with self.assertNumQueries(1):
+            self.assertIsNone(identifiers.get_tender('NOPE'))
+
+    def test_detail_accepts_undashed_ids_and_shares_cache_scope(self):
+        url = reverse('tender_detail', args=['123456le24'])
+        self.assertEqual(self.client.get(url).json()['identifier'], '1234-56-LE24')
+        self.tender.awarded_date = datetime.date(2024, 5, 1)
+        self.tender.save()
+        self.assertEqual(self.client.get(url).json()['awarded_date'], '2024-05-01')
+        self.assertEqual(self.client.get(reverse('tender_detail', args=['nope'])).status_code, 404)
+
+    def test_importer_updates_existing_tender_sent_without_dashes(self):
+        importer = BulkImporter()
+        importer.import_tenders([{'id': '123456le24', 'client': 'Hospital', 'creation_date': '2024-06-01'}], set())
+        self.assertEqual(Tender.objects.count(), 1)
+        self.tender.refresh_from_db()
+        self.assertEqual((self.tender.identifier, self.tender.awarded_date), ('1234-56-LE24', datetime.date(2024, 6, 1)))
+
+
+    def test_bulk_documents_share_the_resolver_and_its_cache(self):
+        docs = [
+            {'identifier': '123456le24', 'client': 'Hospital', 'awarded_date': '2024-06-01', 'orders': [{'product_sku': 'SKU-T'}]},
+            {'identifier': 'N-1', 'client': 'Hospital', 'awarded_date': '2024-06-01', 'orders': [{'product_sku': 'SKU-T'}]},
+        ]
+        importer = BulkImporter()
+        with mock.patch.object(identifiers, 'resolve_many', wraps=identifiers.resolve_many) as resolve_many:
+            with self.captureOnCommitCallbacks(execute=True):
+                results = list(importer.import_tender_documents(docs))
+        resolve_many.assert_called_once()
+        self.assertEqual([(r['identifier'], r['status']) for r in results], [('1234-56-LE24', 'updated'), ('N-1', 'created')])
+        # Las órdenes del feed resuelven ambas desde la caché, con o sin guiones.
+        with self.assertNumQueries(0):
+            found = identifiers.resolve_many(['1234-56-LE24', 'n1'])
+        self.assertEqual({k: v.identifier for k, v in found.items()}, {'1234-56-LE24': '1234-56-LE24', 'n1': 'N-1'})
+
+    def test_bulk_documents_ignore_stale_cache_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            identifiers.remember([Tender(pk=self.tender.pk + 1000, identifier='G-1', normalized_identifier='G1')])
+        doc = {'identifier': 'G-1', 'awarded_date': '2024-06-01', 'orders': [{'product_sku': 'SKU-T'}]}
+        results = list(BulkImporter().import_tender_documents([doc]))
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertTrue(Tender.objects.filter(identifier='G-1').exists())
+
+    def test_bulk_documents_ignore_entries_of_renamed_tenders(self):
+        other = make_tender('H-1')
+        # Otro proceso renombró 1234-56-LE24 a H-1 tras cachearlo este.
+        with self.captureOnCommitCallbacks(execute=True):
+            identifiers.remember([Tender(pk=self.tender.pk, identifier='H-1', normalized_identifier='H1')])
+        doc = {'identifier': 'H-1', 'awarded_date': '2024-06-01', 'orders': [{'product_sku': 'SKU-T', 'quantity': 4}]}
+        results = list(BulkImporter().import_tender_documents([doc]))
+        self.assertEqual(results[0]['status'], 'updated')
+        other.refresh_from_db()
+        self.tender.refresh_from_db()
+        self.assertEqual((other.order_count, other.awarded_date), (1, datetime.date(2024, 6, 1)))
+        self.assertEqual(self.tender.awarded_date, datetime.date(2024, 1, 1))
+
+    def test_cache_entries_expire(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            identifiers.resolve('1234-56-LE24')
+        now = identifiers.time.monotonic()
+        with mock.patch.object(identifiers.time, 'monotonic', return_value=now + identifiers.IDENTIFIER_CACHE_TTL), self.assertNumQueries(1):
+            identifiers.resolve('1234-56-LE24')
+
+class TenderListPaginationTests(TestCase):
+    def setUp(self):
+        dates = ['2024-01-05', '2024-01-04', '2024-01-04', '2024-01-04', '2024-01-01']
+        self.expected = []
+        for n, date in enumerate(dates):
+            make_tender(f'T-{n}', awarded_date=date)
+        self.expected = list(
+            Tender.objects.order_by('-awarded_date', '-id').values_list('identifier', flat=True)
+        )
+
+    def follow(self, url, rel):
+        return follow_link(self.client, url, rel)
+
+    def test_cursor_walks_forward_and_back(self):
+        url = reverse('tender_list') + '?page_size=2'
+        seen, pages = [], [url]
+        while url:
+            seen += [r['identifier'] for r in self.client.get(url).json()]
+            url = self.follow(url, 'next')
+            if url:
+                pages.append(url)
+        self.assertEqual(seen, self.expected)
+
+        prev = self.follow(pages[-1], 'prev')
+        self.assertEqual([r['identifier'] for r in self.client.get(prev).json()], self.expected[2:4])
+
+    def test_page_size_is_capped_and_bad_cursor_rejected(self):
+        response = self.client.get(reverse('tender_list'), {'page_size': 10 ** 6})
+        self.assertEqual(len(response.json()), 5)
+        self.assertEqual(self.client.get(reverse('tender_list'), {'cursor': '!!'}).status_code, 400)
+
+    def test_streaming_export_returns_everything(self):
+        response = self.client.get(reverse('tender_list'), {'stream': '1'})
+        self.assertTrue(response.streaming)
+        body = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([r['identifier'] for r in body], self.expected)
+
+    def test_html_list_paginates_by_cursor(self):
+        response = self.client.get(reverse('tender_list_html'), {'page_size': 2})
+        self.assertContains(response, 'siguiente')
+        self.assertNotContains(response, 'anterior')
+        self.assertEqual([t.identifier for t in response.context['tenders']], self.expected[:2])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        make_tender('1234-56-LE24', client='Hospital Regional', awarded_date='2024-01-01')
+        make_tender('9999-11-LP24', client='Municipalidad de Arica', awarded_date='2024-02-01')
+        make_tender('5555-00-XX24', client='Hospital del Salvador', awarded_date='2024-03-01')
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('tender_list'), {'q': q, **params})
+        return [r['identifier'] for r in response.json()]
+
+    def test_matches_identifier_with_or_without_dashes_and_client(self):
+        self.assertEqual(self.search('56-le'), ['1234-56-LE24'])
+        self.assertEqual(self.search('123456'), ['1234-56-LE24'])
+        self.assertEqual(self.search('arica'), ['9999-11-LP24'])
+        self.assertEqual(sorted(self.search('hospital')), ['1234-56-LE24', '5555-00-XX24'])
+        self.assertEqual(self.search('hospital', sort='date'), ['5555-00-XX24', '1234-56-LE24'])
+        self.assertEqual(self.search('zz'), [])
+
+    def test_index_follows_client_renames_and_deletes(self):
+        Client.objects.filter(name='Municipalidad de Arica').update(name='Municipalidad de Iquique')
+        self.assertEqual(self.search('arica'), [])
+        self.assertEqual(self.search('iquique'), ['9999-11-LP24'])
+        Tender.objects.get(identifier='9999-11-LP24').delete()
+        self.assertEqual(self.search('iquique'), [])
+
+    def test_client_list_search(self):
+        response = self.client.get(reverse('client_list'), {'q': 'hospital'})
+        names = sorted(c.name for c in response.context['clients'])
+        self.assertEqual(names, ['Hospital Regional', 'Hospital del Salvador'])
+
+    def test_undashed_term_uses_identifier_normalization(self):
+        # Espacios y guiones tipográficos se quitan igual que en `normalize_identifier`.
+        self.assertEqual(self.search('1234 56\u2013le'), ['1234-56-LE24'])
+
+    def test_ranked_results_page_past_the_first_page(self):
+        make_tender('7777-22-HO24', client='Hospital Base', awarded_date='2024-04-01')
+        make_tender('8888-33-HO24', client='Hospital Militar', awarded_date='2024-05-01')
+        expected = self.search('hospital', page_size=10)
+        self.assertEqual(len(expected), 4)
+        # Con una ventana de candidatos menor que los resultados, el resto
+        # se completa por fecha sin repetir ni perder ninguno.
+        for window in (search.RANK_WINDOW, 2):
+            with mock.patch.object(search, 'RANK_WINDOW', window):
+                url = reverse('tender_list') + '?q=hospital&page_size=3'
+                seen, pages = [], []
+                while url:
+                    pages.append(url)
+                    response = self.client.get(url)
+                    seen += [r['identifier'] for r in response.json()]
+                    url = follow_link(self.client, url, 'next')
+                self.assertEqual(len(pages), 2)
+                self.assertEqual(sorted(seen), sorted(expected))
+                prev = follow_link(self.client, pages[-1], 'prev')
+                self.assertEqual(self.client.get(prev).json(), self.client.get(pages[0]).json())
+            cache.clear()
+
+        response = self.client.get(reverse('tender_list_html'), {'q': 'hospital', 'page_size': 3})
+        self.assertContains(response, 'siguiente')
+        response = self.client.get(reverse('tender_list_html'), {'q': 'hospital', 'page_size': 3, 'cursor': response.context['tenders'].next_cursor})
+        self.assertEqual(len(response.context['tenders']), 1)
+        self.assertContains(response, 'anterior')
+        self.assertEqual(self.client.get(reverse('tender_list'), {'q': 'hospital', 'cursor': '!!'}).status_code, 400)
+
+    def test_postgres_indexes_cover_the_icontains_expression(self):
+        from django.db.backends.postgresql.operations import DatabaseOperations
+
+        # `icontains` compila a UPPER("col"::text) LIKE ...: el índice debe
+        # estar sobre esa misma expresión o PostgreSQL recorre la tabla.
+        cast = DatabaseOperations(None).lookup_cast('icontains', 'CharField')
+        for name, (table, column) in search.POSTGRES_INDEXES.items():
+            sql = next(sql for sql in search.POSTGRES_SCHEMA if f' {name} ' in sql)
+            self.assertIn(f'(({cast % column}) gin_trgm_ops)', sql)
+
+    @skipUnless(connection.vendor == 'postgresql', 'sólo PostgreSQL')
+    def test_postgres_search_plan_uses_trigram_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = search.filter_tenders_by_text(Tender.objects.all(), 'hospital').explain()
+        self.assertIn('tender_identifier_upper_trgm', plan)
+        self.assertIn('client_name_upper_trgm', plan)
+
+    def test_fts_tables_are_looked_up_once(self):
+        self.search('hospital')
+        with mock.patch.object(connection.introspection, 'table_names', side_effect=AssertionError('introspección')):
+            self.assertEqual(self.search('arica'), ['9999-11-LP24'])
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        self.a = make_tender('A-1', client='Hospital')
+        self.b = make_tender('B-1')
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers=headers)
+
+    def test_hits_after_first_request_and_answers_304(self):
+        url = reverse('tender_list')
+        first = self.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.get(url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(self.get(url, if_none_match=first['ETag']).status_code, 304)
+        self.assertEqual(self.get(url, if_modified_since=first['Last-Modified']).status_code, 304)
+        self.assertEqual(cache_stats()['tender_list'], {'hits': 3, 'misses': 1})
+        self.assertEqual(self.client.get(reverse('cache_stats')).json()['tender_list']['hits'], 3)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_disabled_without_shared_cache(self):
+        # Caché local con varios workers: sin caché, siempre a la BD.
+        url = reverse('tender_list')
+        self.get(url)
+        response = self.get(url)
+        self.assertFalse(response.has_header('X-Cache'))
+        self.assertEqual(cache_stats(), {})
+
+    def test_order_write_evicts_only_its_tender(self):
+        urls = [reverse('tender_detail_html', args=[t.identifier]) for t in (self.a, self.b)]
+        for url in urls + [reverse('tender_list')]:
+            self.get(url)
+        Order.objects.filter(tender=self.a).update(quantity=7)
+        self.assertEqual(self.get(urls[0])['X-Cache'], 'MISS')
+        self.assertEqual(self.get(urls[1])['X-Cache'], 'HIT')
+        response = self.get(reverse('tender_list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        margins = {r['identifier']: r['total_margin'] for r in response.json()}
+        self.assertEqual(margins['A-1'], '35.00')
+
+    def test_client_rename_evicts_its_pages(self):
+        client_url = reverse('client_detail', args=[self.a.client_obj_id])
+        detail_url = reverse('tender_detail_html', args=['A-1'])
+        self.get(client_url)
+        self.get(detail_url)
+        Client.objects.get(name='Hospital').save()
+        self.assertEqual(self.get(client_url)['X-Cache'], 'MISS')
+        self.assertEqual(self.get(detail_url)['X-Cache'], 'MISS')
+
+
+class PerfMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation.clear()
+        make_tender('A-1', client='Hospital')
+        make_tender('B-1')
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('tender_list'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(instrumentation.recent(), [])
+
+    @mock.patch.object(instrumentation, 'PERF_SAMPLE_RATE', 1.0)
+    def test_records_timing_queries_and_size(self):
+        with self.assertLogs('licitaciones.perf', 'INFO') as logs:
+            response = self.client.get(reverse('tender_list'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        [entry] = instrumentation.recent()
+        self.assertEqual(json.loads(logs.records[0].getMessage())['path'], '/api/tenders/')
+        self.assertEqual((entry['view'], entry['status']), ('tender_list', 200))
+        self.assertGreater(entry['queries'], 0)
+        self.assertEqual(entry['response_bytes'], len(response.content))
+
+    def test_recorder_reports_repeated_statements(self):
+        recorder = instrumentation.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for identifier in ('A-1', 'B-1', 'A-1'):
+                Tender.objects.get(identifier=identifier)
+        self.assertEqual(recorder.count, 3)
+        self.assertEqual(recorder.repeated()[0]['count'], 3)
+        self.assertEqual(recorder.duplicates(), 1)
+
+    @mock.patch.object(instrumentation, 'PERF_SAMPLE_RATE', 1.0)
+    def test_debug_endpoint_is_staff_only(self):
+        from django.contrib.auth import get_user_model
+
+        url = reverse('perf_debug')
+        with self.assertLogs('licitaciones.perf', 'INFO'):
+            self.assertEqual(self.client.get(url).status_code, 302)
+            self.client.get(reverse('tender_list'))
+            self.client.force_login(get_user_model().objects.create_user('staff', is_staff=True))
+            data = self.client.get(url, {'view': 'tender_list'}).json()
+        self.assertEqual(data['summary']['tender_list']['requests'], 1)
+        self.assertEqual([e['view'] for e in data['requests']], ['tender_list'])
+
+
+@override_settings(METRICS_TOKEN='secreto')
+class MetricsTests(TestCase):
+    def setUp(self):
+        make_tender('A-1', client='Hospital')
+
+    def test_counts_requests_per_url_name(self):
+        before = metrics.collect()[0][('tender_list', 'GET', '200')]
+        self.client.get(reverse('tender_list'))
+        self.client.get('/no-existe/')
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secreto'})
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn(f'kaiken_http_requests_total{{view="tender_list",method="GET",status="200"}} {before + 1}', body)
+        self.assertIn('kaiken_http_requests_total{view="<unmatched>",method="GET",status="404"}', body)
+        self.assertIn('kaiken_http_request_duration_seconds_bucket{view="tender_list",le="+Inf"}', body)
+
+    def test_sums_process_files_and_importer_stats(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'web-1.json'), 'w') as fh:
+                row = [0] * len(metrics.LATENCY_BUCKETS) + [3, 30.0]
+                json.dump({'requests': [['otro_proceso', 'GET', '200', 3]], 'latency': {'otro_proceso': row}}, fh)
+            stats = os.path.join(tmp, 'importer.json')
+            metrics.write_import_stats({'records': {'órdenes': {'insertados': 2}}, 'stage_seconds': {'órdenes:escritura': 0.5}}, stats)
+            with mock.patch.object(metrics, 'METRICS_DIR', tmp), mock.patch.object(metrics, 'IMPORT_STATS_FILE', stats):
+                metrics.flush()
+                self.assertTrue(os.path.exists(os.path.join(tmp, f'web-{os.getpid()}.json')))
+                body = metrics.render()
+        self.assertIn('kaiken_http_requests_total{view="otro_proceso",method="GET",status="200"} 3', body)
+        self.assertIn('kaiken_http_request_duration_seconds_count{view="otro_proceso"} 3', body)
+        self.assertIn('kaiken_import_records{entity="órdenes",outcome="insertados"} 2', body)
+        self.assertIn('kaiken_import_stage_seconds{entity="órdenes",stage="escritura"} 0.5', body)
+
+    def test_retired_process_files_merge_into_dead_totals(self):
+        def write(pid, n):
+            row = [0] * len(metrics.LATENCY_BUCKETS) + [n, 1.0]
+            with open(os.path.join(tmp, f'web-{pid}.json'), 'w') as fh:
+                json.dump({'requests': [['muerto', 'GET', '200', n]], 'latency': {'muerto': row}}, fh)
+
+        def count():
+            return metrics.collect()[0][('muerto', 'GET', '200')]
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(metrics, 'METRICS_DIR', tmp):
+            write(1, 3)
+            write(2, 4)
+            metrics.retire(1)
+            metrics.retire(2)
+            metrics.retire(3)
+            self.assertEqual(sorted(n for n in os.listdir(tmp) if n.endswith('.json')), ['dead.json'])
+            self.assertEqual(count(), 7)
+            # Un proceso que reutiliza el pid de uno muerto no pisa sus totales.
+            write(os.getpid(), 5)
+            with mock.patch.object(metrics, '_owned_file', None):
+                metrics.flush()
+            self.assertEqual(count(), 12)
+
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer otro'}).status_code, 401)
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secreto'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_without_token_only_staff(self):
+        from django.contrib.auth import get_user_model
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user('usuario'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user('staff', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class MarginAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.a = make_tender('A-1', client='Hospital', lines=((2, '15.00', '10.00'),), awarded_date='2024-01-15')
+        self.b = make_tender('B-1', client='Hospital', lines=((1, '15.00', '10.00'),), awarded_date='2024-05-02')
+        self.c = make_tender('C-1', client='Clínica', lines=((3, '12.00', '10.00'),), awarded_date='2024-05-20')
+
+    def get(self, **params):
+        response = self.client.get(reverse('margin_analytics'), params)
+        self.assertEqual(response.status_code, 200)
+        return [{k: r[k] for k in r if k not in ('client_id', 'product_sku', 'product_name')} for r in response.json()['results']]
+
+    def test_groups_and_filters(self):
+        self.assertEqual(self.get(group_by='client'), [
+            {'client_name': 'Hospital', 'margin': '15.00', 'revenue': '45.00', 'quantity': 3, 'order_count': 2},
+            {'client_name': 'Clínica', 'margin': '6.00', 'revenue': '36.00', 'quantity': 3, 'order_count': 1},
+        ])
+        self.assertEqual(
+            [(r['quarter'], r['margin']) for r in self.get(group_by='quarter')],
+            [('2024-Q1', '10.00'), ('2024-Q2', '11.00')],
+        )
+        self.assertEqual(
+            [(r['month'], r['client_name'], r['margin']) for r in self.get(group_by='month,client', start_date='2024-05-01')],
+            [('2024-05', 'Hospital', '5.00'), ('2024-05', 'Clínica', '6.00')],
+        )
+        self.assertEqual(self.client.get(reverse('margin_analytics'), {'group_by': 'x'}).status_code, 400)
+
+    def test_rollups_follow_writes_and_rebuild(self):
+        Order.objects.filter(tender=self.a).update(quantity=4)
+        self.b.awarded_date = '2024-01-20'
+        self.b.save()
+        self.c.delete()
+        expected = [('2024-01', '25.00')]
+        self.assertEqual([(r['month'], r['margin']) for r in self.get()], expected)
+        call_command('rebuild_margin_rollups', stdout=io.StringIO())
+        self.assertEqual([(r['month'], r['margin']) for r in self.get()], expected)
+
+
+class ClientSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.a = make_tender('A-1', client='Hospital', lines=((2, '15.00', '10.00'),), awarded_date='2024-01-15')
+        self.b = make_tender('B-1', client='Hospital', lines=((1, '15.00', '10.00'),), awarded_date='2024-05-02')
+        self.c = make_tender('C-1', client='Clínica', lines=((3, '12.00', '10.00'),), awarded_date='2024-03-20')
+        self.hospital, self.clinica = self.a.client_obj, self.c.client_obj
+        self.empty = Client.objects.create(name='Sin licitaciones')
+
+    def totals(self, client):
+        s = ClientSummary.objects.get(client=client)
+        return (s.tender_count, s.order_count, s.revenue, s.cost, s.margin, s.last_awarded_date.isoformat())
+
+    def test_totals_follow_writes_and_rebuild(self):
+        self.assertEqual(self.totals(self.hospital), (2, 2, Decimal('45.00'), Decimal('30.00'), Decimal('15.00'), '2024-05-02'))
+        self.assertFalse(ClientSummary.objects.filter(client=self.empty).exists())
+        Order.objects.filter(tender=self.a).update(quantity=4)
+        self.b.client_obj = self.clinica
+        self.b.save()
+        expected = {
+            self.hospital.pk: (1, 1, Decimal('60.00'), Decimal('40.00'), Decimal('20.00'), '2024-01-15'),
+            self.clinica.pk: (2, 2, Decimal('51.00'), Decimal('40.00'), Decimal('11.00'), '2024-05-02'),
+        }
+        self.assertEqual({pk: self.totals(pk) for pk in expected}, expected)
+        self.a.delete()
+        self.assertFalse(ClientSummary.objects.filter(client=self.hospital).exists())
+        call_command('rebuild_client_summaries', stdout=io.StringIO())
+        self.assertEqual(self.totals(self.clinica), expected[self.clinica.pk])
+        self.assertEqual(ClientSummary.objects.count(), 1)
+
+    def test_bulk_documents_move_and_create_tenders(self):
+        docs = [
+            {'identifier': 'C-1', 'client': 'Hospital', 'awarded_date': '2024-06-01', 'orders': [{'product_sku': 'SKU-T', 'quantity': 1}]},
+            {'identifier': 'D-1', 'client': 'Sin licitaciones', 'awarded_date': '2024-02-01', 'orders': [{'product_sku': 'SKU-T', 'quantity': 2}]},
+        ]
+        with self.settings(TENDER_BULK_TOKEN='secreto'):
+            response = self.client.post(
+                reverse('tender_bulk'), json.dumps(docs), content_type='application/json', headers={'Authorization': 'Bearer secreto'},
+            )
+        self.assertEqual(response.json()['summary']['created'], 1)
+        self.assertEqual(self.totals(self.hospital), (3, 3, Decimal('60.00'), Decimal('40.00'), Decimal('20.00'), '2024-06-01'))
+        self.assertEqual(self.totals(self.empty), (1, 1, Decimal('30.00'), Decimal('20.00'), Decimal('10.00'), '2024-02-01'))
+        self.assertFalse(ClientSummary.objects.filter(client=self.clinica).exists())
+        # Órdenes de varios clientes en una operación: diferencias en un UPDATE.
+        Order.objects.update(quantity=5)
+        incremental = {s.client_id: self.totals(s.client_id) for s in ClientSummary.objects.all()}
+        call_command('rebuild_client_summaries', stdout=io.StringIO())
+        self.assertEqual(incremental, {s.client_id: self.totals(s.client_id) for s in ClientSummary.objects.all()})
+        self.assertEqual(incremental[self.empty.pk][4], Decimal('25.00'))
+
+    def test_previous_totals_are_read_with_a_row_lock(self):
+        # Dos escrituras concurrentes sobre la misma licitación no pueden
+        # leer los mismos totales anteriores y aplicar diferencias solapadas.
+        locked = []
+        select_for_update = TenderQuerySet.select_for_update
+
+        def spy(qs, *args, **kwargs):
+            locked.append(qs.model)
+            return select_for_update(qs, *args, **kwargs)
+
+        with mock.patch.object(TenderQuerySet, 'select_for_update', spy):
+            Order.objects.filter(tender=self.a).update(quantity=4)
+            Tender.objects.filter(pk=self.b.pk).refresh_totals()
+        self.assertEqual(locked, [Tender, Tender])
+        self.assertEqual(self.totals(self.hospital)[4], Decimal('25.00'))
+
+    def test_queryset_update_of_client_and_date_keeps_aggregates(self):
+        self.client.get(reverse('tender_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Tender.objects.filter(client_obj=self.hospital).update(client_obj=self.clinica, awarded_date=datetime.date(2024, 7, 1))
+        incremental = {s.client_id: self.totals(s.client_id) for s in ClientSummary.objects.all()}
+        rollups = sorted(MarginRollup.objects.values_list('day', 'client_id', 'margin'))
+        self.assertEqual(list(incremental), [self.clinica.pk])
+        self.assertEqual(incremental[self.clinica.pk][0], 3)
+        call_command('rebuild_client_summaries', stdout=io.StringIO())
+        call_command('rebuild_margin_rollups', stdout=io.StringIO())
+        self.assertEqual(incremental, {s.client_id: self.totals(s.client_id) for s in ClientSummary.objects.all()})
+        self.assertEqual(rollups, sorted(MarginRollup.objects.values_list('day', 'client_id', 'margin')))
+        self.assertEqual(self.client.get(reverse('tender_list'))['X-Cache'], 'MISS')
+        # El identificador también mantiene su clave normalizada.
+        Tender.objects.filter(pk=self.a.pk).update(identifier='a-2')
+        self.assertEqual(Tender.objects.get(pk=self.a.pk).normalized_identifier, 'A2')
+
+    def test_list_sorts_by_summary_columns(self):
+        def names(**params):
+            # `COUNT` y la página, con los totales en un LEFT JOIN.
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse('client_list'), params)
+            return [c.name for c in response.context['clients']]
+
+        self.assertEqual(names(sort='-margin'), ['Hospital', 'Clínica', 'Sin licitaciones'])
+        self.assertEqual(names(sort='margin'), ['Sin licitaciones', 'Clínica', 'Hospital'])
+        self.assertEqual(names(sort='-last_awarded'), ['Hospital', 'Clínica', 'Sin licitaciones'])
+        self.assertEqual(names(sort='x'), ['Sin licitaciones', 'Clínica', 'Hospital'])
+        response = self.client.get(reverse('client_list'), {'sort': '-revenue', 'q': 'hospital'})
+        self.assertEqual([c.name for c in response.context['clients']], ['Hospital'])
+        response = self.client.get(reverse('client_list'), {'sort': '-margin'})
+        self.assertContains(response, '?sort=margin">Margen</a> ▼')
+        self.assertContains(response, '$45,00')
+
+    def test_detail_pages_tenders_in_constant_queries(self):
+        for n in range(3):
+            make_tender(f'H-{n}', client='Hospital', awarded_date=f'2023-0{n + 1}-01')
+        url = reverse('client_detail', args=[self.hospital.pk])
+        with mock.patch.object(views, 'CLIENT_TENDERS_PAGE_SIZE', 2), self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual([t.identifier for t in response.context['tenders']], ['B-1', 'A-1'])
+        self.assertEqual(response.context['summary'].tender_count, 5)
+        cursor = response.context['tenders'].next_cursor
+        with mock.patch.object(views, 'CLIENT_TENDERS_PAGE_SIZE', 2), self.assertNumQueries(2):
+            response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual([t.identifier for t in response.context['tenders']], ['H-2', 'H-1'])
+        response = self.client.get(reverse('client_detail', args=[self.empty.pk]))
+        self.assertEqual(response.context['summary'].tender_count, 0)
+        self.assertContains(response, 'No hay licitaciones.')
+
+
+class MarginReportTests(TestCase):
+    """Las mismas comprobaciones con NumPy (vectorizado) y con enteros de Python."""
+
+    def setUp(self):
+        make_tender('A-1', client='Hospital', lines=((3, '15.00', '10.00'), (7, '8.00', '7.99'), (2, '3.00', '1.01')))
+        make_tender('B-1', lines=((1, '0.29', '0.10'), (5, '12.35', '12.34')))
+        make_tender('C-1', client='Hospital', lines=((1000, '99999.99', '0.01'),))
+        # Márgenes negativos (con empates de redondeo a par) y precio cero:
+        # `save()` los rechaza, pero pueden llegar por importación en bloque.
+        tender = make_tender('D-1', client='Clínica', lines=((4, '8.00', '7.97'),))
+        product = Product.objects.get(sku='SKU-T')
+        Order.objects.bulk_create([
+            Order(tender=tender, product=product, quantity=q, unit_price=Decimal(p), unit_cost=Decimal(c))
+            for q, p, c in ((2, '8.00', '8.01'), (1, '8.00', '8.03'), (3, '0.00', '5.00'))
+        ])
+
+    def check_report(self, vectorized):
+        report = margin_report()
+        self.assertEqual(report.vectorized, vectorized)
+        orders = list(Order.objects.select_related('tender').order_by('pk'))
+        self.assertEqual(report.line_margins(), {o.pk: o.margin() for o in orders})
+        self.assertEqual(report.margin_percentages(), {o.pk: o.margin_percentage for o in orders})
+        percentages = report.margin_percentages()
+        self.assertEqual(
+            [str(percentages[o.pk]) for o in orders],
+            ['33.33', '0.12', '66.33', '65.52', '0.08', '100.00', '0.38', '-0.12', '-0.38', '0.00'],
+        )
+        self.assertEqual(
+            report.tender_totals(),
+            {t.pk: t.total_margin for t in Tender.objects.all()},
+        )
+        hospital = Client.objects.get(name='Hospital').pk
+        clinica = Client.objects.get(name='Clínica').pk
+        self.assertEqual(
+            report.client_totals(),
+            {hospital: Decimal('99999999.05'), clinica: Decimal('-14.93'), None: Decimal('0.24')},
+        )
+        self.assertEqual(str(report.line_margins()[orders[0].pk]), '15.00')
+
+    def test_python_integers(self):
+        with mock.patch.object(reporting, 'np', None):
+            self.check_report(vectorized=False)
+
+    @skipUnless(reporting.np is not None, 'numpy no instalado')
+    def test_numpy(self):
+        self.check_report(vectorized=True)
+
+
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.a = make_tender('A-1', client='Hospital', lines=((2, '15.00', '10.00'),), awarded_date='2024-02-01')
+        make_tender('B-1', client='Clínica', awarded_date='2024-01-01')
+        make_tender('C-1', client='Hospital', awarded_date='2023-06-01')
+
+    async def compare(self, view, path, params=None, **kwargs):
+        """Respuesta de la vista asíncrona, comprobando que sea igual a la síncrona."""
+        response = await getattr(async_views, view)(AsyncRequestFactory().get(path, params), **kwargs)
+        await sync_to_async(cache.clear)()
+        expected = await sync_to_async(getattr(views, view))(RequestFactory().get(path, params), **kwargs)
+        await sync_to_async(cache.clear)()
+        self.assertEqual(response.status_code, expected.status_code)
+        if response.streaming:
+            body = b''.join([chunk async for chunk in response])
+            self.assertEqual(body, await sync_to_async(b''.join)(expected.streaming_content))
+            return body
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response.get('Link'), expected.get('Link'))
+        return response
+
+    async def test_tender_list_matches_sync_view(self):
+        response = await self.compare('tender_list', '/api/tenders/', {'page_size': 2})
+        self.assertEqual([r['identifier'] for r in json.loads(response.content)], ['A-1', 'B-1'])
+        self.assertIn('rel="next"', response['Link'])
+        await self.compare('tender_list', '/api/tenders/', {'q': 'Hospital'})
+        response = await self.compare('tender_list', '/api/tenders/', {'q': 'Hospital', 'page_size': 1})
+        self.assertIn('rel="next"', response['Link'])
+        await self.compare('tender_list', '/api/tenders/', {'q': 'Hospital', 'page_size': 1, 'cursor': encode_offset_cursor(1)})
+        await self.compare('tender_list', '/api/tenders/', {'stream': '1', 'start_date': '2024-01-01'})
+        await self.compare('tender_list', '/tenders/', {'page_size': 1})
+        response = await async_views.tender_list(AsyncRequestFactory().get('/api/tenders/', {'cursor': 'x'}))
+        self.assertEqual(response.status_code, 400)
+
+    async def test_details_and_export_match_sync_views(self):
+        await self.compare('tender_detail', '/tenders/A-1/', identifier='A-1')
+        await self.compare('tender_detail', '/api/tenders/A-1/', {'items_limit': 1}, identifier='A-1')
+        await self.compare('tender_batch', '/api/tenders/batch/', {'ids': 'C-1,A-1,X'})
+        await self.compare('client_detail', f'/clients/{self.a.client_obj_id}/', pk=self.a.client_obj_id)
+        await self.compare('tender_export_csv', '/api/tenders/export.csv', {'client': 'Hosp'})
+        response = await async_views.tender_detail(AsyncRequestFactory().get('/api/tenders/A-1/'), identifier='A-1')
+        self.assertEqual(json.loads(response.content)['client'], 'Hospital')
+        with self.assertRaises(Http404):
+            await async_views.client_detail(AsyncRequestFactory().get('/clients/0/'), pk=0)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        make_tender('A-1', client='Hospital', lines=((3, '15.00', '10.00'), (2, '0.29', '0.10')), awarded_date='2024-02-01')
+        make_tender('B-1', lines=(), awarded_date='2024-01-01')
+        make_tender('C-1', client='Clínica', awarded_date='2023-01-01')
+
+    def read_csv(self, response):
+        return list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_csv_streams_one_row_per_order(self):
+        response = self.client.get(reverse('tender_export_csv'))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertTrue(response.streaming)
+        rows = self.read_csv(response)
+        self.assertEqual([r['identifier'] for r in rows], ['A-1', 'A-1', 'B-1', 'C-1'])
+        self.assertEqual(
+            rows[1],
+            {
+                'identifier': 'A-1', 'awarded_date': '2024-02-01', 'client': 'Hospital', 'total_margin': '15.38',
+                'order_id': rows[1]['order_id'], 'product_sku': 'SKU-T', 'product_name': 'Test', 'quantity': '2',
+                'unit_price': '0.29', 'unit_cost': '0.10', 'margin': '0.38',
+            },
+        )
+        # Licitación sin órdenes: columnas de la orden vacías.
+        self.assertEqual((rows[2]['total_margin'], rows[2]['order_id'], rows[2]['margin']), ('0.00', '', ''))
+
+    def test_csv_honors_list_filters(self):
+        rows = self.read_csv(self.client.get(reverse('tender_export_csv'), {'start_date': '2024-01-15', 'q': 'Hosp'}))
+        self.assertEqual({r['identifier'] for r in rows}, {'A-1'})
+
+    def test_command_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out.csv')
+            call_command('export_tenders', path, client='Clín', stderr=io.StringIO())
+            with open(path, newline='', encoding='utf-8') as fh:
+                rows = list(csv.DictReader(fh))
+        self.assertEqual([(r['identifier'], r['client'], r['margin']) for r in rows], [('C-1', 'Clínica', '5.00')])
+
+    def test_command_parquet(self):
+        from . import exports
+
+        if exports.pyarrow is None:
+            self.skipTest('pyarrow no instalado')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out.parquet')
+            call_command('export_tenders', path, client='Clín', stderr=io.StringIO())
+            rows = exports.pyarrow.parquet.read_table(path).to_pylist()
+        self.assertEqual([(r['identifier'], r['client'], str(r['margin'])) for r in rows], [('C-1', 'Clínica', '5.00')])
+
+    def test_command_parquet_requires_pyarrow(self):
+        from . import exports
+
+        with mock.patch.object(exports, 'pyarrow', None), self.assertRaisesMessage(CommandError, 'pip install pyarrow'):
+            call_command('export_tenders', 'out.parquet', stderr=io.StringIO())
+
+
+class DbTuningTests(TestCase):
+    def setUp(self):
+        make_tender('A-1', client='Hospital', lines=((1, '15.00', '10.00'),), awarded_date='2024-02-01')
+
+    def test_sqlite_pragmas_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -64000)
+
+    def test_statement_timeout_is_free_outside_postgres(self):
+        view = dbtuning.statement_timeout(5)(lambda request: HttpResponse('ok'))
+        with self.assertNumQueries(0):
+            self.assertEqual(view(RequestFactory().get('/')).content, b'ok')
+
+    def patch_timeout(self):
+        calls = mock.Mock()
+        for patcher in (
+            mock.patch.object(dbtuning, '_applies', return_value=True),
+            mock.patch.object(dbtuning, '_set_timeout', calls.set),
+            mock.patch.object(dbtuning, '_reset_timeout', calls.reset),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return calls
+
+    def test_statement_timeout_restored_after_stream(self):
+        calls = self.patch_timeout()
+        response = views.tender_export_csv(RequestFactory().get('/api/tenders/export.csv'))
+        calls.set.assert_called_once_with(views.EXPORT_STATEMENT_TIMEOUT_MS)
+        calls.reset.assert_not_called()
+        self.assertIn(b'A-1', b''.join(response.streaming_content))
+        calls.reset.assert_called_once_with()
+
+        # Respuesta normal o excepción: se restaura al volver la vista.
+        calls.reset.reset_mock()
+        views.margin_analytics(RequestFactory().get('/api/analytics/margins/'))
+        calls.reset.assert_called_once_with()
+        failing = dbtuning.statement_timeout(5)(mock.Mock(side_effect=ValueError))
+        with self.assertRaises(ValueError):
+            failing(RequestFactory().get('/'))
+        self.assertEqual(calls.reset.call_count, 2)
+
+    async def test_statement_timeout_restored_after_async_stream(self):
+        calls = await sync_to_async(self.patch_timeout)()
+        response = await async_views.tender_export_csv(AsyncRequestFactory().get('/api/tenders/export.csv'))
+        calls.reset.assert_not_called()
+        self.assertIn(b'A-1', b''.join([chunk async for chunk in response]))
+        calls.set.assert_called_once_with(views.EXPORT_STATEMENT_TIMEOUT_MS)
+        calls.reset.assert_called_once_with()
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_baseline_round_trip_and_query_regression(self):
+        from .benchdata import seed_data
+
+        seed_data(200, products=20)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'baseline.json')
+            options = {'repeat': 1, 'import_orders': 50, 'stdout': io.StringIO()}
+            call_command('benchmark_suite', save_baseline=path, **options)
+            with open(path) as fh:
+                baseline = json.load(fh)
+            self.assertIn('import_sample_data[bulk]', baseline['scenarios'])
+            self.assertIn('tender_list[fechas+cliente+margen]', baseline['scenarios'])
+            # La importación se revierte: no quedan datos del feed.
+            self.assertFalse(Tender.objects.filter(identifier__startswith='BENCH-IMP-').exists())
+
+            call_command('benchmark_suite', baseline=path, only=['client_detail'], tolerance=100, **options)
+            baseline['scenarios']['client_detail']['queries'] -= 1
+            with open(path, 'w') as fh:
+                json.dump(baseline, fh)
+            with self.assertRaisesMessage(CommandError, 'client_detail'):
+                call_command('benchmark_suite', baseline=path, only=['client_detail'], tolerance=100, **options)
+
+
+class FeedParserTests(SimpleTestCase):
+    def test_json_array_in_small_chunks(self):
+        data = json.dumps(SAMPLE_ORDERS, indent=2).encode()
+        records = list(iter_json_records(io.BytesIO(data), chunk_size=7))
+        self.assertEqual(records, SAMPLE_ORDERS)
+
+    def test_ndjson(self):
+        data = '\n'.join(json.dumps(o) for o in SAMPLE_ORDERS) + '\n'
+        records = list(iter_json_records(io.StringIO(data), chunk_size=5))
+        self.assertEqual(records, SAMPLE_ORDERS)
+
+    def test_multibyte_split_across_chunks(self):
+        data = json.dumps([{'name': 'Piñón ñandú'}], ensure_ascii=False).encode()
+        self.assertEqual(list(iter_json_records(io.BytesIO(data), chunk_size=3)), [{'name': 'Piñón ñandú'}])
+
+    def test_truncated_array_raises(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_records(io.BytesIO(b'[{"a": 1}, {"a": 2}')))
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        identifiers.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.files = {}
+        for name, records in (('products', SAMPLE_PRODUCTS), ('tenders', SAMPLE_TENDERS), ('orders', SAMPLE_ORDERS)):
+            path = os.path.join(tmp.name, f'{name}.json')
+            with open(path, 'w') as fh:
+                json.dump(records, fh)
+            self.files[name] = path
+
+    def run_import(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command(
+            'import_sample_data', *args,
+            products_file=self.files['products'],
+            tenders_file=self.files['tenders'],
+            orders_file=self.files['orders'],
+            stdout=out, stderr=err,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_bulk_import_creates_records(self):
+        out, err = self.run_import('--bulk', '--batch-size', '2')
+
+        self.assertEqual(set(Product.objects.values_list('sku', flat=True)), {'P-1', 'P-2'})
+        self.assertEqual(Product.objects.get(sku='P-2').price, Decimal('2.40'))
+        # La licitación sin órdenes no se crea.
+        self.assertEqual(list(Tender.objects.values_list('identifier', flat=True)), ['1234-56-LE24'])
+        tender = Tender.objects.get()
+        self.assertEqual(tender.normalized_identifier, '123456LE24')
+        self.assertEqual(tender.client_obj.name, 'Hospital Norte')
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(tender.total_margin, Decimal('30.00') + Decimal('4.00'))
+        self.assertIn('Product no encontrada: NOPE', err)
+        self.assertIn('registros/s', out)
+
+    def test_bulk_import_writes_stats_for_metrics(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'importer.json')
+            self.run_import('--bulk', '--stats-file', path)
+            stats = metrics.read_import_stats(path)
+        self.assertEqual(stats['records']['órdenes']['insertados'], 2)
+        self.assertEqual(stats['records']['órdenes']['errores'], 1)
+        self.assertIn('órdenes:escritura', stats['stage_seconds'])
+        self.assertEqual(stats['fetch_seconds'], {})
+
+    def test_row_import_writes_counts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'importer.json')
+            self.run_import('--stats-file', path)
+            stats = metrics.read_import_stats(path)
+        self.assertEqual(stats['records']['órdenes'], {'insertados': 2, 'errores': 1})
+        self.assertEqual(stats['records']['licitaciones'], {'insertados': 1, 'omitidos': 1})
+        self.assertEqual(stats['records']['productos'], {'insertados': 2, 'errores': 1})
+        self.assertFalse(stats['skipped'])
+        self.assertEqual(set(stats['feeds'].values()), {'changed'})
+
+    def test_bulk_import_matches_row_by_row(self):
+        self.run_import()
+        legacy = sorted(Order.objects.values_list('tender__identifier', 'product__sku', 'quantity', 'unit_price', 'unit_cost'))
+        Order.objects.all().delete()
+        Tender.objects.all().delete()
+        Client.objects.all().delete()
+
+        self.run_import('--bulk')
+        bulk = sorted(Order.objects.values_list('tender__identifier', 'product__sku', 'quantity', 'unit_price', 'unit_cost'))
+        self.assertEqual(legacy, bulk)
+
+    def test_bulk_import_updates_existing_products(self):
+        Product.objects.create(sku='P-1', name='Viejo', cost=Decimal('1.00'), price=Decimal('2.00'))
+        self.run_import('--bulk')
+        product = Product.objects.get(sku='P-1')
+        self.assertEqual((product.name, product.price), ('Guantes', Decimal('15.00')))
+
+
+class IncrementalImportTests(BulkImportTests):
+    def write_feed(self, name, records):
+        with open(self.files[name], 'w') as fh:
+            json.dump(records, fh)
+
+    def test_rerun_skips_unchanged_records(self):
+        self.write_feed('orders', [dict(o, id=n) for n, o in enumerate(SAMPLE_ORDERS)])
+        out, _ = self.run_import('--incremental')
+        self.assertIn('órdenes: 2 insertados, 0 actualizados, 0 omitidos, 1 errores', out)
+
+        # Un SELECT de estado por bloque y entidad más las búsquedas de los
+        # registros que fallaron antes (no guardan huella); sin escrituras.
+        with self.assertNumQueries(6):
+            out, _ = self.run_import('--incremental')
+        self.assertIn('productos: 0 insertados, 0 actualizados, 2 omitidos, 1 errores', out)
+        self.assertIn('órdenes: 0 insertados, 0 actualizados, 2 omitidos, 1 errores', out)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_changed_order_is_updated_in_place(self):
+        orders = [dict(o, id=n) for n, o in enumerate(SAMPLE_ORDERS)]
+        self.write_feed('orders', orders)
+        self.run_import('--incremental')
+        order_ids = set(Order.objects.values_list('pk', flat=True))
+
+        orders[0]['quantity'] = 7
+        self.write_feed('orders', orders)
+        out, _ = self.run_import('--incremental')
+        self.assertIn('órdenes: 0 insertados, 1 actualizados', out)
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), order_ids)
+        self.assertEqual(Order.objects.get(product__sku='P-1').quantity, 7)
+
+
+    def test_changed_order_without_id_is_updated_in_place(self):
+        self.run_import('--incremental')
+        tender = Tender.objects.get()
+        self.assertEqual((tender.order_count, tender.total_margin), (2, Decimal('34.00')))
+
+        orders = [dict(o) for o in SAMPLE_ORDERS]
+        orders[0]['price'] = 25
+        self.write_feed('orders', orders)
+        out, _ = self.run_import('--incremental')
+        self.assertIn('órdenes: 0 insertados, 1 actualizados, 1 omitidos', out)
+        self.assertEqual(Order.objects.filter(product__sku='P-1').count(), 1)
+        tender.refresh_from_db()
+        self.assertEqual((tender.order_count, tender.total_margin), (2, Decimal('49.00')))
+
+class StubFeedHandler(BaseHTTPRequestHandler):
+    """Sirve los feeds de muestra con ETag y fallos programables."""
+
+    def do_GET(self):
+        server = self.server
+        server.hits.append(self.path)
+        if server.failures.get(self.path, 0) > 0:
+            server.failures[self.path] -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps(server.routes[self.path]).encode()
+        etag = '"%s"' % len(body)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchFeedsTests(TestCase):
+    def setUp(self):
+        identifiers.clear()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubFeedHandler)
+        self.server.routes = {
+            '/products': SAMPLE_PRODUCTS,
+            '/tenders': SAMPLE_TENDERS,
+            '/orders': SAMPLE_ORDERS,
+        }
+        self.server.hits = []
+        self.server.failures = {}
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = tmp.name
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.server.server_address[1], path)
+
+    def run_import(self, *args):
+        out = io.StringIO()
+        call_command(
+            'import_sample_data', '--bulk', *args,
+            products_file=self.url('/products'),
+            tenders_file=self.url('/tenders'),
+            orders_file=self.url('/orders'),
+            cache_dir=self.cache_dir,
+            stdout=out, stderr=io.StringIO(),
+        )
+        return out.getvalue()
+
+    def test_unchanged_feeds_skip_import(self):
+        self.run_import()
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(len(self.server.hits), 3)
+
+        out = self.run_import()
+        self.assertIn('se omite', out)
+        self.assertEqual(Order.objects.count(), 2)
+
+        # Si cambia un feed se importa todo, usando la caché para los demás.
+        self.server.routes['/orders'] = SAMPLE_ORDERS[:1]
+        self.run_import()
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_skipped_import_still_writes_stats(self):
+        self.run_import()
+        path = os.path.join(self.cache_dir, 'importer.json')
+        self.run_import('--stats-file', path)
+        stats = metrics.read_import_stats(path)
+        self.assertTrue(stats['skipped'])
+        self.assertFalse(stats['failed'])
+        self.assertEqual(stats['feeds'], {'productos': 'unchanged', 'órdenes': 'unchanged', 'licitaciones': 'unchanged'})
+        self.assertEqual(stats['records'], {})
+        self.assertEqual(set(stats['fetch_seconds']), {'productos', 'órdenes', 'licitaciones'})
+        with mock.patch.object(metrics, 'IMPORT_STATS_FILE', path):
+            body = metrics.render()
+        self.assertIn('kaiken_import_skipped 1', body)
+        self.assertIn('kaiken_import_feed_changed{feed="órdenes"} 0', body)
+
+    def test_failed_fetch_still_writes_stats(self):
+        path = os.path.join(self.cache_dir, 'importer.json')
+        with mock.patch.object(import_sample_data, 'fetch_all', side_effect=OSError('sin red')):
+            with self.assertRaises(OSError):
+                self.run_import('--stats-file', path)
+        stats = metrics.read_import_stats(path)
+        self.assertTrue(stats['failed'])
+        self.assertFalse(stats['skipped'])
+        self.assertEqual(stats['feeds'], {})
+        self.assertEqual(Order.objects.count(), 0)
+        with mock.patch.object(metrics, 'IMPORT_STATS_FILE', path):
+            self.assertIn('kaiken_import_failed 1', metrics.render())
+
+    def test_download_retries_server_errors(self):
+        self.server.failures['/orders'] = 2
+        with download(self.url('/orders'), backoff=0) as feed:
+            self.assertEqual(list(feed), SAMPLE_ORDERS)
+        self.assertEqual(self.server.hits, ['/orders'] * 3)
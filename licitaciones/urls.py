@@ -1,17 +1,29 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
+
+# Bajo ASGI las vistas de lectura son `async def` (ver kaiken/asgi.py).
+read = async_views if getattr(settings, 'ASYNC_VIEWS', False) else views
 
 urlpatterns = [
-    path('api/tenders/', views.tender_list, name='tender_list'),
-    path('api/tenders/<str:identifier>/', views.tender_detail, name='tender_detail'),
+    path('api/tenders/', read.tender_list, name='tender_list'),
+    path('api/tenders/bulk/', views.tender_bulk, name='tender_bulk'),
+    path('api/tenders/batch/', read.tender_batch, name='tender_batch'),
+    path('api/tenders/export.csv', read.tender_export_csv, name='tender_export_csv'),
+    path('api/cache/stats/', views.cache_stats_view, name='cache_stats'),
+    path('debug/perf/', views.perf_debug, name='perf_debug'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('api/lookups/<str:kind>/', views.lookup_autocomplete, name='lookup_autocomplete'),
+    path('api/analytics/margins/', views.margin_analytics, name='margin_analytics'),
+    path('api/tenders/<str:identifier>/', read.tender_detail, name='tender_detail'),
     # Rutas públicas para vistas HTML
-    path('tenders/', views.tender_list, name='tender_list_html'),
+    path('tenders/', read.tender_list, name='tender_list_html'),
     path('tenders/new/', views.tender_create, name='tender_create'),
     path('clients/', views.client_list, name='client_list'),
     path('clients/new/', views.client_create, name='client_create'),
-    path('clients/<int:pk>/', views.client_detail, name='client_detail'),
-    path('tenders/<str:identifier>/', views.tender_detail, name='tender_detail_html'),
+    path('clients/<int:pk>/', read.client_detail, name='client_detail'),
+    path('tenders/<str:identifier>/', read.tender_detail, name='tender_detail_html'),
 ]
 
 
@@ -1,58 +1,236 @@
+import datetime
+import hmac
+import json
+from collections import Counter
 from decimal import Decimal
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q, F, Sum, ExpressionWrapper, DecimalField, Value
-from django.db.models.functions import Coalesce, Cast
-from django.db.models import Q
+from django.db.models import F, Sum
 
-from django.http import JsonResponse, Http404
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse, Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.shortcuts import redirect
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
+from .caching import cache_response, cache_stats
+from .dbtuning import statement_timeout
+from .exports import export_rows, iter_csv
+from .feeds import iter_json_records
+from . import identifiers, instrumentation, lookups, metrics
+from .importer import BulkImporter
 from .forms import TenderForm, OrderFormSet
+from .pagination import InvalidCursor, paginate_keyset
+from .search import filter_tenders_by_text, paginate_ranked, search_clients
 
-from .models import Tender
-from .models import Client
+from .models import Order, Tender, normalize_identifier
+from .models import Client, ClientSummary, MarginRollup
 from .forms import ClientForm
 
 
-def tender_list(request):
-    """Devuelve una lista de licitaciones con margen total.
+# Tamaño de página por defecto (API / HTML) y máximo aceptado en `page_size`.
+TENDER_API_PAGE_SIZE = getattr(settings, 'TENDER_API_PAGE_SIZE', 100)
+TENDER_HTML_PAGE_SIZE = getattr(settings, 'TENDER_HTML_PAGE_SIZE', 10)
+TENDER_MAX_PAGE_SIZE = getattr(settings, 'TENDER_MAX_PAGE_SIZE', 1000)
+STREAM_CHUNK_SIZE = 2000
+# Registros de `tender_bulk` validados y escritos por transacción.
+TENDER_BULK_BATCH_SIZE = getattr(settings, 'TENDER_BULK_BATCH_SIZE', 500)
+BULK_STATUSES = ('created', 'updated', 'unchanged', 'error')
+# Máximo de identificadores por petición de `tender_batch`.
+TENDER_BATCH_MAX = getattr(settings, 'TENDER_BATCH_MAX', 200)
+# Límite por sentencia (ms, 0 = sin límite) de las vistas que se salen del
+# general `DB_STATEMENT_TIMEOUT_MS`: la exportación lee todas las filas, la
+# analítica agrega rangos largos y la ingesta escribe lotes grandes.
+EXPORT_STATEMENT_TIMEOUT_MS = getattr(settings, 'EXPORT_STATEMENT_TIMEOUT_MS', 0)
+ANALYTICS_STATEMENT_TIMEOUT_MS = getattr(settings, 'ANALYTICS_STATEMENT_TIMEOUT_MS', 60000)
+BULK_STATEMENT_TIMEOUT_MS = getattr(settings, 'BULK_STATEMENT_TIMEOUT_MS', 120000)
+# Licitaciones por página en la ficha de un cliente.
+CLIENT_TENDERS_PAGE_SIZE = getattr(settings, 'CLIENT_TENDERS_PAGE_SIZE', 50)
+# Columnas del listado de clientes: `?sort=clave` (`-clave` descendente) ->
+# (campo, etiqueta, descendente al elegirla).
+CLIENT_SORTS = {
+    'name': ('name', 'Nombre', False),
+    'created': ('created_at', 'Creado', True),
+    'tenders': ('summary__tender_count', 'Licitaciones', True),
+    'orders': ('summary__order_count', 'Líneas', True),
+    'revenue': ('summary__revenue', 'Ingresos', True),
+    'cost': ('summary__cost', 'Costo', True),
+    'margin': ('summary__margin', 'Margen', True),
+    'last_awarded': ('summary__last_awarded_date', 'Última adjudicación', True),
+}
+
+
+def _money(value) -> str:
+    """Formatea un importe con 2 decimales (SQLite no cuantiza los agregados)."""
+    return str(Decimal(value or 0).quantize(Decimal('0.01')))
+
+
+def _page_size(request, default):
+    try:
+        size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, TENDER_MAX_PAGE_SIZE))
+
+
+def _tender_row(r):
+    return {
+        'identifier': r['identifier'],
+        'client': r['client_name'] or '',
+        'awarded_date': r['awarded_date'].isoformat(),
+        'total_margin': _money(r['total_margin']),
+    }
 
-    Soporta respuesta JSON en rutas `api/` (existente) y renderizado HTML
-    para la vista pública. Si la petición pide JSON (por cabecera
-    `Accept: application/json` o la ruta contiene `/api/`), devuelve JSON,
-    en otro caso renderiza la plantilla `licitaciones/tender_list.html`.
+
+def _tender_values(tenders):
+    """Sólo las columnas que devuelve la API (una consulta, sin instancias)."""
+    return tenders.values('id', 'identifier', 'awarded_date', 'total_margin', client_name=F('client_obj__name'))
+
+
+def _stream_json_array(rows):
+    """Genera un array JSON fila a fila sin materializar la lista."""
+    yield '['
+    first = True
+    for r in rows:
+        yield ('' if first else ',') + json.dumps(_tender_row(r))
+        first = False
+    yield ']'
+
+
+def _wants_json(request):
+    return request.path.startswith('/api/') or request.headers.get('Accept', '').find('application/json') != -1
+
+
+def _tender_page_response(request, page):
+    response = JsonResponse([_tender_row(r) for r in page], safe=False)
+    # Cursores opacos en la cabecera `Link` para no cambiar el formato
+    # (lista) de la respuesta existente.
+    links = []
+    for rel, cursor in (('next', page.next_cursor), ('prev', page.prev_cursor)):
+        if cursor:
+            params = request.GET.copy()
+            params['cursor'] = cursor
+            links.append(f'<{request.path}?{params.urlencode()}>; rel="{rel}"')
+    if links:
+        response['Link'] = ', '.join(links)
+    return response
+
+
+def _order_row(o):
+    """Línea anotada con `Order.objects.with_line_margins()`."""
+    return {
+        'product_sku': o.product.sku,
+        'product_name': o.product.name,
+        'quantity': o.quantity,
+        'unit_price': str(o.unit_price),
+        'unit_cost': str(o.unit_cost),
+        'margin': _money(o.line_margin),
+        'margin_pct': _money(o.line_margin_pct),
+        'running_margin': _money(o.running_margin),
+        'running_revenue': _money(o.running_revenue),
+    }
+
+
+def _items_limit(params):
+    """Líneas por licitación pedidas con `items_limit`; None (todas) si falta."""
+    try:
+        return max(1, min(int(params['items_limit']), TENDER_MAX_PAGE_SIZE))
+    except (KeyError, ValueError):
+        return None
+
+
+def _items_window(params):
+    """`(inicio, límite)` de las líneas pedidas con `items_cursor`/`items_limit`.
+
+    El cursor es la posición de la última línea recibida; lanza
+    `InvalidCursor` si no es válido.
     """
-    # Anotar margen total para poder filtrar por él eficientemente
-    # Evitar errores por mezcla de tipos: declarar DecimalField explícito y
-    # castear quantity al mismo tipo antes de multiplicar.
-    dec_field = DecimalField(max_digits=18, decimal_places=2)
-    margin_expr = ExpressionWrapper(
-        (F('orders__unit_price') - F('orders__unit_cost')) * Cast(F('orders__quantity'), output_field=dec_field),
-        output_field=dec_field,
+    cursor = params.get('items_cursor', '')
+    if cursor and not cursor.isdigit():
+        raise InvalidCursor(cursor)
+    return int(cursor or 0), _items_limit(params)
+
+
+def _detail_lines(tender_ids, start=0, limit=None):
+    """Líneas de `tender_ids` con producto, márgenes y acumulados (una consulta).
+
+    `start`/`limit` recortan las líneas de cada licitación por posición.
+    """
+    orders = (
+        Order.objects.filter(tender_id__in=tender_ids).with_line_margins()
+        .select_related('product').order_by('tender_id', 'id')
     )
-    tenders = Tender.objects.all().annotate(total_margin=Coalesce(Sum(margin_expr), Value(0, output_field=dec_field), output_field=dec_field)).order_by('-awarded_date')
+    if start:
+        orders = orders.filter(line_number__gt=start)
+    if limit:
+        orders = orders.filter(line_number__lte=start + limit)
+    return orders
+
+
+def _tender_detail_row(tender, lines, limit=None):
+    row = {
+        'identifier': tender.identifier,
+        'client': tender.client_obj.name if tender.client_obj else '',
+        'awarded_date': tender.awarded_date.isoformat(),
+        'total_margin': _money(tender.total_margin),
+        'items': [_order_row(o) for o in lines],
+    }
+    if limit:
+        row['items_next_cursor'] = _next_items_cursor(tender, lines)
+    return row
 
-    # Búsqueda por query 'q' en identificador o cliente
-    q = request.GET.get('q', '').strip()
+
+def _next_items_cursor(tender, lines):
+    last = lines[-1].line_number if lines else None
+    return str(last) if last is not None and last < tender.order_count else None
+
+
+def _group_lines(lines):
+    by_tender = {}
+    for line in lines:
+        by_tender.setdefault(line.tender_id, []).append(line)
+    return by_tender
+
+
+def _batch_identifiers(params):
+    """Identificadores de `?ids=A,B` (o `ids` repetido), sin duplicados y en orden."""
+    ids = []
+    for value in params.getlist('ids'):
+        ids += [i.strip() for i in value.split(',') if i.strip()]
+    return list(dict.fromkeys(ids))
+
+
+def filter_tenders(params):
+    """Queryset de licitaciones con los filtros de `tender_list` aplicados.
+
+    `params` es un dict-like (p.ej. `request.GET`). Se comparte con las
+    demás vistas/herramientas que deben respetar los mismos filtros.
+    """
+    # El margen total está almacenado en `Tender.total_margin` (indexado),
+    # así que filtrar por él no requiere agrupar las órdenes.
+    tenders = Tender.objects.all().select_related('client_obj').order_by('-awarded_date')
+
+    # Búsqueda por query 'q' en identificador o cliente (índice de texto)
+    q = params.get('q', '').strip()
     if q:
-        tenders = tenders.filter(Q(identifier__icontains=q) | Q(client__icontains=q))
+        tenders = filter_tenders_by_text(tenders, q)
 
     # Filtros: cliente exacto/contains, rango de fechas, margen min/max
-    client_filter = request.GET.get('client', '').strip()
+    client_filter = params.get('client', '').strip()
     if client_filter:
-        tenders = tenders.filter(client__icontains=client_filter)
+        tenders = tenders.filter(client_obj__name__icontains=client_filter)
 
-    start_date = request.GET.get('start_date', '').strip()
+    start_date = params.get('start_date', '').strip()
     if start_date:
         tenders = tenders.filter(awarded_date__gte=start_date)
 
-    end_date = request.GET.get('end_date', '').strip()
+    end_date = params.get('end_date', '').strip()
     if end_date:
         tenders = tenders.filter(awarded_date__lte=end_date)
 
-    min_margin = request.GET.get('min_margin', '').strip()
+    min_margin = params.get('min_margin', '').strip()
     if min_margin:
         try:
             minm = Decimal(min_margin)
@@ -60,7 +238,7 @@ def tender_list(request):
         except Exception:
             pass
 
-    max_margin = request.GET.get('max_margin', '').strip()
+    max_margin = params.get('max_margin', '').strip()
     if max_margin:
         try:
             maxm = Decimal(max_margin)
@@ -68,41 +246,121 @@ def tender_list(request):
         except Exception:
             pass
 
-    # Si la petición es para la API, mantenemos la respuesta JSON existente
-    if request.path.startswith('/api/') or request.headers.get('Accept', '').find('application/json') != -1:
-        data = []
-        for t in tenders:
-            data.append({
-                'identifier': t.identifier,
-                'client': t.client,
-                'awarded_date': t.awarded_date.isoformat(),
-                'total_margin': str(t.total_margin() or Decimal('0')),
-            })
-        return JsonResponse(data, safe=False)
-
-    # Paginación para la vista HTML
-    page = request.GET.get('page', 1)
-    paginator = Paginator(tenders, 10)  # 10 por página
+    return tenders
+
+
+def _ranked(request, q):
+    """Con `q` los resultados van por relevancia salvo `sort=date`."""
+    return bool(q) and request.GET.get('sort') != 'date'
+
+
+def _tender_page(request, tenders, q, cursor, page_size):
+    """Página del listado: por relevancia con `q` (cursor de desplazamiento,
+    la relevancia no es paginable por fecha) o por fecha (keyset).
+    """
+    if _ranked(request, q):
+        return paginate_ranked(tenders, q, cursor, page_size)
+    return paginate_keyset(tenders, cursor, page_size)
+
+
+@cache_response('tender_list', lambda request: ['tenders'])
+def tender_list(request):
+    """Devuelve una lista de licitaciones con margen total.
+
+    Soporta respuesta JSON en rutas `api/` (existente) y renderizado HTML
+    para la vista pública. Si la petición pide JSON (por cabecera
+    `Accept: application/json` o la ruta contiene `/api/`), devuelve JSON,
+    en otro caso renderiza la plantilla `licitaciones/tender_list.html`.
+    """
+    tenders = filter_tenders(request.GET)
+    q = request.GET.get('q', '').strip()
+
+    # Si la petición es para la API, mantenemos la respuesta JSON existente.
+    # Una sola consulta que sólo trae las columnas que se devuelven.
+    if _wants_json(request):
+        rows = _tender_values(tenders)
+
+        # Exportación completa: se escribe a medida que se leen las filas
+        # del cursor del servidor, sin construir la lista en memoria.
+        if request.GET.get('stream') in ('1', 'true'):
+            rows = rows.order_by('-awarded_date', '-id').iterator(chunk_size=STREAM_CHUNK_SIZE)
+            return StreamingHttpResponse(_stream_json_array(rows), content_type='application/json')
+
+        try:
+            page = _tender_page(request, rows, q, request.GET.get('cursor'), _page_size(request, TENDER_API_PAGE_SIZE))
+        except InvalidCursor:
+            return HttpResponseBadRequest('Cursor inválido.')
+        return _tender_page_response(request, page)
+
+    # Paginación por cursor para la vista HTML (sin COUNT ni OFFSET)
+    page_size = _page_size(request, TENDER_HTML_PAGE_SIZE)
     try:
-        tenders_page = paginator.page(page)
-    except PageNotAnInteger:
-        tenders_page = paginator.page(1)
-    except EmptyPage:
-        tenders_page = paginator.page(paginator.num_pages)
+        tenders_page = _tender_page(request, tenders, q, request.GET.get('cursor'), page_size)
+    except InvalidCursor:
+        tenders_page = _tender_page(request, tenders, q, None, page_size)
 
     context = {
         'tenders': tenders_page,
-        'paginator': paginator,
         'q': q,
     }
     return render(request, 'licitaciones/tender_list.html', context)
 
 
+@statement_timeout(EXPORT_STATEMENT_TIMEOUT_MS)
+def tender_export_csv(request):
+    """CSV de licitaciones y sus órdenes con los filtros de `tender_list`.
+
+    Se genera mientras se leen las filas (cursor del servidor), sin
+    materializar el resultado; no pasa por la caché de respuestas.
+    """
+    rows = export_rows(filter_tenders(request.GET))
+    response = StreamingHttpResponse(iter_csv(rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="licitaciones.csv"'
+    return response
+
+
+def _client_ordering(sort):
+    """`(sort, order_by)` del listado de clientes; por defecto los más recientes.
+
+    Los clientes sin licitaciones no tienen `ClientSummary`: se ordenan
+    como si sus totales fueran cero.
+    """
+    key = sort.lstrip('-')
+    if key not in CLIENT_SORTS:
+        sort, key = '-created', 'created'
+    field = F(CLIENT_SORTS[key][0])
+    if sort.startswith('-'):
+        return sort, [field.desc(nulls_last=True), '-pk']
+    return sort, [field.asc(nulls_first=True), 'pk']
+
+
+def _client_columns(sort):
+    """Cabeceras del listado: `sort` que ordena por cada columna (o la invierte)."""
+    columns = []
+    for key, (_, label, descending) in CLIENT_SORTS.items():
+        if sort.lstrip('-') == key:
+            target = key if sort.startswith('-') else f'-{key}'
+            arrow = '▼' if sort.startswith('-') else '▲'
+        else:
+            target = f'-{key}' if descending else key
+            arrow = ''
+        columns.append({'label': label, 'sort': target, 'arrow': arrow})
+    return columns
+
+
 def client_list(request):
-    clients = Client.objects.all().order_by('-created_at')
+    """Clientes con sus totales (`ClientSummary`), ordenables por cualquiera.
+
+    Una consulta por página además del `COUNT`: los totales ya están
+    agregados. Con `q` se ordena por relevancia salvo que se pida `sort`.
+    """
+    sort, ordering = _client_ordering(request.GET.get('sort', ''))
+    clients = Client.objects.select_related('summary').order_by(*ordering)
     q = request.GET.get('q', '').strip()
     if q:
-        clients = clients.filter(name__icontains=q)
+        clients = search_clients(clients, q)
+        if 'sort' in request.GET:
+            clients = clients.order_by(*ordering)
     page = request.GET.get('page', 1)
     paginator = Paginator(clients, 20)
     try:
@@ -112,7 +370,14 @@ def client_list(request):
     except EmptyPage:
         clients_page = paginator.page(paginator.num_pages)
 
-    return render(request, 'licitaciones/client_list.html', {'clients': clients_page, 'paginator': paginator, 'q': q})
+    context = {
+        'clients': clients_page,
+        'paginator': paginator,
+        'q': q,
+        'sort': sort,
+        'columns': _client_columns(sort),
+    }
+    return render(request, 'licitaciones/client_list.html', context)
 
 
 def client_create(request):
@@ -126,51 +391,268 @@ def client_create(request):
     return render(request, 'licitaciones/client_form.html', {'form': form})
 
 
+def _client_summary(client):
+    """Totales del cliente cargado con `select_related('summary')` (a cero si no tiene licitaciones)."""
+    try:
+        return client.summary
+    except ClientSummary.DoesNotExist:
+        return ClientSummary(client=client)
+
+
+def _client_tenders(client):
+    # `client_obj` incluido: el related manager asigna el cliente a cada fila.
+    return client.tenders.only('id', 'identifier', 'client_obj', 'awarded_date', 'total_margin', 'total_revenue', 'order_count')
+
+
+@cache_response('client_detail', lambda request, pk: [f'client:{pk}'])
 def client_detail(request, pk):
-    client = get_object_or_404(Client, pk=pk)
-    tenders = client.tenders.order_by('-awarded_date').all()
-    return render(request, 'licitaciones/client_detail.html', {'client': client, 'tenders': tenders})
+    """Ficha del cliente: sus totales y sus licitaciones por páginas.
+
+    Dos consultas sea cual sea el número de licitaciones: el cliente con
+    su `ClientSummary` y una página de `CLIENT_TENDERS_PAGE_SIZE`
+    licitaciones por cursor (`?cursor=`), con los márgenes que ya guarda
+    cada licitación.
+    """
+    client = get_object_or_404(Client.objects.select_related('summary'), pk=pk)
+    tenders = _client_tenders(client)
+    try:
+        page = paginate_keyset(tenders, request.GET.get('cursor'), CLIENT_TENDERS_PAGE_SIZE)
+    except InvalidCursor:
+        page = paginate_keyset(tenders, None, CLIENT_TENDERS_PAGE_SIZE)
+    return render(request, 'licitaciones/client_detail.html', {
+        'client': client,
+        'summary': _client_summary(client),
+        'tenders': page,
+    })
 
 
+def _tender_scopes(identifiers):
+    """Ámbitos de caché de las licitaciones pedidas (por clave normalizada)."""
+    return [f'tender:{normalize_identifier(i)}' for i in identifiers]
+
+
+@cache_response('tender_detail', lambda request, identifier: _tender_scopes([identifier]))
 def tender_detail(request, identifier):
     """Detalle de una licitación con productos adjudicados y margen por item.
 
     Igual que `tender_list`, soporta JSON para la API existente y HTML para
     la vista pública en la plantilla `licitaciones/tender_detail.html`.
+
+    `identifier` se resuelve con o sin guiones (ver `identifiers`). Dos
+    consultas: la licitación con su cliente y las líneas con margen,
+    margen % y acumulados calculados en SQL. En licitaciones grandes
+    `?items_limit=N` devuelve las N primeras líneas e `items_next_cursor`,
+    que se pasa como `?items_cursor=` para las siguientes.
     """
-    tender = get_object_or_404(Tender, identifier=identifier)
-    orders = tender.orders.select_related('product').all()
-
-    # Si la petición es para la API existente, devolvemos JSON igual que antes
-    if request.path.startswith('/api/') or request.headers.get('Accept', '').find('application/json') != -1:
-        items = []
-        for o in orders:
-            items.append({
-                'product_sku': o.product.sku,
-                'product_name': o.product.name,
-                'quantity': o.quantity,
-                'unit_price': str(o.unit_price),
-                'unit_cost': str(o.unit_cost),
-                'margin': str(o.margin()),
-            })
-
-        resp = {
-            'identifier': tender.identifier,
-            'client': tender.client,
-            'awarded_date': tender.awarded_date.isoformat(),
-            'total_margin': str(tender.total_margin() or Decimal('0')),
-            'items': items,
-        }
-        return JsonResponse(resp)
-
-    # Render para la vista HTML
+    tender = identifiers.get_tender(identifier, Tender.objects.select_related('client_obj'))
+    if tender is None:
+        raise Http404('No existe la licitación.')
+    try:
+        start, limit = _items_window(request.GET)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Cursor inválido.')
+    orders = list(_detail_lines([tender.pk], start, limit))
+
+    if _wants_json(request):
+        return JsonResponse(_tender_detail_row(tender, orders, limit))
+
     context = {
         'tender': tender,
         'orders': orders,
+        'items_limit': limit,
+        'next_cursor': _next_items_cursor(tender, orders) if limit else None,
     }
     return render(request, 'licitaciones/tender_detail.html', context)
 
 
+@cache_response('tender_batch', lambda request: _tender_scopes(_batch_identifiers(request.GET)))
+def tender_batch(request):
+    """Detalle de varias licitaciones en una petición: `?ids=A-1,B-2`.
+
+    ``{'tenders': [...], 'missing': [...]}`` con el mismo formato que
+    `tender_detail`, en el orden pedido. Dos consultas en total sea cual
+    sea el número de licitaciones (como mucho `TENDER_BATCH_MAX`);
+    `items_limit` se aplica a cada una y el resto de líneas se pide a
+    `tender_detail` con su `items_next_cursor`.
+    """
+    ids = _batch_identifiers(request.GET)
+    if not ids:
+        return HttpResponseBadRequest('Falta ids.')
+    if len(ids) > TENDER_BATCH_MAX:
+        return HttpResponseBadRequest(f'Como mucho {TENDER_BATCH_MAX} licitaciones por petición.')
+    limit = _items_limit(request.GET)
+    tenders = identifiers.get_tenders(ids, Tender.objects.select_related('client_obj'))
+    lines = _group_lines(_detail_lines([t.pk for t in tenders.values()], limit=limit))
+    return JsonResponse({
+        'tenders': [_tender_detail_row(tenders[i], lines.get(tenders[i].pk, []), limit) for i in ids if i in tenders],
+        'missing': [i for i in ids if i not in tenders],
+    })
+
+
+# Agrupaciones de `margin_analytics`: pares (clave de salida, columna).
+# El trimestre se agrupa por mes en SQL y se pliega después (≤ 3 filas).
+ANALYTICS_GROUPS = {
+    'client': (('client_id', 'client_id'), ('client_name', 'client__name')),
+    'product': (('product_sku', 'product__sku'), ('product_name', 'product__name')),
+    'month': (('month', 'month'),),
+    'quarter': (('quarter', 'month'),),
+}
+
+
+def _analytics_value(key, value):
+    if key == 'month':
+        return value.strftime('%Y-%m')
+    if key == 'quarter':
+        return f'{value.year}-Q{(value.month - 1) // 3 + 1}'
+    return value
+
+
+@cache_response('margin_analytics', lambda request: ['tenders'])
+@statement_timeout(ANALYTICS_STATEMENT_TIMEOUT_MS)
+def margin_analytics(request):
+    """Margen, ingresos y cantidades agregados desde `MarginRollup`.
+
+    Parámetros: `group_by` (lista separada por comas de client, product,
+    month, quarter; por defecto month), `start_date`/`end_date` (fecha de
+    adjudicación, ISO), `client` (id) y `product` (sku).
+    """
+    group_by = [g.strip() for g in request.GET.get('group_by', 'month').split(',') if g.strip()]
+    unknown = [g for g in group_by if g not in ANALYTICS_GROUPS]
+    if unknown:
+        return HttpResponseBadRequest(f'group_by no soportado: {", ".join(unknown)}')
+
+    rollups = MarginRollup.objects.all()
+    try:
+        if request.GET.get('start_date'):
+            rollups = rollups.filter(day__gte=datetime.date.fromisoformat(request.GET['start_date']))
+        if request.GET.get('end_date'):
+            rollups = rollups.filter(day__lte=datetime.date.fromisoformat(request.GET['end_date']))
+        if request.GET.get('client'):
+            rollups = rollups.filter(client_id=int(request.GET['client']))
+    except ValueError:
+        return HttpResponseBadRequest('Fecha o cliente inválido.')
+    if request.GET.get('product'):
+        rollups = rollups.filter(product__sku=request.GET['product'])
+
+    columns = [column for group in group_by for column in ANALYTICS_GROUPS[group]]
+    sql_fields = list(dict.fromkeys(source for _, source in columns))
+    rows = rollups.values(*sql_fields).annotate(
+        total_margin=Sum('margin'),
+        total_revenue=Sum('revenue'),
+        total_quantity=Sum('quantity'),
+        orders=Sum('order_count'),
+    ).order_by(*sql_fields)
+
+    totals = {}
+    for r in rows:
+        key = tuple(_analytics_value(out, r[source]) for out, source in columns)
+        acc = totals.setdefault(key, [Decimal(0), Decimal(0), 0, 0])
+        acc[0] += Decimal(r['total_margin'] or 0)
+        acc[1] += Decimal(r['total_revenue'] or 0)
+        acc[2] += r['total_quantity'] or 0
+        acc[3] += r['orders'] or 0
+
+    results = []
+    for key in sorted(totals, key=lambda k: [(v is None, v) for v in k]):
+        margin, revenue, quantity, count = totals[key]
+        item = dict(zip((out for out, _ in columns), key))
+        item.update({'margin': _money(margin), 'revenue': _money(revenue), 'quantity': quantity, 'order_count': count})
+        results.append(item)
+    return JsonResponse({'group_by': group_by, 'results': results})
+
+
+def cache_stats_view(request):
+    """Aciertos/fallos de la caché de respuestas (por proceso)."""
+    return JsonResponse(cache_stats())
+
+
+def lookup_autocomplete(request, kind):
+    """Opciones de clientes o productos cuyo nombre (o SKU) empieza por `q`.
+
+    ``{'results': [{'id', 'label'}]}``, como mucho `limit` (por defecto
+    `AUTOCOMPLETE_LIMIT`). Sale de la tabla en memoria de `lookups`.
+    """
+    if kind not in lookups.KINDS:
+        raise Http404('Tipo desconocido.')
+    try:
+        limit = min(max(int(request.GET.get('limit', lookups.AUTOCOMPLETE_LIMIT)), 1), lookups.AUTOCOMPLETE_MAX_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest('limit debe ser un entero.')
+    results = lookups.table(kind).search(request.GET.get('q', ''), limit)
+    return JsonResponse({'results': [{'id': pk, 'label': label} for pk, label in results]})
+
+
+def metrics_view(request):
+    """Métricas de la aplicación y del importador en formato Prometheus.
+
+    Para el recolector, `Authorization: Bearer <METRICS_TOKEN>`; sin token
+    sólo las ve el staff con sesión (sin `METRICS_TOKEN` configurado, sólo
+    el staff).
+    """
+    if not (request.user.is_active and request.user.is_staff):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if not token:
+            return HttpResponse('Métricas sólo para staff: falta METRICS_TOKEN.', status=403, content_type='text/plain')
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse('Token inválido.', status=401, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def perf_debug(request):
+    """Peticiones medidas por `PerfMiddleware` en este proceso (sólo staff).
+
+    `?view=<nombre de ruta>` filtra por vista y `?limit=N` limita las
+    entradas devueltas (el resumen usa todas las del buffer).
+    """
+    entries = instrumentation.recent()
+    view = request.GET.get('view')
+    if view:
+        entries = [e for e in entries if e['view'] == view]
+    try:
+        limit = max(int(request.GET.get('limit', 100)), 0)
+    except ValueError:
+        return HttpResponseBadRequest('limit debe ser un entero.')
+    return JsonResponse({
+        'sample_rate': instrumentation.PERF_SAMPLE_RATE,
+        'summary': instrumentation.summary(entries),
+        'requests': entries[:limit],
+    })
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+@statement_timeout(BULK_STATEMENT_TIMEOUT_MS)
+def tender_bulk(request):
+    """Ingesta masiva de licitaciones con sus órdenes anidadas.
+
+    El cuerpo es un array JSON o NDJSON de objetos ``{identifier, client,
+    awarded_date, orders: [{product_sku, quantity, unit_price?,
+    unit_cost?}]}`` y se lee en streaming. Es idempotente por
+    `normalized_identifier` (ver `BulkImporter.import_tender_documents`).
+    Responde ``{'summary': {...}, 'results': [...]}`` con un resultado por
+    registro; si el cuerpo no es JSON válido, 400 con los ya procesados.
+
+    Exige `Authorization: Bearer <TENDER_BULK_TOKEN>`; sin token configurado
+    la ingesta está desactivada (403).
+    """
+    token = getattr(settings, 'TENDER_BULK_TOKEN', '')
+    if not token:
+        return JsonResponse({'error': 'Ingesta desactivada: falta TENDER_BULK_TOKEN.'}, status=403)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return JsonResponse({'error': 'Token inválido.'}, status=401)
+
+    importer = BulkImporter(batch_size=TENDER_BULK_BATCH_SIZE, incremental=True)
+    results = []
+    try:
+        for result in importer.import_tender_documents(iter_json_records(request)):
+            results.append(result)
+    except ValueError as exc:
+        return JsonResponse({'error': f'JSON inválido: {exc}', 'results': results}, status=400)
+    counts = Counter(r['status'] for r in results)
+    return JsonResponse({'summary': {s: counts[s] for s in BULK_STATUSES}, 'results': results})
+
+
 @require_http_methods(['GET', 'POST'])
 def tender_create(request):
     """Formulario para crear una Tender con sus Orders inline."""
@@ -181,18 +663,17 @@ def tender_create(request):
             tender = form.save(commit=False)
             formset = OrderFormSet(request.POST, instance=tender)
             if formset.is_valid():
-                # Requerir al menos una orden no marcada para eliminar
-                orders_count = 0
-                for fdata in formset.cleaned_data:
-                    if fdata and not fdata.get('DELETE', False):
-                        orders_count += 1
-
-                if orders_count == 0:
-                    form.add_error(None, 'Debe incluir al menos una orden para la licitación.')
+                # Licitación y órdenes validadas en lote y guardadas juntas.
+                try:
+                    Tender.objects.save_with_orders(tender, formset.save(commit=False))
+                except ValidationError as e:
+                    form.add_error(None, e.messages)
                 else:
-                    tender.save()
-                    formset.save()
                     return redirect('tender_detail_html', identifier=tender.identifier)
+            else:
+                # "Al menos una orden" se valida en el formset.
+                for error in formset.non_form_errors():
+                    form.add_error(None, error)
         else:
             formset = OrderFormSet(request.POST)
     else: